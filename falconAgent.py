@@ -0,0 +1,316 @@
+# falconAgent.py
+#
+# Remote agent for driving falconCommand on other machines.
+#
+# The agent wraps an AutoGUIController and listens on TCP. Requests and
+# responses are single JSON objects per line:
+#
+#   -> {"id": 1, "token": "...", "commands": [["--click", "100", "200"], ["--press", "enter"]]}
+#   <- {"id": 1, "results": [{"code": 0, "output": "Clicked at position (100, 200)\n"}, ...]}
+#
+# A request carries a whole batch of commands, so the network round trip is
+# paid once per batch instead of once per command. Connections are kept
+# open between requests; FalconAgentPool keeps them around on the client side.
+import argparse
+import hmac
+import io
+import json
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from falconCommand import AutoGUIController, capture_thread_output
+
+DEFAULT_PORT = 8765
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        agent = self.server.agent
+        # One connection serves many requests until the client closes it
+        for raw_line in self.rfile:
+            if not raw_line.strip():
+                continue
+            try:
+                request = json.loads(raw_line.decode("utf-8"))
+                response = agent.handle_request(request)
+            except Exception as e:
+                response = {"id": None, "error": f"[Error] {str(e)}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class _AgentServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FalconAgent:
+    """
+    TCP agent that executes falconCommand commands on this machine
+
+    :param controller: AutoGUIController to drive (created on demand if None)
+    :param host: Interface to listen on (default: localhost only)
+    :param port: Port to listen on (0 picks a free port)
+    :param token: Optional shared secret that every request must carry
+    """
+
+    def __init__(self, controller=None, host="127.0.0.1", port=DEFAULT_PORT, token=None):
+        if controller is None:
+            controller = AutoGUIController()
+        self.controller = controller
+        # Capture source the agent was started with (e.g. its --replay-frames);
+        # reset_run_state() drops the controller's, every request gets it back
+        self.screen_source = controller.screen_source
+        self.token = token
+        # The desktop is a single shared resource, commands never run concurrently
+        self._lock = threading.Lock()
+        self.server = _AgentServer((host, port), _AgentRequestHandler)
+        self.server.agent = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def handle_request(self, request):
+        request_id = request.get("id")
+        if self.token is not None and not hmac.compare_digest(
+            str(request.get("token", "")), self.token
+        ):
+            return {"id": request_id, "error": "[Error] Invalid agent token"}
+
+        if request.get("op") == "ping":
+            return {"id": request_id, "version": self.controller.version}
+
+        commands = request.get("commands") or []
+        stop_on_error = request.get("stop_on_error", False)
+        results = []
+        with self._lock:
+            try:
+                for command in commands:
+                    result = self.execute(command)
+                    results.append(result)
+                    if result["code"] != 0 and stop_on_error:
+                        break
+            finally:
+                # Flags of this request (--replay-frames, --overlay ...) must not
+                # stay active for the next client
+                try:
+                    self.controller.reset_run_state()
+                except Exception as e:
+                    print(f"[Warning] Could not reset agent state: {str(e)}")
+                self.controller.screen_source = self.screen_source
+        return {"id": request_id, "results": results}
+
+    def execute(self, command):
+        """Run one argument list on the controller and capture its output"""
+        output = io.StringIO()
+        controller = self.controller
+        # Reuse the command-file flag so every command doesn't write its own log file
+        controller._running_from_command_file = True
+        try:
+            with capture_thread_output(output):
+                code = controller.run([str(arg) for arg in command])
+        except SystemExit as e:
+            # argparse reports bad arguments through sys.exit
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            output.write(f"[Error] {str(e)}\n")
+            code = 1
+        finally:
+            controller._running_from_command_file = False
+        return {"code": code or 0, "output": output.getvalue()}
+
+    def start(self):
+        """Serve in a background thread and return immediately"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        print(f"Falcon agent listening on {self.address[0]}:{self.address[1]}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FalconAgentConnection:
+    """A persistent connection to one agent"""
+
+    def __init__(self, host, port, token=None, timeout=None):
+        self.address = (host, port)
+        self.token = token
+        self.sock = socket.create_connection(self.address, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        self._next_id = 0
+
+    def request(self, payload):
+        self._next_id += 1
+        payload = dict(payload, id=self._next_id)
+        if self.token is not None:
+            payload["token"] = self.token
+        self.sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError(f"Agent {self.address[0]}:{self.address[1]} closed the connection")
+        response = json.loads(line.decode("utf-8"))
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class FalconAgentPool:
+    """
+    Client side pool of persistent agent connections
+
+    Connections are reused across calls, so a command only costs one request
+    round trip on an already open socket.
+
+    :param token: Shared secret passed to every agent
+    :param max_idle: Maximum idle connections kept per agent
+    :param timeout: Socket timeout in seconds (None = wait forever)
+    """
+
+    def __init__(self, token=None, max_idle=4, timeout=None):
+        self.token = token
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(address):
+        if isinstance(address, str):
+            host, _, port = address.rpartition(":")
+            return host, int(port)
+        return address[0], int(address[1])
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        return FalconAgentConnection(key[0], key[1], self.token, self.timeout)
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, address, payload):
+        key = self._key(address)
+        connection = self._acquire(key)
+        try:
+            response = connection.request(payload)
+        except Exception:
+            # Never hand a broken socket back to the pool
+            connection.close()
+            raise
+        self._release(key, connection)
+        return response
+
+    def ping(self, address):
+        """Return the falconCommand version of the agent"""
+        return self._request(address, {"op": "ping"})["version"]
+
+    def batch(self, address, commands, stop_on_error=False):
+        """
+        Run a list of commands on one agent in a single round trip
+
+        :param address: "host:port" or (host, port)
+        :param commands: List of argument lists, e.g. [["--click", 10, 20], ["--press", "enter"]]
+        :return: List of {"code": int, "output": str} dictionaries
+        """
+        payload = {
+            "commands": [[str(arg) for arg in command] for command in commands],
+            "stop_on_error": stop_on_error,
+        }
+        return self._request(address, payload)["results"]
+
+    def run(self, address, *command):
+        """Run a single command on one agent and return its result dictionary"""
+        return self.batch(address, [command])[0]
+
+    def broadcast(self, addresses, commands, stop_on_error=False):
+        """
+        Run the same batch on many agents in parallel
+
+        :return: Dictionary of address -> list of results (or the raised exception)
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(addresses))) as executor:
+            futures = {
+                address: executor.submit(self.batch, address, commands, stop_on_error)
+                for address in addresses
+            }
+            for address, future in futures.items():
+                try:
+                    results[address] = future.result()
+                except Exception as e:
+                    results[address] = e
+        return results
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Falcon UI remote agent")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--token", help="Shared secret required from clients")
+    parser.add_argument(
+        "--replay-frames",
+        metavar="PATH",
+        help="Replay screen captures from an image file or folder instead of the live desktop",
+    )
+    args = parser.parse_args()
+
+    controller = AutoGUIController()
+    if args.replay_frames:
+        from falconCapture import FileReplayScreenSource
+
+        controller.screen_source = FileReplayScreenSource(args.replay_frames)
+
+    agent = FalconAgent(controller, host=args.host, port=args.port, token=args.token)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        print("\nAgent stopped.")
+    finally:
+        agent.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
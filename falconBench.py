@@ -0,0 +1,571 @@
+# falconBench.py
+#
+# Benchmarks for the Falcon UI tools.
+#
+# Usage:
+#   python falconBench.py tokenizer [--lines 100000]
+#   python falconBench.py startup [--runs 5] [--budget-ms 200]
+#   python falconBench.py diagnostics LOOKUPS.jsonl|LOOKUPS.npz
+#   python falconBench.py fft [--frame SCREENSHOT.png] [--repeat 3]
+#   python falconBench.py scales [--corpus DIR] [--cases 6] [--step 0.02]
+#   python falconBench.py pool [--workers 4] [--cases 6] [--repeat 3]
+import argparse
+import io
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Commands that must start without loading the vision stack
+STARTUP_COMMANDS = [
+    ["--sleep", "0"],
+    ["--position"],
+    ["--check-software", "falconBench-not-running"],
+]
+
+
+def _legacy_tokenize(line):
+    """The per-character splitter execute_command_file used before falconScript"""
+    parts = []
+    current_part = ""
+    in_quotes = False
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == "\\" and i + 1 < len(line) and line[i + 1] == '"':
+            current_part += '"'
+            i += 2
+            continue
+        if char == '"':
+            in_quotes = not in_quotes
+            i += 1
+            continue
+        if char == " " and not in_quotes:
+            if current_part:
+                parts.append(current_part)
+                current_part = ""
+            i += 1
+            continue
+        current_part += char
+        i += 1
+    if current_part:
+        parts.append(current_part)
+    return parts
+
+
+# falconScript's first token regex: quoted sections were matched one character at a time
+_PER_CHARACTER_TOKEN_RE = re.compile(r'(?:[^\s"\\]+|\\"|\\|"(?:[^"\\]|\\"|\\)*(?:"|$))+')
+_PER_CHARACTER_QUOTE_RE = re.compile(r'\\"|"')
+
+
+def _per_character_tokenize(line):
+    """tokenize_line as first shipped with falconScript"""
+    return [
+        raw if '"' not in raw else _PER_CHARACTER_QUOTE_RE.sub(lambda m: '"' if m.group() == '\\"' else "", raw)
+        for raw in _PER_CHARACTER_TOKEN_RE.findall(line)
+    ]
+
+
+def _sample_script(line_count):
+    templates = [
+        "--click 100 200",
+        '--type "Hello World, this is a longer line of text"',
+        '--click-image "C:\\Falcon\\images\\OK Button.png" --timeout 10',
+        "# comment line",
+        "--press ctrl+s",
+        '--launch "C:\\Program Files\\Falcon\\falcon.exe"',
+        "--sleep 0.5",
+        '--type "quote \\"inside\\" text"',
+    ]
+    return [templates[i % len(templates)] for i in range(line_count)]
+
+
+def _best_of(repeats, func):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_tokenizer(args):
+    from falconScript import parse_lines, tokenize_line
+
+    lines = _sample_script(args.lines)
+    executable = [line for line in lines if not line.startswith("#")]
+
+    # Both tokenizers must agree on the sample before timing them
+    for line in executable:
+        if not tokenize_line(line) == _legacy_tokenize(line) == _per_character_tokenize(line):
+            print(f"[X] Tokenizer mismatch on: {line}")
+            return 1
+
+    legacy = _best_of(args.repeat, lambda: [_legacy_tokenize(line) for line in executable])
+    per_character = _best_of(args.repeat, lambda: [_per_character_tokenize(line) for line in executable])
+    current = _best_of(args.repeat, lambda: [tokenize_line(line) for line in executable])
+    shared = _best_of(args.repeat, lambda: parse_lines(lines))
+    token_count = sum(len(tokenize_line(line)) for line in executable)
+
+    print(f"Tokenizer benchmark: {args.lines} lines, {token_count} tokens (best of {args.repeat})")
+    print(f"  legacy per-character loop : {legacy * 1000:9.1f} ms")
+    print(f"  per-character quote regex : {per_character * 1000:9.1f} ms  ({legacy / per_character:.1f}x faster)")
+    print(f"  falconScript.tokenize_line: {current * 1000:9.1f} ms  ({legacy / current:.1f}x faster)")
+    print(f"  falconScript.parse_lines  : {shared * 1000:9.1f} ms  ({legacy / shared:.1f}x faster)")
+    return 0
+
+
+def _importtime(module):
+    """Parse `python -X importtime -c "import module"` into (cumulative_us, self_us, name) rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def bench_startup(args):
+    rows = _importtime("falconCommand")
+    if not rows:
+        print("[X] Could not measure import time of falconCommand")
+        return 1
+    total_ms = rows[-1][0] / 1000
+    print(f"import falconCommand: {total_ms:.1f} ms, top {args.top} imports by cumulative time:")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+
+    heavy = [name.strip() for _, _, name in rows if name.strip() in ("cv2", "numpy", "pyautogui", "PIL")]
+    if heavy:
+        print(f"[Warning] Imported at start-up: {', '.join(heavy)}")
+
+    script = os.path.join(HERE, "falconCommand.py")
+    failed = False
+    print(f"\nWall-clock start-up, median of {args.runs} runs (budget {args.budget_ms:.0f} ms):")
+    for command in STARTUP_COMMANDS:
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script] + command, cwd=HERE, capture_output=True)
+            samples.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(samples)
+        status = "[V]" if median < args.budget_ms else "[X]"
+        failed = failed or median >= args.budget_ms
+        print(f"  {status} {median:7.1f} ms  falconCommand {' '.join(command)}")
+    return 1 if failed else 0
+
+
+def _load_diagnostics(path):
+    """Lookups of a --diagnostics file as (found, total_ms, best confidence, {phase: ms}) tuples"""
+    if path.lower().endswith(".npz"):
+        import numpy as np
+
+        data = np.load(path)
+        best = {}
+        for lookup_id, confidence in zip(data["scale_lookup_id"], data["confidence"]):
+            best[int(lookup_id)] = max(best.get(int(lookup_id), 0.0), float(confidence))
+        phase_names = [str(name) for name in data["phase_names"]]
+        return [
+            (bool(found), float(total), best.get(int(lookup_id), 0.0),
+             dict(zip(phase_names, (float(ms) for ms in phase_ms))))
+            for lookup_id, found, total, phase_ms in zip(
+                data["lookup_id"], data["found"], data["total_ms"], data["phase_ms"]
+            )
+        ]
+
+    import json
+
+    lookups = []
+    with open(path, encoding="utf-8") as diagnostics_file:
+        for line in diagnostics_file:
+            if line.strip():
+                record = json.loads(line)
+                lookups.append((
+                    record["found"], record["total_ms"],
+                    record.get("best", {}).get("confidence", 0.0), record["phases_ms"],
+                ))
+    return lookups
+
+
+def bench_diagnostics(args):
+    from falconMatch import PHASES
+
+    lookups = _load_diagnostics(args.path)
+    if not lookups:
+        print(f"[X] No lookups in {args.path}")
+        return 1
+
+    totals = sorted(total for _, total, _, _ in lookups)
+    found = [best for hit, _, best, _ in lookups if hit]
+    missed = [best for hit, _, best, _ in lookups if not hit]
+    print(f"{len(lookups)} lookups, {len(found)} found, {len(missed)} missed")
+    print(f"  time per lookup: median {statistics.median(totals):.1f} ms, "
+          f"p95 {totals[int(0.95 * (len(totals) - 1))]:.1f} ms, max {totals[-1]:.1f} ms")
+
+    phase_total = {name: sum(phases.get(name, 0.0) for _, _, _, phases in lookups) for name in PHASES}
+    overall = sum(phase_total.values()) or 1.0
+    print("  time per phase:")
+    for name in PHASES:
+        print(f"    {name:<8} {phase_total[name]:10.1f} ms  ({phase_total[name] / overall * 100:5.1f}%)")
+
+    # The gap between these two tells how much room a confidence threshold has
+    if found:
+        print(f"  best confidence of found lookups : min {min(found):.3f}, median {statistics.median(found):.3f}")
+    if missed:
+        print(f"  best confidence of missed lookups: max {max(missed):.3f}, median {statistics.median(missed):.3f}")
+    return 0
+
+
+def _bench_frame(path, size=(1080, 1920)):
+    """Grayscale benchmark frame: a screenshot, or textured noise of the given size"""
+    import cv2
+    import numpy as np
+
+    if path:
+        frame = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            raise FileNotFoundError(f"Cannot read image: {path}")
+        return frame
+    rng = np.random.default_rng(0)
+    return cv2.GaussianBlur(rng.integers(0, 256, size, dtype=np.uint8), (5, 5), 0)
+
+
+def bench_fft(args):
+    import cv2
+    import numpy as np
+
+    import falconMatch
+
+    frame = _bench_frame(args.frame)
+    height, width = frame.shape
+    spectrum = falconMatch.FrameSpectrum(frame)
+    start = time.perf_counter()
+    spectrum.match(frame[:8, :8])
+    prepare_ms = (time.perf_counter() - start) * 1000
+
+    print(f"FFT correlation benchmark: {width}x{height} frame (best of {args.repeat})")
+    print(f"  frame spectrum + integral images, once per frame: {prepare_ms:.1f} ms")
+    print(f"  {'template':>10} {'area':>8} {'matchTemplate':>14} {'FFT':>9} {'max diff':>9}")
+    crossover = None
+    side = 16
+    while side * 3 // 2 <= width // 2 and side <= height // 2:
+        template = frame[height // 4:height // 4 + side, width // 4:width // 4 + side * 3 // 2].copy()
+        direct = _best_of(args.repeat, lambda: cv2.matchTemplate(frame, template, cv2.TM_CCOEFF_NORMED))
+        fft = _best_of(args.repeat, lambda: spectrum.match(template))
+        difference = np.abs(
+            cv2.matchTemplate(frame, template, cv2.TM_CCOEFF_NORMED) - spectrum.match(template)
+        ).max()
+        area = template.shape[0] * template.shape[1]
+        if fft < direct and crossover is None:
+            crossover = area
+        elif fft >= direct:
+            crossover = None
+        marker = "  <- FFT" if falconMatch.use_fft(template.shape, frame.shape) else ""
+        print(
+            f"  {template.shape[1]:>4}x{template.shape[0]:<5} {area:>8} {direct * 1000:>11.1f} ms "
+            f"{fft * 1000:>6.1f} ms {difference:>9.5f}{marker}"
+        )
+        side = int(side * 1.5)
+
+    if crossover is None:
+        print("  matchTemplate was faster at every size on this machine")
+    else:
+        print(f"  FFT is faster from about {crossover} template pixels")
+    print(f"  falconMatch.FFT_MIN_TEMPLATE_AREA = {falconMatch.FFT_MIN_TEMPLATE_AREA}")
+    return 0
+
+
+def _generate_scale_corpus(directory, cases, seed=7):
+    """
+    Write NAME.frame.png / NAME.template.png pairs: a UI-like widget pasted at a
+    random ratio into a cluttered frame; the last case has no widget at all
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    for case in range(cases):
+        frame = np.full((720, 1280, 3), 235, np.uint8)
+        for i in range(80):
+            x, y = int(rng.integers(0, 1240)), int(rng.integers(10, 710))
+            color = tuple(int(v) for v in rng.integers(0, 200, 3))
+            if i % 3 == 0:
+                cv2.rectangle(frame, (x, y), (x + int(rng.integers(20, 120)), y + int(rng.integers(15, 60))), color, -1)
+            elif i % 3 == 1:
+                cv2.circle(frame, (x, y), int(rng.integers(5, 30)), color, 2)
+            else:
+                cv2.putText(frame, f"Item {i}", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        widget = np.full((50, 130, 3), 250, np.uint8)
+        cv2.rectangle(widget, (2, 2), (127, 47), tuple(int(v) for v in rng.integers(0, 200, 3)), -1)
+        cv2.putText(widget, f"Apply {case}", (10, 33), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        cv2.circle(widget, (115, 14), 6, (0, 0, 255), -1)
+        if case < cases - 1:
+            # Ratios between the common ones, where the search has to work
+            scale = float(rng.choice([0.55, 0.8, 1.12, 1.38, 1.62, 1.9, 2.15, 2.7]))
+            pasted = cv2.resize(widget, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            y = int(rng.integers(0, frame.shape[0] - pasted.shape[0]))
+            x = int(rng.integers(0, frame.shape[1] - pasted.shape[1]))
+            frame[y:y + pasted.shape[0], x:x + pasted.shape[1]] = pasted
+        cv2.imwrite(os.path.join(directory, f"case{case}.frame.png"), frame)
+        cv2.imwrite(os.path.join(directory, f"case{case}.template.png"), widget)
+
+
+def _exhaustive_scale_search(screenshot, template_path, scale_range, step):
+    """Reference: every ratio of np.arange(scale_range, step) at full resolution"""
+    import cv2
+    import numpy as np
+
+    from falconMatch import load_template, match_template
+
+    template = load_template(template_path)
+    best = (-1.0, None, None, None)
+    calls = 0
+    for scale in np.arange(scale_range[0], scale_range[1], step):
+        resized = cv2.resize(template["gray"], None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        if resized.shape[0] > screenshot.shape[0] or resized.shape[1] > screenshot.shape[1]:
+            continue
+        _, value, _, location = cv2.minMaxLoc(match_template(screenshot, resized, template["mask"]))
+        calls += 1
+        if value > best[0]:
+            best = (value, float(scale), location, resized.shape)
+    return best, calls
+
+
+def compare_scale_search(controller, frame_path, template_path, scale_range=(0.3, 3.5), confidence=0.9, step=0.02):
+    """
+    Run one lookup and the exhaustive sweep on a frame / template pair
+
+    :return: Dictionary {"agree", "location", "reference" (value, scale, position, shape),
+             "calls" (lookup matchTemplate calls per phase), "sweep_calls", "search_s", "sweep_s"}
+    """
+    import contextlib
+    from collections import Counter
+
+    import cv2
+
+    from falconMatch import PHASES, LookupRecord
+
+    screenshot = cv2.cvtColor(cv2.imread(frame_path), cv2.COLOR_BGR2GRAY)
+    record = LookupRecord(0, template_path, confidence, screenshot.shape)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        location = controller._locate_in_screenshot(
+            screenshot, template_path, scale_range, confidence, True, record
+        )
+    search_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reference, sweep_calls = _exhaustive_scale_search(screenshot, template_path, scale_range, step)
+    sweep_time = time.perf_counter() - start
+
+    value, _, position, shape = reference
+    reference_found = value >= confidence
+    agree = (location is not None) == reference_found
+    if agree and reference_found:
+        # Same place: centers within a few pixels (or 3% of the match size)
+        tolerance = max(3, 0.03 * max(shape))
+        agree = (
+            abs(location["left"] + location["width"] / 2 - position[0] - shape[1] / 2) <= tolerance
+            and abs(location["top"] + location["height"] / 2 - position[1] - shape[0] / 2) <= tolerance
+        )
+    return {
+        "agree": agree,
+        "location": location,
+        "reference": reference,
+        "calls": Counter(PHASES[phase] for _, _, phase in record.scales),
+        "sweep_calls": sweep_calls,
+        "search_s": search_time,
+        "sweep_s": sweep_time,
+    }
+
+
+def bench_scales(args):
+    import glob
+    import tempfile
+
+    from falconCommand import AutoGUIController
+
+    with tempfile.TemporaryDirectory() as generated:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = generated
+            _generate_scale_corpus(corpus, args.cases)
+        pairs = [
+            (frame_path, frame_path[:-len(".frame.png")] + ".template.png")
+            for frame_path in sorted(glob.glob(os.path.join(corpus, "*.frame.png")))
+        ]
+        if not pairs:
+            print(f"[X] No NAME.frame.png / NAME.template.png pairs in {corpus}")
+            return 1
+
+        controller = AutoGUIController()
+        print(f"Scale search equivalence: {len(pairs)} cases, reference sweep step {args.step}, "
+              f"threshold {args.confidence}")
+        failures = 0
+        total_search = total_reference = 0.0
+        for frame_path, template_path in pairs:
+            case = compare_scale_search(
+                controller, frame_path, template_path, confidence=args.confidence, step=args.step
+            )
+            location = case["location"]
+            value, scale = case["reference"][:2]
+            total_search += case["search_s"]
+            total_reference += case["sweep_s"]
+            failures += not case["agree"]
+            found_text = (
+                f"ratio {location['scale']:.3f} conf {location['confidence']:.3f}" if location else "not found"
+            )
+            reference_text = (
+                f"ratio {scale:.3f} conf {value:.3f}" if value >= args.confidence else f"not found ({value:.3f})"
+            )
+            calls = case["calls"]
+            phase_text = "/".join(str(calls[name]) for name in ("common", "coarse", "golden"))
+            print(
+                f"  {'[V]' if case['agree'] else '[X]'} {os.path.basename(frame_path):<20} "
+                f"search: {found_text:<28} {sum(calls.values()):>3} calls ({phase_text:<8}) "
+                f"{case['search_s'] * 1000:7.1f} ms | "
+                f"sweep: {reference_text:<28} {case['sweep_calls']:>3} calls {case['sweep_s'] * 1000:7.1f} ms"
+            )
+        print(f"  total: search {total_search:.2f} s, sweep {total_reference:.2f} s, {failures} disagreement(s)")
+        return 1 if failures else 0
+
+
+def bench_pool(args):
+    import contextlib
+    import glob
+    import tempfile
+
+    from PIL import Image
+
+    from falconCommand import AutoGUIController
+
+    def new_frame(image):
+        return {"image": image, "time": time.perf_counter(), "arrays": {}, "matches": {},
+                "origin": (0, 0), "scales": None}
+
+    with tempfile.TemporaryDirectory() as corpus:
+        _generate_scale_corpus(corpus, args.cases)
+        pairs = [
+            (Image.open(frame_path).convert("RGB"), frame_path[:-len(".frame.png")] + ".template.png")
+            for frame_path in sorted(glob.glob(os.path.join(corpus, "*.frame.png")))
+        ]
+        controller = AutoGUIController()
+        controller.frame_history = None
+
+        def run_lookups():
+            """One lookup after the other, a fresh frame each and no last-hit shortcut"""
+            locations = []
+            for image, template_path in pairs:
+                controller._last_hits.clear()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    locations.append(
+                        controller._lookup_in_frame(new_frame(image), template_path, (0.3, 3.5), 0.9, True)
+                    )
+            return locations
+
+        def run_in_flight():
+            """Every template looked up on the first frame at once through submit_lookup()"""
+            frame = new_frame(pairs[0][0])
+            futures = [
+                controller.submit_lookup(frame, template_path, (0.3, 3.5), 0.9, True) for _, template_path in pairs
+            ]
+            return [future.result()["location"] for future in futures]
+
+        def run_on_first_frame():
+            frame = new_frame(pairs[0][0])
+            with contextlib.redirect_stdout(io.StringIO()):
+                return [
+                    controller._locate_in_screenshot(
+                        controller.frame_array(frame), template_path, (0.3, 3.5), 0.9, True,
+                        spectrum=controller.frame_matcher(frame),
+                    )
+                    for _, template_path in pairs
+                ]
+
+        print(f"Match pool benchmark: {len(pairs)} lookups over 0.3-3.5, {os.cpu_count()} CPU(s), "
+              f"best of {args.repeat}")
+        reference = run_lookups()
+        single = _best_of(args.repeat, run_lookups)
+        in_flight_reference = run_on_first_frame()
+        single_first = _best_of(args.repeat, run_on_first_frame)
+        print(f"  {'in this process, one lookup at a time':<44} : {single * 1000:9.1f} ms")
+        print(f"  {'in this process, all templates on one frame':<44} : {single_first * 1000:9.1f} ms")
+        failures = 0
+        try:
+            for workers in args.workers:
+                for split in (False, True):
+                    controller.set_match_workers(workers, split)
+                    controller.match_pool.warm_up()
+                    same = run_lookups() == reference
+                    failures += not same
+                    pooled = _best_of(args.repeat, run_lookups)
+                    mode = "ratios split" if split else "one per lookup"
+                    label = f"{workers} worker(s), {mode}, one at a time"
+                    print(f"  {label:<44} : {pooled * 1000:9.1f} ms  "
+                          f"({single / pooled:.2f}x){'' if same else '  [X] results differ'}")
+                same = run_in_flight() == in_flight_reference
+                failures += not same
+                pooled = _best_of(args.repeat, run_in_flight)
+                label = f"{workers} worker(s), all lookups in flight"
+                print(f"  {label:<44} : {pooled * 1000:9.1f} ms  "
+                      f"({single_first / pooled:.2f}x){'' if same else '  [X] results differ'}")
+        finally:
+            controller.set_match_workers(0)
+            if controller.shared_frames is not None:
+                controller.shared_frames.close()
+        return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Falcon UI benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    tokenizer = subparsers.add_parser("tokenizer", help="Tokenize a large generated command file")
+    tokenizer.add_argument("--lines", type=int, default=100000, help="Script size in lines (default: 100000)")
+    tokenizer.add_argument("--repeat", type=int, default=3, help="Runs per implementation (default: 3)")
+    tokenizer.set_defaults(func=bench_tokenizer)
+
+    startup = subparsers.add_parser("startup", help="Import time breakdown and start-up time of simple commands")
+    startup.add_argument("--runs", type=int, default=5, help="Runs per command (default: 5)")
+    startup.add_argument("--top", type=int, default=15, help="Imports listed in the breakdown (default: 15)")
+    startup.add_argument("--budget-ms", type=float, default=200.0, help="Start-up budget per command (default: 200)")
+    startup.set_defaults(func=bench_startup)
+
+    diagnostics = subparsers.add_parser("diagnostics", help="Summarize a falconCommand --diagnostics file")
+    diagnostics.add_argument("path", help="*.jsonl or *.npz written by --diagnostics")
+    diagnostics.set_defaults(func=bench_diagnostics)
+
+    fft = subparsers.add_parser("fft", help="matchTemplate vs. FFT correlation over template sizes")
+    fft.add_argument("--frame", help="Screenshot to match against (default: generated 1920x1080 frame)")
+    fft.add_argument("--repeat", type=int, default=3, help="Runs per size and method (default: 3)")
+    fft.set_defaults(func=bench_fft)
+
+    scales = subparsers.add_parser("scales", help="Scale search vs. an exhaustive ratio sweep on a corpus")
+    scales.add_argument("--corpus", help="Folder of NAME.frame.png / NAME.template.png pairs (default: generated)")
+    scales.add_argument("--cases", type=int, default=6, help="Generated cases when no corpus is given (default: 6)")
+    scales.add_argument("--step", type=float, default=0.02, help="Ratio step of the reference sweep (default: 0.02)")
+    scales.add_argument("--confidence", type=float, default=0.9, help="Match threshold (default: 0.9)")
+    scales.set_defaults(func=bench_scales)
+
+    pool = subparsers.add_parser("pool", help="Lookups in this process vs. on a falconPool.MatchPool")
+    pool.add_argument("--workers", type=int, nargs="+", default=[2, 4], help="Pool sizes to time (default: 2 4)")
+    pool.add_argument("--cases", type=int, default=6, help="Generated lookups (default: 6)")
+    pool.add_argument("--repeat", type=int, default=3, help="Runs per configuration (default: 3)")
+    pool.set_defaults(func=bench_pool)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,643 @@
+# falconCapture.py
+#
+# Screen sources used by AutoGUIController for image recognition.
+import collections
+import datetime
+import os
+import json
+import queue
+import sys
+import threading
+import time
+import weakref
+from pathlib import Path
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif"}
+
+# Shared frame buffers attached by this process, by segment name
+_attached_frames = {}
+
+
+class FileReplayScreenSource:
+    """
+    Replay screen frames from image files instead of capturing the live desktop
+
+    :param path: An image file, or a folder whose images are replayed in name order
+    :param loop: Whether to start over after the last frame (default: True)
+    """
+
+    def __init__(self, path, loop=True):
+        path = Path(str(path).strip('"\''))
+        if path.is_dir():
+            self.frames = sorted(
+                str(p) for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS
+            )
+        elif path.exists():
+            self.frames = [str(path)]
+        else:
+            raise FileNotFoundError(f"Replay source not found: {path}")
+
+        if not self.frames:
+            raise FileNotFoundError(f"No image frames found in: {path}")
+
+        self.loop = loop
+        self.index = 0
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    def grab(self):
+        """Return the next frame as an RGB PIL image"""
+        from PIL import Image
+
+        with self._lock:
+            frame_path = self.frames[self.index]
+            if self.index < len(self.frames) - 1:
+                self.index += 1
+            elif self.loop:
+                self.index = 0
+
+            # Decode every file only once, replays hit the cache afterwards
+            frame = self._decoded.get(frame_path)
+            if frame is None:
+                with Image.open(frame_path) as image:
+                    frame = image.convert("RGB")
+                self._decoded[frame_path] = frame
+            return frame.copy()
+
+    def size(self):
+        """Return (width, height) of the first frame"""
+        from PIL import Image
+
+        with Image.open(self.frames[0]) as image:
+            return image.size
+
+    def __repr__(self):
+        return f"FileReplayScreenSource({len(self.frames)} frames from {os.path.dirname(self.frames[0]) or '.'})"
+
+
+def list_monitors():
+    """
+    Monitors of the desktop in physical pixels, the primary monitor first
+
+    :return: List of dictionaries {"index" (1-based), "left", "top", "width", "height",
+             "scale" (DPI / 96), "primary"}; outside Windows a single monitor of the
+             screen size with scale 1.0
+    """
+    if sys.platform == "win32":
+        try:
+            monitors = _windows_monitors()
+            if monitors:
+                return monitors
+        except Exception as e:
+            print(f"[Warning] Could not enumerate monitors: {str(e)}")
+    import falconInput
+
+    width, height = falconInput.screen_size()
+    return [{"index": 1, "left": 0, "top": 0, "width": width, "height": height, "scale": 1.0, "primary": True}]
+
+
+def _windows_monitors():
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    # Per-monitor DPI awareness (v2) reports every monitor in physical pixels;
+    # it fails harmlessly when the process already chose its awareness
+    try:
+        user32.SetProcessDpiAwarenessContext(ctypes.c_void_p(-4))
+    except AttributeError:
+        pass
+
+    class MONITORINFOEXW(ctypes.Structure):
+        _fields_ = [
+            ("cbSize", wintypes.DWORD),
+            ("rcMonitor", wintypes.RECT),
+            ("rcWork", wintypes.RECT),
+            ("dwFlags", wintypes.DWORD),
+            ("szDevice", wintypes.WCHAR * 32),
+        ]
+
+    monitors = []
+
+    def callback(handle, hdc, rect, data):
+        info = MONITORINFOEXW()
+        info.cbSize = ctypes.sizeof(MONITORINFOEXW)
+        user32.GetMonitorInfoW(handle, ctypes.byref(info))
+        scale = 1.0
+        dpi_x, dpi_y = wintypes.UINT(), wintypes.UINT()
+        try:
+            # MDT_EFFECTIVE_DPI, Windows 8.1 and later
+            if ctypes.windll.shcore.GetDpiForMonitor(handle, 0, ctypes.byref(dpi_x), ctypes.byref(dpi_y)) == 0:
+                scale = dpi_x.value / 96.0
+        except (AttributeError, OSError):
+            pass
+        bounds = info.rcMonitor
+        monitors.append({
+            "left": bounds.left,
+            "top": bounds.top,
+            "width": bounds.right - bounds.left,
+            "height": bounds.bottom - bounds.top,
+            "scale": scale,
+            "primary": bool(info.dwFlags & 1),  # MONITORINFOF_PRIMARY
+        })
+        return True
+
+    enum_proc = ctypes.WINFUNCTYPE(
+        wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+    )
+    user32.EnumDisplayMonitors(None, None, enum_proc(callback), 0)
+    return _number_monitors(monitors)
+
+
+def _number_monitors(monitors):
+    monitors = sorted(monitors, key=lambda m: (not m.get("primary", False), m["left"], m["top"]))
+    for index, monitor in enumerate(monitors, start=1):
+        monitor["index"] = index
+        monitor.setdefault("scale", 1.0)
+        monitor.setdefault("primary", index == 1)
+    return monitors
+
+
+def load_monitor_layout(path):
+    """
+    Read a monitor layout from a JSON file instead of the real desktop (for replayed frames)
+
+    The file holds a list of {"left", "top", "width", "height", "scale", "primary"}
+    objects; a replayed frame is then the whole virtual desktop, its top-left
+    pixel at the smallest left/top of the layout.
+    """
+    with open(str(path).strip('"\''), "r", encoding="utf-8") as layout_file:
+        monitors = json.load(layout_file)
+    if not isinstance(monitors, list) or not monitors:
+        raise ValueError(f"Monitor layout must be a non-empty list: {path}")
+    for monitor in monitors:
+        for key in ("left", "top", "width", "height"):
+            if not isinstance(monitor.get(key), int):
+                raise ValueError(f"Monitor layout entry without integer '{key}': {monitor}")
+    return _number_monitors([dict(monitor) for monitor in monitors])
+
+
+def select_monitors(monitors, spec):
+    """
+    Pick monitors by a --monitors specification
+
+    :param spec: "all", "primary", or 1-based numbers separated by commas ("2", "1,3")
+    :raises ValueError: on an unknown monitor number
+    """
+    spec = str(spec).strip().lower()
+    if spec == "all":
+        return list(monitors)
+    if spec == "primary":
+        return [next((m for m in monitors if m["primary"]), monitors[0])]
+    selected = []
+    for part in spec.split(","):
+        try:
+            number = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid monitor '{part}', use numbers, 'primary' or 'all'")
+        if not 1 <= number <= len(monitors):
+            raise ValueError(f"Monitor {number} does not exist ({len(monitors)} monitor(s) found)")
+        if monitors[number - 1] not in selected:
+            selected.append(monitors[number - 1])
+    return selected
+
+
+class MonitorScreenSource:
+    """
+    Capture only some monitors of the desktop
+
+    Frames cover the bounding box of the selected monitors (parts of it that
+    belong to no selected monitor are black). Matches in a frame are relative
+    to its top-left corner, which is `origin` in screen coordinates, and the
+    scale search tries the monitors' own DPI ratios (`scales`) first.
+
+    :param monitors: Selected monitor dictionaries (see list_monitors/select_monitors)
+    :param source: Optional screen source returning the whole virtual desktop
+                   (e.g. FileReplayScreenSource with a synthetic layout); default: live capture
+    :param layout: All monitors of the desktop, to locate the virtual desktop's origin in
+                   frames of source (default: monitors)
+    """
+
+    def __init__(self, monitors, source=None, layout=None):
+        if not monitors:
+            raise ValueError("No monitor selected")
+        self.monitors = list(monitors)
+        self.source = source
+        layout = layout or self.monitors
+        self.desktop_origin = (min(m["left"] for m in layout), min(m["top"] for m in layout))
+        left = min(m["left"] for m in self.monitors)
+        top = min(m["top"] for m in self.monitors)
+        right = max(m["left"] + m["width"] for m in self.monitors)
+        bottom = max(m["top"] + m["height"] for m in self.monitors)
+        self.origin = (left, top)
+        self.bbox = (left, top, right, bottom)
+        self.scales = sorted({float(m["scale"]) for m in self.monitors})
+
+    def grab(self):
+        """Return the selected monitors as one RGB PIL image"""
+        from PIL import Image
+
+        left, top, right, bottom = self.bbox
+        if self.source is not None:
+            desktop = self.source.grab()
+            x0, y0 = self.desktop_origin
+            image = desktop.crop((left - x0, top - y0, right - x0, bottom - y0))
+        else:
+            from PIL import ImageGrab
+
+            image = ImageGrab.grab(bbox=self.bbox, all_screens=True).convert("RGB")
+        if len(self.monitors) == 1:
+            return image
+        # Black out what lies between the selected monitors
+        frame = Image.new("RGB", image.size)
+        for monitor in self.monitors:
+            box = (
+                monitor["left"] - left, monitor["top"] - top,
+                monitor["left"] - left + monitor["width"], monitor["top"] - top + monitor["height"],
+            )
+            frame.paste(image.crop(box), box[:2])
+        return frame
+
+    def __repr__(self):
+        numbers = ",".join(str(m.get("index", "?")) for m in self.monitors)
+        return f"<MonitorScreenSource monitors {numbers} at {self.origin}>"
+
+
+class FrameRingBuffer:
+    """
+    The last few captured frames, kept for failure forensics
+
+    Frames are the ones already grabbed for matching, so recording costs no
+    extra capture. A background thread downscales each frame to max_width
+    shortly after it is added, so the ring holds at most one full resolution
+    capture per pending frame; frames are PNG-encoded only when dump() writes
+    them, so a run that never fails never encodes one.
+
+    :param capacity: Number of frames kept (oldest are dropped)
+    :param max_width: Frames wider than this are downscaled
+    """
+
+    def __init__(self, capacity=8, max_width=960):
+        self.capacity = capacity
+        self.max_width = max_width
+        self._frames = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._added = threading.Event()
+        self._shrinker = None
+
+    def add(self, image, label=None):
+        """
+        Record a captured PIL image (not copied; downscaled in the background)
+
+        :return: The entry dictionary, annotate() adds match results to it
+        """
+        entry = {
+            "image": image,
+            # Downscale factor of entry["image"], None while it is still full size
+            "scale": None,
+            "size": image.size,
+            "time": datetime.datetime.now(),
+            "label": label,
+            "matches": [],
+        }
+        with self._lock:
+            self._frames.append(entry)
+            if self._shrinker is None:
+                self._shrinker = threading.Thread(target=self._shrink_worker, daemon=True)
+                self._shrinker.start()
+        self._added.set()
+        return entry
+
+    def _shrink(self, entry):
+        """Replace a full size frame by its downscaled copy (any thread)"""
+        with self._lock:
+            image = entry["image"]
+            if entry["scale"] is not None:
+                return
+        width, height = image.size
+        scale = min(1.0, self.max_width / float(width)) if width else 1.0
+        if scale < 1.0:
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))))
+        with self._lock:
+            if entry["scale"] is None:
+                entry["image"], entry["scale"] = image, scale
+
+    def _shrink_worker(self):
+        while True:
+            self._added.wait()
+            self._added.clear()
+            # Only frames still in the ring; dropped ones are freed with their entry
+            with self._lock:
+                pending = [entry for entry in self._frames if entry["scale"] is None]
+            for entry in pending:
+                try:
+                    self._shrink(entry)
+                except Exception as e:
+                    print(f"[Warning] Could not downscale frame for history: {str(e)}")
+
+    def annotate(self, entry, template, rect, confidence, found):
+        """Attach a match result (rect = (left, top, width, height) in screen pixels)"""
+        if entry is not None:
+            entry["matches"].append({
+                "template": template,
+                "rect": rect,
+                "confidence": confidence,
+                "found": found,
+            })
+
+    def __len__(self):
+        return len(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def dump(self, directory, reason=None):
+        """
+        Write the recorded frames as PNG files with match rectangles drawn on
+
+        :param directory: Output folder (created if needed)
+        :param reason: Optional text written to the index file
+        :return: List of written frame paths, oldest first
+        """
+        from PIL import ImageDraw
+
+        with self._lock:
+            entries = list(self._frames)
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        paths = []
+        index_lines = [f"Reason: {reason}"] if reason else []
+        for number, entry in enumerate(entries):
+            # Not downscaled yet: do it now
+            self._shrink(entry)
+            with self._lock:
+                image, scale = entry["image"], entry["scale"]
+            # Never draw on the recorded frame itself (at scale 1 it is the capture)
+            image = image.copy()
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            draw = ImageDraw.Draw(image)
+            for match in entry["matches"]:
+                if match["rect"] is None:
+                    continue
+                left, top, width, height = (value * scale for value in match["rect"])
+                color = "lime" if match["found"] else "red"
+                draw.rectangle([left, top, left + width, top + height], outline=color, width=2)
+                if match["confidence"] is not None:
+                    draw.text(
+                        (left, max(0, top - 12)),
+                        f"{match['confidence']:.3f}",
+                        fill=color,
+                    )
+
+            path = directory / f"frame_{number:02d}_{entry['time'].strftime('%H%M%S_%f')[:-3]}.png"
+            image.save(path)
+            paths.append(str(path))
+
+            index_lines.append(f"{path.name}  captured {entry['time'].strftime('%H:%M:%S.%f')[:-3]}")
+            for match in entry["matches"]:
+                confidence = "n/a" if match["confidence"] is None else f"{match['confidence']:.3f}"
+                index_lines.append(
+                    f"    {'found' if match['found'] else 'miss '} {match['template']} "
+                    f"confidence={confidence} rect={match['rect']}"
+                )
+
+        with open(directory / "frames.txt", "w", encoding="utf-8") as index_file:
+            index_file.write("\n".join(index_lines) + "\n")
+        return paths
+
+
+class MatchOverlay:
+    """
+    Draws match boxes on already captured frames in a background thread
+
+    submit() never blocks the script: when the drawing thread falls behind
+    the oldest waiting frame is dropped. Annotated frames go to a file
+    (overwritten with the latest match), a folder (one file per match)
+    and/or a callback such as a GUI preview panel.
+
+    :param output: A .png/.jpg file or a folder, or None
+    :param callback: Optional callable receiving the annotated PIL image
+    :param backlog: Frames allowed to wait for drawing
+    """
+
+    def __init__(self, output=None, callback=None, backlog=2):
+        self.output = Path(str(output).strip('"\'')) if output else None
+        self.callback = callback
+        self._queue = queue.Queue(maxsize=backlog)
+        self._count = 0
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, rect, confidence=None, label=None):
+        """
+        Queue a frame for annotation and return immediately
+
+        :param image: The PIL image the match was found on (not modified)
+        :param rect: (left, top, width, height) of the match
+        """
+        item = (image, rect, confidence, label, datetime.datetime.now())
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    pass
+
+    def _annotate(self, image, rect, confidence, label):
+        from PIL import ImageDraw
+
+        image = image.convert("RGB")  # always a copy, the cached frame stays untouched
+        draw = ImageDraw.Draw(image)
+        left, top, width, height = rect
+        center_x, center_y = left + width // 2, top + height // 2
+        draw.rectangle([left, top, left + width, top + height], outline="red", width=2)
+        draw.line([center_x - 10, center_y, center_x + 10, center_y], fill="red")
+        draw.line([center_x, center_y - 10, center_x, center_y + 10], fill="red")
+        caption = " ".join(
+            part for part in (label, None if confidence is None else f"{confidence:.3f}") if part
+        )
+        if caption:
+            draw.text((left, max(0, top - 12)), caption, fill="red")
+        return image
+
+    def _worker(self):
+        while True:
+            image, rect, confidence, label, captured = self._queue.get()
+            try:
+                annotated = self._annotate(image, rect, confidence, label)
+                if self.output is not None:
+                    if self.output.suffix.lower() in IMAGE_EXTENSIONS:
+                        self.output.parent.mkdir(parents=True, exist_ok=True)
+                        annotated.save(self.output)
+                    else:
+                        self.output.mkdir(parents=True, exist_ok=True)
+                        self._count += 1
+                        annotated.save(
+                            self.output / f"match_{self._count:04d}_{captured.strftime('%H%M%S_%f')[:-3]}.png"
+                        )
+                if self.callback is not None:
+                    self.callback(annotated)
+            except Exception as e:
+                print(f"[Warning] Could not draw match overlay: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=2.0):
+        """Wait (at most timeout seconds) until every submitted frame is written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class SharedFrameBuffer:
+    """
+    Screen frames in a multiprocessing.shared_memory segment, for matcher processes
+
+    The capturing process writes each frame once; matcher processes attach
+    by name and get read-only numpy views on the segment instead of a pickled
+    copy of the frame with every task. Frames rotate through a few slots and
+    every write gets a new generation number, so a reader can tell whether the
+    frame it was given is still in its slot (see valid()).
+
+    Segment layout (int64 header, then the slots):
+      [0] latest generation  [1] slot count  [2] slot size in bytes
+      per slot at 8 + 4 * slot: generation (-1 while writing), height, width, channels
+
+    :param shape: Largest frame shape to hold, e.g. (2160, 3840, 3)
+    :param slots: Frames kept at the same time; a reader must finish with a frame
+                  before the writer wraps around to its slot
+    :param name: Attach to an existing segment instead of creating one
+    """
+
+    HEADER_WORDS = 8
+
+    def __init__(self, shape=None, slots=2, name=None):
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        self.owner = name is None
+        if self.owner:
+            slot_size = 1
+            for dimension in shape:
+                slot_size *= int(dimension)
+            slot_size = (slot_size + 63) // 64 * 64
+            header_size = ((self.HEADER_WORDS + 4 * slots) * 8 + 63) // 64 * 64
+            self._memory = shared_memory.SharedMemory(create=True, size=header_size + slot_size * slots)
+            self._header = np.ndarray((self.HEADER_WORDS + 4 * slots,), np.int64, self._memory.buf)
+            self._header[:] = 0
+            self._header[1] = slots
+            self._header[2] = slot_size
+            self._header[self.HEADER_WORDS::4] = -1
+            # The creator removes the segment, also when it is garbage collected or at exit
+            self._finalizer = weakref.finalize(self, SharedFrameBuffer._release, self._memory, True)
+        else:
+            # Pool workers share the creator's resource tracker, so attaching
+            # does not make the segment disappear when a worker exits
+            self._memory = shared_memory.SharedMemory(name=name)
+            slots = int(np.ndarray((3,), np.int64, self._memory.buf)[1])
+            self._header = np.ndarray((self.HEADER_WORDS + 4 * slots,), np.int64, self._memory.buf)
+            self._finalizer = weakref.finalize(self, SharedFrameBuffer._release, self._memory, False)
+        self.name = self._memory.name
+        self.slots = int(self._header[1])
+        self.slot_size = int(self._header[2])
+        self._data_start = ((self.HEADER_WORDS + 4 * self.slots) * 8 + 63) // 64 * 64
+
+    @staticmethod
+    def _release(memory, unlink):
+        try:
+            memory.close()
+        except BufferError:
+            # A numpy view is still alive, the mapping goes away with the process
+            pass
+        if unlink:
+            try:
+                memory.unlink()
+            except FileNotFoundError:
+                pass
+
+    def fits(self, array):
+        return array.nbytes <= self.slot_size
+
+    def write(self, array):
+        """
+        Copy a frame into the next slot
+
+        :param array: uint8 numpy array (grayscale or RGB) no larger than the buffer's shape
+        :return: Handle {"name", "generation"} to pass to attach_shared_frame() in a matcher process
+        """
+        import numpy as np
+
+        if not self.owner:
+            raise PermissionError("Shared frame buffer is attached read-only")
+        if array.dtype != np.uint8 or not self.fits(array):
+            raise ValueError(f"Frame {array.shape} does not fit shared buffer of {self.slot_size} bytes")
+        generation = int(self._header[0]) + 1
+        slot = generation % self.slots
+        record = self.HEADER_WORDS + 4 * slot
+        self._header[record] = -1
+        view = self._slot_view(slot, array.shape)
+        view[...] = array
+        channels = array.shape[2] if array.ndim == 3 else 0
+        self._header[record + 1:record + 4] = (array.shape[0], array.shape[1], channels)
+        self._header[record] = generation
+        self._header[0] = generation
+        return {"name": self.name, "generation": generation}
+
+    def _slot_view(self, slot, shape):
+        import numpy as np
+
+        return np.ndarray(shape, np.uint8, self._memory.buf, self._data_start + slot * self.slot_size)
+
+    def valid(self, generation):
+        """Whether the frame of this generation is still unchanged in its slot"""
+        return int(self._header[self.HEADER_WORDS + 4 * (generation % self.slots)]) == generation
+
+    def read(self, generation):
+        """
+        Read-only view of a written frame, or None if its slot has been reused
+
+        The view is not copied: check valid(generation) again after using it
+        when the writer may have wrapped around in the meantime.
+        """
+        if not self.valid(generation):
+            return None
+        record = self.HEADER_WORDS + 4 * (generation % self.slots)
+        height, width, channels = (int(value) for value in self._header[record + 1:record + 4])
+        shape = (height, width, channels) if channels else (height, width)
+        view = self._slot_view(generation % self.slots, shape)
+        view.flags.writeable = False
+        return view if self.valid(generation) else None
+
+    def close(self):
+        """Detach (and remove the segment when this buffer created it)"""
+        self._header = None
+        self._finalizer()
+
+
+def attach_shared_frame(handle):
+    """
+    Frame of a SharedFrameBuffer.write() handle, attaching to the segment once per process
+
+    :return: Read-only numpy view, or None if the frame has already been overwritten
+    """
+    buffer = _attached_frames.get(handle["name"])
+    if buffer is None:
+        # The capturing process replaced its buffer (e.g. bigger screen), drop old attachments
+        for old in list(_attached_frames.values()):
+            old.close()
+        _attached_frames.clear()
+        buffer = _attached_frames[handle["name"]] = SharedFrameBuffer(name=handle["name"])
+    return buffer.read(handle["generation"])
+
+
+def shared_frame_valid(handle):
+    """Whether a frame attached with attach_shared_frame() was not overwritten since"""
+    buffer = _attached_frames.get(handle["name"])
+    return buffer is not None and buffer.valid(handle["generation"])
@@ -1,17 +1,21 @@
 # falconCommand.py
 #
 import argparse
+import contextlib
 import datetime
+import functools
 import io
+import importlib
+import inspect
+import multiprocessing
 import os
-import cv2
-import numpy as np
 import sys
+import threading
 import time
 from pathlib import Path
-import pyperclip
-import pyautogui
-from PIL import Image
+
+from falconMatch import COLOR_TOLERANCE
+from falconScript import compile_blocks, tokenize_line
 
 # 確保控制台輸出使用 UTF-8
 if sys.platform == 'win32':
@@ -22,12 +26,169 @@ if sys.platform == 'win32':
 COMMAND_VERSION = "1.0.34"  # Add version number here
 
 
+class _LazyModule:
+    """
+    Module placeholder that imports the real module on first attribute access
+
+    cv2, numpy and pyautogui (which pulls in pyscreeze, numpy and cv2 itself)
+    take most of the start-up time, while commands like --sleep, --position
+    or --check-software never touch them. Attributes assigned before the
+    import (e.g. pyautogui.PAUSE) are applied once the module is loaded.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_pending", {})
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            for attr, value in self._pending.items():
+                setattr(module, attr, value)
+            self._pending.clear()
+            object.__setattr__(self, "_module", module)
+        return module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        if self._module is None and attr in self._pending:
+            return self._pending[attr]
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        if self._module is None:
+            self._pending[attr] = value
+        else:
+            setattr(self._module, attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+cv2 = _LazyModule("cv2")
+np = _LazyModule("numpy")
+pyautogui = _LazyModule("pyautogui")
+pyperclip = _LazyModule("pyperclip")
+
+
+class ExecutionCancelled(BaseException):
+    """
+    Raised inside a running command when AutoGUIController.cancel_event is set
+
+    Derived from BaseException like KeyboardInterrupt, so the generic
+    `except Exception` handlers of the commands do not swallow it.
+    """
+
+
+class _ThreadOutputRouter(io.TextIOBase):
+    """
+    sys.stdout/sys.stderr stand-in that sends writes from registered threads
+    to their own buffer and everything else to the original stream
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.targets = {}
+
+    def write(self, text):
+        target = self.targets.get(threading.get_ident(), self.original)
+        return target.write(text)
+
+    def flush(self):
+        target = self.targets.get(threading.get_ident(), self.original)
+        target.flush()
+
+
+_output_router_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def capture_thread_output(buffer, error_buffer=None):
+    """
+    Redirect print() output of the current thread only into buffer
+
+    Unlike contextlib.redirect_stdout this is safe when several controllers
+    run in worker threads of the same process.
+
+    :param buffer: Receives stdout (and stderr unless error_buffer is given)
+    :param error_buffer: Optional separate target for stderr
+    """
+    with _output_router_lock:
+        routers = []
+        for name in ("stdout", "stderr"):
+            stream = getattr(sys, name)
+            if not isinstance(stream, _ThreadOutputRouter):
+                stream = _ThreadOutputRouter(stream)
+                setattr(sys, name, stream)
+            routers.append(stream)
+    thread_id = threading.get_ident()
+    routers[0].targets[thread_id] = buffer
+    routers[1].targets[thread_id] = buffer if error_buffer is None else error_buffer
+    try:
+        yield buffer
+    finally:
+        for router in routers:
+            router.targets.pop(thread_id, None)
+
+
 class AutoGUIController:
     def __init__(self):
         # Set pyautogui's security settings
         pyautogui.FAILSAFE = True
         self.version = COMMAND_VERSION
         self.parser = self._create_parser()
+        # Screen source used for image recognition (None = live desktop)
+        self.screen_source = None
+        # Injector for fast_click / fast_press (None = falconInput.default_injector())
+        self.input_injector = None
+        # Last captured frame, shared by lookups until it is older than frame_max_age
+        self._frame_cache = None
+        self.frame_max_age = 0.5
+        # Set from another thread to stop a running script as soon as possible
+        self.cancel_event = threading.Event()
+        # Optional callable receiving structured events (see falconEngine)
+        self.listener = None
+        # Optional debugger callback(args, state) run before each script command,
+        # returning False skips the command
+        self.debug_hook = None
+        # Latest image lookup (template, found, confidence, rect ...)
+        self.last_match = None
+        self._best_miss = None
+        # Ring buffer of the last captured frames, dumped next to the log on failure
+        from falconCapture import FrameRingBuffer
+
+        self.frame_history = FrameRingBuffer(capacity=8)
+        # falconCapture.MatchOverlay drawing found matches in the background (None = off)
+        self.overlay = None
+        # falconMatch.MatchDiagnostics recording lookup internals (None = off)
+        self.diagnostics = None
+        # Color check tolerance of image lookups (None = grayscale only), set per command by --match-color
+        self.color_tolerance = None
+        # Image lookup engine: "template" (multi-scale search), "orb" or "akaze" (keypoints),
+        # set per command by --match-engine
+        self.match_engine = "template"
+        self._feature_matchers = {}
+        # Result-map side of tiled matching: None = only for frames above
+        # falconMatch.TILED_MIN_PIXELS, 0 = never (set by --match-tiles)
+        self.match_tile_size = None
+        self._tile_buffer = None
+        # Last found rectangle and ratio per (template, grayscale), checked first by the next lookup
+        self._last_hits = {}
+        # Lookup of the next command file command started ahead of time (see start_prefetch)
+        self._prefetch = None
+        self._prefetch_executor = None
+        self._prefetch_controller = None
+        # falconCapture.SharedFrameBuffer handing frames to matcher processes (created on first use)
+        self.shared_frames = None
+        # falconPool.MatchPool running lookups in worker processes (None = in this process),
+        # started by --match-workers
+        self.match_pool = None
 
     def _create_parser(self):
         parser = argparse.ArgumentParser(
@@ -53,6 +214,12 @@ class AutoGUIController:
             metavar="X Y COUNT DELAY",
             help="Fast click at coordinates (X, Y) or current position for COUNT times with minimal DELAY",
         )
+        parser.add_argument(
+            "--fast-press",
+            nargs="+",
+            metavar="KEY COUNT DELAY",
+            help="Press KEY (e.g. a, enter, ctrl+v) COUNT times with minimal DELAY",
+        )
         parser.add_argument(
             "--double-click",
             nargs="*",
@@ -197,6 +364,36 @@ class AutoGUIController:
             metavar="IMAGE_PATH",
             help="Locate and double-click the center of the specified image on screen",
         )
+        parser.add_argument(
+            "--find-all",
+            type=str,
+            metavar="IMAGE_PATH",
+            help="List every occurrence of the specified image on screen, top to bottom and left to right",
+        )
+        parser.add_argument(
+            "--index",
+            type=int,
+            metavar="N",
+            help="With --click-image/--right-click-image/--double-click-image: use the N-th occurrence "
+            "in reading order (1 = first, -1 = last)",
+        )
+        parser.add_argument(
+            "--match-color",
+            nargs="?",
+            type=float,
+            const=COLOR_TOLERANCE,
+            default=None,
+            metavar="TOLERANCE",
+            help="With image commands: also require the template's colors, e.g. to tell an enabled button "
+            f"from a disabled one (largest mean color difference per channel, default: {COLOR_TOLERANCE:.0f})",
+        )
+        parser.add_argument(
+            "--match-engine",
+            choices=["template", "orb", "akaze"],
+            default="template",
+            help="With image commands: 'template' searches the template over a range of scales (default), "
+            "'orb'/'akaze' estimate scale and position from keypoints and verify at that one scale",
+        )
         parser.add_argument(
             "--image-exists",
             type=str,
@@ -234,6 +431,20 @@ class AutoGUIController:
             help="Pause execution for specified number of seconds",
         )
         parser.add_argument("--repeat", type=int, help=argparse.SUPPRESS)
+        parser.add_argument(
+            "--batch",
+            nargs="+",
+            metavar="EVENT",
+            help="Send a sequence of input events back-to-back, separated by ';' "
+            "(e.g., --batch click 100 200 ; press tab ; type hello)",
+        )
+        parser.add_argument(
+            "--batch-gap",
+            type=float,
+            default=0.0,
+            metavar="SECONDS",
+            help="Minimal gap between --batch events in seconds (default: 0)",
+        )
         parser.add_argument(
             "--stop-on-error",
             action="store_true",
@@ -259,6 +470,71 @@ class AutoGUIController:
             default=1.0,
             help="Interval in seconds between checks",
         )
+        parser.add_argument(
+            "--replay-frames",
+            type=str,
+            metavar="PATH",
+            help="Replay screen captures from an image file or folder instead of the live desktop",
+        )
+        parser.add_argument(
+            "--monitors",
+            type=str,
+            metavar="SPEC",
+            help="Capture and search only these monitors: 'primary', 'all' or numbers like '2' or '1,3' "
+            "(see --list-monitors); their DPI ratios are tried first",
+        )
+        parser.add_argument(
+            "--monitor-layout",
+            type=str,
+            metavar="JSON_PATH",
+            help="Use the monitor layout in this JSON file instead of the real monitors, "
+            "e.g. with --replay-frames of a whole virtual desktop",
+        )
+        parser.add_argument(
+            "--list-monitors",
+            action="store_true",
+            help="List the monitors with their position, size and DPI scale",
+        )
+        parser.add_argument(
+            "--overlay",
+            type=str,
+            metavar="PATH",
+            help="Save every image match drawn on its frame to PATH (a .png file keeps the latest, a folder keeps all)",
+        )
+        parser.add_argument(
+            "--diagnostics",
+            type=str,
+            metavar="PATH",
+            help="Record scale/confidence curves, top peaks and phase timings of every image lookup "
+            "(PATH.jsonl: one JSON line per lookup, PATH.npz: numpy arrays)",
+        )
+        parser.add_argument(
+            "--match-workers",
+            type=int,
+            metavar="N",
+            help="Run image lookups in N worker processes (0 = in this process); "
+            "the pool stays up for the rest of the command file",
+        )
+        parser.add_argument(
+            "--match-split",
+            action="store_true",
+            help="With --match-workers: spread the ratios of each lookup over all workers "
+            "instead of running it on its template's worker",
+        )
+        parser.add_argument(
+            "--match-tiles",
+            type=int,
+            metavar="SIZE",
+            help="Match images in tiles of SIZE pixels with bounded memory (0 = never); "
+            "by default only screens larger than two 4K monitors are tiled",
+        )
+        parser.add_argument(
+            "--build-pack",
+            type=str,
+            metavar="DIR",
+            help="Decode every template image below DIR into DIR/falcon_templates.fpack, "
+            "which image lookups then read instead of the image files",
+        )
 
         return parser
 
@@ -298,6 +574,28 @@ class AutoGUIController:
             print(f"Error saving log: {str(e)}")
             return None
 
+    def dump_frame_history(self, reason, image_path=None):
+        """
+        Save the recorded frames (with match rectangles and confidence) next to the logs
+
+        :param reason: Why the dump was taken, written to frames.txt
+        :param image_path: Template that was not found, used in the folder name
+        :return: Folder path or None
+        """
+        if self.frame_history is None or not len(self.frame_history):
+            return None
+        try:
+            today = datetime.datetime.now().strftime("%Y-%m-%d")
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            name = Path(image_path).stem if image_path else "frames"
+            folder = Path(f"C:/Falcon_Log/{today}") / f"frames_{name}_{timestamp}"
+            paths = self.frame_history.dump(folder, reason)
+            print(f"[Forensics] Saved last {len(paths)} frame(s) to: {folder}")
+            return str(folder)
+        except Exception as e:
+            print(f"[Warning] Could not save frame history: {str(e)}")
+            return None
+
     def detect_display_scale_factor(self):
         """
         Detect the Windows display scaling factor (DPI scaling)
@@ -343,6 +641,216 @@ class AutoGUIController:
             print(f"Error detecting scale factor: {str(e)}")
             return 1.0
 
+    def capture_screen(self):
+        """
+        Capture the screen from the active screen source
+
+        :return: RGB PIL image of the live desktop, or the next replayed frame
+        """
+        if self.screen_source is not None:
+            return self.screen_source.grab()
+        return pyautogui.screenshot()
+
+    def grab_frame(self, max_age=0.0):
+        """
+        Return the current screen frame, reusing the cached capture when it is recent enough
+
+        :param max_age: Maximum age in seconds of a cached frame; 0 always captures
+        :return: Frame dictionary {"image", "time", "arrays", "matches", "origin", "scales"}
+        """
+        now = time.perf_counter()
+        frame = self._frame_cache
+        if frame is not None and max_age > 0 and now - frame["time"] <= max_age:
+            return frame
+
+        frame = {"image": self.capture_screen(), "time": now, "arrays": {}, "matches": {}}
+        # Frames of a falconCapture.MonitorScreenSource cover only some monitors: screen
+        # position of their top-left pixel and the DPI ratios to try first
+        frame["origin"] = getattr(self.screen_source, "origin", (0, 0))
+        frame["scales"] = getattr(self.screen_source, "scales", None)
+        # Keep the capture for failure forensics (no extra grab, downscaled in the background)
+        frame["history"] = self.frame_history.add(frame["image"]) if self.frame_history is not None else None
+        self._frame_cache = frame
+        return frame
+
+    def frame_array(self, frame, grayscale=True):
+        """numpy array of a frame (grayscale or RGB), converted once per frame"""
+        array = frame["arrays"].get(grayscale)
+        if array is None:
+            array = np.array(frame["image"])
+            # Convert to grayscale if requested (improves matching speed and accuracy)
+            if grayscale:
+                array = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+            frame["arrays"][grayscale] = array
+        return array
+
+    def to_screen(self, frame, location):
+        """Copy of a location found in a frame, in screen coordinates (None stays None)"""
+        if not location:
+            return None
+        location = dict(location)
+        location["left"] += frame["origin"][0]
+        location["top"] += frame["origin"][1]
+        return location
+
+    def frame_spectrum(self, frame):
+        """falconMatch.FrameSpectrum of the grayscale frame, shared by all lookups on it (computed on first use)"""
+        spectrum = frame.get("spectrum")
+        if spectrum is None:
+            from falconMatch import FrameSpectrum
+
+            spectrum = frame["spectrum"] = FrameSpectrum(self.frame_array(frame, grayscale=True))
+        return spectrum
+
+    def share_frame(self, frame, grayscale=True):
+        """
+        Put a frame array into shared memory for matcher processes, once per frame
+
+        :return: falconCapture.SharedFrameBuffer handle {"name", "generation"}
+        """
+        from falconCapture import SharedFrameBuffer
+
+        shared = frame.setdefault("shared", {})
+        handle = shared.get(grayscale)
+        if handle is None:
+            array = self.frame_array(frame, grayscale)
+            if self.shared_frames is None or not self.shared_frames.fits(array):
+                if self.shared_frames is not None:
+                    self.shared_frames.close()
+                # Sized for an RGB frame, so grayscale and color arrays of the screen both fit
+                self.shared_frames = SharedFrameBuffer((array.shape[0], array.shape[1], 3))
+            handle = shared[grayscale] = self.shared_frames.write(array)
+        return handle
+
+    def set_match_workers(self, workers, split=False):
+        """
+        Start (or resize, or with 0 stop) the falconPool.MatchPool used by image lookups
+
+        :param split: Spread the ratios of each lookup over all workers (--match-split)
+        """
+        if self.match_pool is not None:
+            if self.match_pool.workers == workers and self.match_pool.split == split:
+                return
+            self.match_pool.shutdown()
+            self.match_pool = None
+        if workers > 0:
+            from falconPool import MatchPool
+
+            self.match_pool = MatchPool(workers, split)
+
+    def submit_lookup(self, frame, template_path, scale_range, confidence, grayscale):
+        """
+        Queue a whole multi-scale lookup on the match pool (on its template's worker)
+
+        :return: concurrent.futures.Future of the falconPool result dictionary
+        """
+        color_handle = None
+        if self.color_tolerance is not None:
+            color_handle = self.share_frame(frame, grayscale=False)
+        return self.match_pool.submit(
+            self.share_frame(frame, grayscale), template_path, scale_range, confidence, grayscale,
+            color_handle, self.color_tolerance, frame.get("scales"),
+        )
+
+    def frame_matcher(self, frame, grayscale=True, reuse=True):
+        """
+        Full-frame matching helper passed to falconMatch.match_template as its spectrum
+
+        :param reuse: Let tiled matching write every result map into one buffer kept by the
+                      controller (only when no result map outlives the next match)
+        :return: falconMatch.TiledFrame for very large frames (or with --match-tiles),
+                 otherwise the frame's FrameSpectrum (grayscale) or None
+        """
+        from falconMatch import TILE_SIZE, TILED_MIN_PIXELS, TiledFrame
+
+        image = self.frame_array(frame, grayscale)
+        pixels = image.shape[0] * image.shape[1]
+        tile_size = self.match_tile_size
+        if tile_size is None:
+            tile_size = TILE_SIZE if pixels > TILED_MIN_PIXELS else 0
+        if not tile_size:
+            return self.frame_spectrum(frame) if grayscale else None
+        buffer = None
+        if reuse:
+            if self._tile_buffer is None or self._tile_buffer.size < pixels:
+                self._tile_buffer = np.empty(pixels, np.float32)
+            buffer = self._tile_buffer
+        return TiledFrame(image, tile_size, buffer, workers=min(4, os.cpu_count() or 1))
+
+    def reset_run_state(self):
+        """
+        Undo the settings a run left on this controller
+
+        --replay-frames, --monitors, --overlay, --diagnostics, --match-workers,
+        --match-tiles and the per-command match options stay on the controller
+        for the rest of a command file. A controller reused for the next job
+        (falconEngine, falconAgent) must not carry them over.
+        """
+        if self.overlay is not None:
+            # Let the background overlay finish writing the last annotated frame
+            self.overlay.flush()
+            self.overlay = None
+        if self.diagnostics is not None:
+            self.diagnostics.close()
+            self.diagnostics = None
+        if self.match_pool is not None:
+            self.match_pool.shutdown()
+            self.match_pool = None
+        self.screen_source = None
+        self.match_tile_size = None
+        self._tile_buffer = None
+        self.color_tolerance = None
+        self.match_engine = "template"
+        self._last_hits.clear()
+        self._prefetch = None
+        self.invalidate_frame()
+
+    def invalidate_frame(self):
+        """Drop the cached frame, e.g. after an input action changed the screen"""
+        self._frame_cache = None
+
+    def check_cancelled(self):
+        """Raise ExecutionCancelled if cancel_event has been set"""
+        if self.cancel_event.is_set():
+            raise ExecutionCancelled()
+
+    def wait(self, seconds):
+        """time.sleep() that returns early with ExecutionCancelled when cancel_event is set"""
+        if self.cancel_event.wait(max(0.0, seconds)):
+            raise ExecutionCancelled()
+
+    def cursor_position(self):
+        """Current mouse position without importing pyautogui where possible"""
+        import falconInput
+
+        return falconInput.cursor_position()
+
+    def screen_size(self):
+        """Primary screen size without importing pyautogui where possible"""
+        import falconInput
+
+        return falconInput.screen_size()
+
+    def is_process_running(self, process_name, exact_match=True):
+        """
+        Check once whether a process is running
+
+        :param process_name: Name of the process (e.g., 'notepad.exe')
+        :param exact_match: Whether to use exact match or substring match
+        :return: True if a matching process is found
+        """
+        import psutil
+
+        target = process_name.lower()
+        for proc in psutil.process_iter(attrs=["name"]):
+            try:
+                pname = (proc.info.get("name") or "").lower()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue  # Skip inaccessible or zombie processes
+            if pname == target if exact_match else target in pname:
+                return True
+        return False
+
     def check_software(self, software_name, fuzzy=True):
         """
         Check if specified software is installed on the computer
@@ -452,7 +960,7 @@ class AutoGUIController:
                     print(f"[V] File found: {target_path}")
                     return True
 
-            time.sleep(interval)
+            self.wait(interval)
 
             elapsed = time.time() - start
             remaining = timeout - elapsed
@@ -460,6 +968,8 @@ class AutoGUIController:
                 print(f"Still waiting... {int(remaining)}s remaining")
 
         print(f"[X] Timeout: {target_path} not found")
+        if is_image:
+            self.dump_frame_history(f"Timeout after {timeout}s waiting for image: {target_path}", target_path)
         return False
 
 
@@ -506,7 +1016,7 @@ class AutoGUIController:
             if elapsed % 5 == 0 and elapsed > 0:
                 print(f"Still waiting... {timeout - elapsed}s remaining")
 
-            time.sleep(interval)
+            self.wait(interval)
 
         print(f"[X] Timeout: Process '{process_name}' not found within {timeout}s")
         return False
@@ -521,7 +1031,7 @@ class AutoGUIController:
         grayscale=True,
     ):
         # 擷取螢幕並轉為灰階圖
-        screenshot = pyautogui.screenshot()
+        screenshot = self.capture_screen()
         screenshot_np = np.array(screenshot)
 
         if grayscale:
@@ -591,6 +1101,26 @@ class AutoGUIController:
         else:
             # print(f"[X] 找不到符合門檻 ({confidence}) 的匹配，最高為 {best_confidence:.3f}")
             return None
+    def show_match_overlay(self, image_path, location):
+        """
+        Draw a found match on the frame it was found in, without blocking
+
+        Uses the cached frame of the lookup (no second capture). Without a
+        configured overlay the annotated frames go to the log folder.
+        """
+        frame = self._frame_cache
+        if frame is None:
+            return
+        if self.overlay is None:
+            from falconCapture import MatchOverlay
+
+            today = datetime.datetime.now().strftime("%Y-%m-%d")
+            self.overlay = MatchOverlay(Path(f"C:/Falcon_Log/{today}") / "overlay")
+        # location is in screen coordinates, the frame may start elsewhere (--monitors)
+        origin = frame.get("origin", (0, 0))
+        rect = (location["left"] - origin[0], location["top"] - origin[1], location["width"], location["height"])
+        self.overlay.submit(frame["image"], rect, location.get("confidence"), Path(image_path).name)
+
     def locate_image(self, image_path, confidence=0.9, timeout=60, show_location=False):
         """
         Locate image on screen, using enhanced automatic scaling handling
@@ -611,10 +1141,13 @@ class AutoGUIController:
                     )
                     if not location:
                         print(f"[Failed] Image not found (immediate check): {image_path}")
+                        self.dump_frame_history(f"Image not found (immediate check): {image_path}", image_path)
                         return None
                     else:
                         center_x = location["left"] + location["width"] // 2
                         center_y = location["top"] + location["height"] // 2
+                        if show_location or self.overlay is not None:
+                            self.show_match_overlay(image_path, location)
                         return center_x, center_y
                 except Exception as e:
                     print(f"[Error] Error locating image: {str(e)}")
@@ -630,69 +1163,98 @@ class AutoGUIController:
                             center_x = location["left"] + location["width"] // 2
                             center_y = location["top"] + location["height"] // 2
                             
-                            if show_location:
-                                try:
-                                    from PIL import ImageDraw, ImageGrab
-                                    # Screen capture
-                                    screen = ImageGrab.grab()
-                                    draw = ImageDraw.Draw(screen)
-                                    # Draw box and center point
-                                    draw.rectangle(
-                                        [
-                                            location["left"],
-                                            location["top"],
-                                            location["left"] + location["width"],
-                                            location["top"] + location["height"],
-                                        ],
-                                        outline="red",
-                                    )
-                                    draw.line(
-                                        [center_x - 10, center_y, center_x + 10, center_y],
-                                        fill="red",
-                                    )
-                                    draw.line(
-                                        [center_x, center_y - 10, center_x, center_y + 10],
-                                        fill="red",
-                                    )
-                                    # Display image
-                                    screen.show()
-                                except ImportError:
-                                    print("[Warning] Pillow package not installed. Cannot show location.")
-                                    
+                            if show_location or self.overlay is not None:
+                                self.show_match_overlay(image_path, location)
+
                             return center_x, center_y
 
                         elapsed = time.time() - start_time
                         if elapsed > effective_timeout:
                             print(f"[Failed] Timeout after {elapsed:.1f}s: Image not found: {image_path}")
+                            self.dump_frame_history(
+                                f"Timeout after {elapsed:.1f}s: Image not found: {image_path}", image_path
+                            )
                             return None
                             
                         if int(elapsed) % 5 == 0 and elapsed > 0:  # Show progress every 5 seconds
                             remaining = effective_timeout - elapsed
                             print(f"Still searching... {int(remaining)}s remaining")
-                            time.sleep(0.5)
+                            self.wait(0.5)
                             
-                        time.sleep(0.5)
+                        self.wait(0.5)
 
                     except Exception as e:
                         print(f"[Error] Error during image search: {str(e)}")
                         if time.time() - start_time > effective_timeout:
                             print(f"[Error] Search timed out after error")
                             return None
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         continue
 
         except Exception as e:
             raise Exception(f"Error processing image: {str(e)}")
+
+    def find_all_images(self, image_path, confidence=0.9, timeout=None, min_count=1):
+        """
+        Find every occurrence of an image, waiting until at least min_count are on screen
+
+        :param timeout: Seconds to wait (None: 10 like locate_image, 0: check once)
+        :return: List of location dictionaries ordered top to bottom, left to right;
+                 shorter than min_count after a timeout
+        """
+        if not Path(image_path).exists():
+            raise FileNotFoundError(f"Image file not found: {image_path}")
+
+        effective_timeout = 10 if timeout is None else timeout
+        start_time = time.time()
+        while True:
+            matches = self.locate_all_images(image_path, confidence=confidence)
+            if len(matches) >= min_count:
+                return matches
+            elapsed = time.time() - start_time
+            if elapsed >= effective_timeout:
+                reason = f"Found {len(matches)} of {min_count} required matches after {elapsed:.1f}s: {image_path}"
+                print(f"[Failed] {reason}")
+                self.dump_frame_history(reason, image_path)
+                return matches
+            self.wait(0.5)
+
+    def locate_image_index(self, image_path, index, confidence=0.9, timeout=60, show_location=False):
+        """
+        Locate the index-th occurrence of an image
+
+        :param index: 1-based position in reading order (top to bottom, left to right);
+                      negative values count from the last match
+        :return: Center (x, y) of that match, or None
+        """
+        if index == 0:
+            raise ValueError("--index is 1-based, use 1 for the first match or -1 for the last")
+        matches = self.find_all_images(image_path, confidence, timeout, min_count=abs(index))
+        if len(matches) < abs(index):
+            return None
+        location = matches[index - 1 if index > 0 else index]
+        print(f"Using match {index} of {len(matches)} with confidence {location['confidence']:.3f}")
+        if show_location or self.overlay is not None:
+            self.show_match_overlay(image_path, location)
+        return location["left"] + location["width"] // 2, location["top"] + location["height"] // 2
+
     def locate_and_click_image(
-        self, image_path, confidence=0.9, timeout=60, show_location=False
+        self, image_path, confidence=0.9, timeout=60, show_location=False, index=None
     ):
         """
         Position the image and click its center
+
+        :param index: Click the index-th occurrence instead of the best match (see locate_image_index)
         """
         try:
-            image_laoc = self.locate_image(
-                image_path, confidence, timeout, show_location
-            )
+            if index is not None:
+                image_laoc = self.locate_image_index(
+                    image_path, index, confidence, timeout, show_location
+                )
+            else:
+                image_laoc = self.locate_image(
+                    image_path, confidence, timeout, show_location
+                )
             if image_laoc != None:
                 pyautogui.click(image_laoc[0], image_laoc[1])
             return image_laoc
@@ -722,7 +1284,7 @@ class AutoGUIController:
                             f"Could not find image within {timeout} seconds"
                         )
 
-                    time.sleep(0.5)
+                    self.wait(0.5)
 
                 except TimeoutError:
                     raise
@@ -789,15 +1351,20 @@ class AutoGUIController:
             raise e
 
     def locate_and_right_click_image(
-        self, image_path, confidence=0.9, timeout=60, show_location=False
+        self, image_path, confidence=0.9, timeout=60, show_location=False, index=None
     ):
         """
         Position the image and click its center
         """
         try:
-            image_laoc = self.locate_image(
-                image_path, confidence, timeout, show_location
-            )
+            if index is not None:
+                image_laoc = self.locate_image_index(
+                    image_path, index, confidence, timeout, show_location
+                )
+            else:
+                image_laoc = self.locate_image(
+                    image_path, confidence, timeout, show_location
+                )
             if image_laoc != None:
                 pyautogui.rightClick(x=image_laoc[0], y=image_laoc[1])
             return image_laoc
@@ -827,7 +1394,7 @@ class AutoGUIController:
                             f"Could not find image within {timeout} seconds"
                         )
 
-                    time.sleep(0.5)
+                    self.wait(0.5)
 
                 except TimeoutError:
                     raise
@@ -894,7 +1461,7 @@ class AutoGUIController:
             raise e
 
     def locate_and_double_click_image(
-        self, image_path, confidence=0.9, timeout=60, show_location=False
+        self, image_path, confidence=0.9, timeout=60, show_location=False, index=None
     ):
         """
         Locate the image and double-click its center point
@@ -904,14 +1471,20 @@ class AutoGUIController:
         confidence (float): confidence of the image match (0-1)
         timeout (float): The timeout for finding the image (in seconds). None means returning immediately.
         show_location (bool): whether to show the found location
+        index (int): 1-based occurrence to double-click instead of the best match
 
         Returns:
         tuple: image center coordinates (x, y), returns None if not found
         """
         try:
-            image_laoc = self.locate_image(
-                image_path, confidence, timeout, show_location
-            )
+            if index is not None:
+                image_laoc = self.locate_image_index(
+                    image_path, index, confidence, timeout, show_location
+                )
+            else:
+                image_laoc = self.locate_image(
+                    image_path, confidence, timeout, show_location
+                )
             if image_laoc != None:
                 pyautogui.doubleClick(image_laoc[0], image_laoc[1], interval=0.1)
             return image_laoc
@@ -938,7 +1511,7 @@ class AutoGUIController:
                             f"Could not find image within {timeout} seconds"
                         )
 
-                    time.sleep(0.5)
+                    self.wait(0.5)
 
                 except TimeoutError:
                     raise
@@ -1001,6 +1574,7 @@ class AutoGUIController:
         scale_range=(0.3, 3.5),  # Expanded range to support scaling from 100% to 350%
         confidence=0.9,
         grayscale=True,
+        max_frame_age=0.0,
     ):
         """
         Enhanced image location function that automatically adapts to different screen scaling ratios
@@ -1009,66 +1583,378 @@ class AutoGUIController:
         :param scale_range: Scaling search range
         :param confidence: Minimum confidence threshold (0-1)
         :param grayscale: Whether to convert to grayscale image
+        :param max_frame_age: Reuse the cached capture (and its match results) if it is at most
+                              this many seconds old; 0 always captures a new frame
         :return: Location dictionary or None if not found
         """
-        # Capture screenshot and convert to numpy array
-        screenshot = pyautogui.screenshot()
-        screenshot_np = np.array(screenshot)
-        
-        # Convert to grayscale if requested (improves matching speed and accuracy)
-        if grayscale:
-            screenshot_np = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2GRAY)
-        
-        # Read template image
-        template = cv2.imread(template_path, 0 if grayscale else 1)
-        if template is None:
+        frame = self.grab_frame(max_frame_age)
+
+        # The same lookup on the same frame is answered from the cache
+        cache_key = (
+            template_path, tuple(scale_range), confidence, grayscale, self.color_tolerance, self.match_engine
+        )
+        if cache_key in frame["matches"]:
+            return self.to_screen(frame, frame["matches"][cache_key])
+
+        location = self._lookup_in_frame(frame, template_path, scale_range, confidence, grayscale)
+        frame["matches"][cache_key] = location
+        return self.to_screen(frame, location)
+
+    def locate_all_images(
+        self,
+        template_path,
+        scale_range=(0.3, 3.5),
+        confidence=0.9,
+        grayscale=True,
+        max_frame_age=0.0,
+        overlap=0.3,
+    ):
+        """
+        Find every occurrence of an image on one captured frame
+
+        The scale is found by the same multi-scale search as
+        locate_image_multi_scale_auto; the result map of the matching scale is
+        kept and all its peaks above confidence are extracted with non-maximum
+        suppression, so no scale is matched twice.
+
+        :param overlap: Maximum intersection over union of two reported matches
+        :return: List of location dictionaries ordered top to bottom, left to right
+        """
+        from falconMatch import color_difference, load_template, nms_matches, sort_by_position
+
+        frame = self.grab_frame(max_frame_age)
+        tolerance = self.color_tolerance
+        cache_key = (
+            "all", template_path, tuple(scale_range), confidence, grayscale, tolerance, self.match_engine, overlap
+        )
+        if cache_key in frame["matches"]:
+            return [self.to_screen(frame, match) for match in frame["matches"][cache_key]]
+
+        maps = []
+        location = self._lookup_in_frame(frame, template_path, scale_range, confidence, grayscale, maps)
+        matches = []
+        for scale, result, shape in maps:
+            h, w = shape[:2]
+            if tolerance is not None:
+                template = load_template(template_path)
+                template_rgb = cv2.resize(template["color"], (w, h), interpolation=cv2.INTER_LINEAR)
+                frame_rgb = self.frame_array(frame, grayscale=False)
+            for x, y, value in nms_matches(result, confidence, (w, h), overlap):
+                if tolerance is not None and color_difference(
+                    frame_rgb, template_rgb, template["mask"], x, y
+                ) > tolerance:
+                    continue
+                matches.append({
+                    "left": x, "top": y, "width": w, "height": h,
+                    "confidence": value, "scale": float(scale),
+                })
+        matches = sort_by_position(matches)
+        frame["matches"][cache_key] = matches
+        # The single best match of this frame is known now as well
+        frame["matches"].setdefault(
+            (template_path, tuple(scale_range), confidence, grayscale, tolerance, self.match_engine), location
+        )
+        return [self.to_screen(frame, match) for match in matches]
+
+    def _lookup_in_frame(self, frame, template_path, scale_range, confidence, grayscale, maps=None):
+        """Run one multi-scale search on a frame with diagnostics, debugger and forensics bookkeeping"""
+        self._best_miss = None
+        screenshot_np = self.frame_array(frame, grayscale)
+        record = None
+        if self.diagnostics is not None:
+            record = self.diagnostics.begin(template_path, confidence, screenshot_np.shape)
+        color = None
+        if self.color_tolerance is not None:
+            color = (self.frame_array(frame, grayscale=False), self.color_tolerance)
+        spectrum = self.frame_matcher(frame, grayscale, reuse=record is None and maps is None)
+        use_scales = True
+        location = None
+        if maps is None:
+            location = self._locate_at_last_hit(
+                screenshot_np, template_path, scale_range, confidence, grayscale, record, color
+            )
+            use_scales = location is None
+        if use_scales and self.match_engine != "template":
+            location, use_scales = self._locate_with_features(
+                frame, screenshot_np, template_path, confidence, grayscale, record, maps, color, spectrum
+            )
+        if use_scales and record is None and maps is None and self._prefetch is not None:
+            prefetched = self._take_prefetch(
+                frame, (template_path, tuple(scale_range), confidence, grayscale, self.color_tolerance, self.match_engine)
+            )
+            if prefetched is not None:
+                location, use_scales = prefetched["location"], False
+                self._best_miss = prefetched["best_miss"]
+        # Diagnostics and find-all need the score maps, those lookups stay in this process
+        pooled = self.match_pool is not None and record is None and maps is None
+        if use_scales and pooled and not self.match_pool.split:
+            result = self.submit_lookup(frame, template_path, scale_range, confidence, grayscale).result()
+            print(result["output"], end="")
+            if not result["stale"]:
+                location, use_scales = result["location"], False
+                self._best_miss = result["best_miss"]
+        if use_scales:
+            scan = None
+            if pooled and self.match_pool.split:
+                # The ratios of this lookup are scored by all of the pool's workers
+                scan = functools.partial(
+                    self.match_pool.scan, self.share_frame(frame, grayscale), template_path, grayscale
+                )
+            location = self._locate_in_screenshot(
+                screenshot_np, template_path, scale_range, confidence, grayscale, record, maps, color, spectrum,
+                frame.get("scales"), scan,
+            )
+        if location is not None:
+            self._last_hits[(template_path, grayscale)] = (
+                location["left"], location["top"], location["width"], location["height"], location["scale"]
+            )
+        if record is not None:
+            self.diagnostics.end(record, location)
+        rect = location or self._best_miss
+        if self.frame_history is not None:
+            self.frame_history.annotate(
+                frame.get("history"), template_path,
+                (rect["left"], rect["top"], rect["width"], rect["height"]) if rect else None,
+                rect.get("confidence") if rect else None, location is not None,
+            )
+        self._record_match(template_path, confidence, self.to_screen(frame, rect), location is not None)
+        return location
+
+    # Commands whose image lookup start_prefetch() can run ahead of time, with the method run() calls
+    PREFETCH_COMMANDS = {
+        "--click-image": "locate_and_click_image",
+        "--double-click-image": "locate_and_double_click_image",
+        "--right-click-image": "locate_and_right_click_image",
+        "--search-image": "locate_image",
+        "--image-exists": "locate_image_multi_scale_auto",
+    }
+    # Longest wait (seconds) for a prefetched lookup still running when its command needs it
+    PREFETCH_WAIT = 1.0
+
+    def start_prefetch(self, cmd, state):
+        """
+        Start the image lookup of an upcoming command file command in the background
+
+        The lookup runs on its own capture while the script waits between
+        commands. _lookup_in_frame() takes the result when the command asks
+        for the same lookup and the screen has not changed since.
+
+        :param cmd: Argument list of the next command (or None)
+        """
+        if not cmd or cmd[0] not in self.PREFETCH_COMMANDS or self.diagnostics is not None:
+            return
+        # Replayed frames must be consumed by the commands themselves
+        if self.screen_source is not None:
+            return
+        if self._prefetch is not None and not self._prefetch["future"].done():
+            return
+        key = tuple(cmd)
+        args = state["parsed"].get(key)
+        if args is None:
+            try:
+                # A malformed line reports its error when it is reached, not here
+                with capture_thread_output(io.StringIO()):
+                    args = self.parser.parse_args(cmd)
+            except SystemExit:
+                return
+            state["parsed"][key] = args
+        if args.index is not None or args.match_engine != "template":
+            return
+        # The command switches to its own screen source, the prefetch would search the wrong frames
+        if args.replay_frames or args.monitors:
+            return
+        lookup = self._command_lookup(cmd[0], args)
+        if not Path(lookup[0]).exists():
+            return
+        if self._prefetch_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="falcon-prefetch")
+        self._prefetch = {"key": lookup, "future": self._prefetch_executor.submit(self._prefetch_lookup, lookup)}
+
+    def _command_lookup(self, command, args):
+        """
+        Lookup key (as built by locate_image_multi_scale_auto) of an image command's parsed arguments
+
+        Parameters the command line does not set are the defaults of the
+        method run() calls for the command.
+        """
+        method = inspect.signature(getattr(self, self.PREFETCH_COMMANDS[command])).parameters
+        auto = inspect.signature(self.locate_image_multi_scale_auto).parameters
+        return (
+            getattr(args, command[2:].replace("-", "_")).strip('"\''),
+            tuple(auto["scale_range"].default),
+            method["confidence"].default,
+            auto["grayscale"].default,
+            args.match_color,
+            args.match_engine,
+        )
+
+    def _prefetch_lookup(self, lookup):
+        """Background part of start_prefetch(): capture and search without touching this controller's state"""
+        template_path, scale_range, confidence, grayscale, color_tolerance, _ = lookup
+        helper = self._prefetch_controller
+        if helper is None:
+            helper = self._prefetch_controller = AutoGUIController()
+            helper.frame_history = None
+        # Same tiling as the command's own lookup (the helper keeps its own tile buffer)
+        helper.match_tile_size = self.match_tile_size
+        frame = {
+            "image": self.capture_screen(), "time": time.perf_counter(), "arrays": {}, "matches": {},
+            "origin": (0, 0), "scales": None,
+        }
+        gray = helper.frame_array(frame, grayscale=True)
+        color = (helper.frame_array(frame, grayscale=False), color_tolerance) if color_tolerance is not None else None
+        output = io.StringIO()
+        helper._best_miss = None
+        with capture_thread_output(output):
+            location = helper._locate_in_screenshot(
+                helper.frame_array(frame, grayscale), template_path, scale_range, confidence, grayscale,
+                color=color, spectrum=helper.frame_matcher(frame, grayscale),
+            )
+        return {"gray": gray, "location": location, "best_miss": helper._best_miss, "output": output.getvalue()}
+
+    def _take_prefetch(self, frame, lookup):
+        """
+        Result of a prefetched lookup for this frame, or None
+
+        The prefetch is used when it was for the same lookup, finishes within
+        PREFETCH_WAIT seconds, and a frame diff shows the screen unchanged
+        since its capture (see falconMatch.frames_differ). A running prefetch
+        is already part way through the search this frame would need.
+        """
+        from falconMatch import frames_differ
+
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch["key"] != lookup:
+            return None
+        deadline = time.perf_counter() + self.PREFETCH_WAIT
+        while not prefetch["future"].done() and time.perf_counter() < deadline:
+            self.wait(0.005)
+        if not prefetch["future"].done():
+            prefetch["future"].cancel()
+            print("[prefetch] Prefetched lookup still running, searching this frame")
+            return None
+        try:
+            result = prefetch["future"].result()
+        except Exception as e:
+            print(f"[Warning] Prefetched image lookup failed: {str(e)}")
+            return None
+        location = result["location"]
+        rect = (location["left"], location["top"], location["width"], location["height"]) if location else None
+        if frames_differ(result["gray"], self.frame_array(frame, grayscale=True), rect):
+            print("[prefetch] Screen changed since the prefetched lookup, searching again")
+            return None
+        print(result["output"], end="")
+        print("[prefetch] Using the lookup started before this command")
+        return result
+
+    def _record_match(self, template_path, confidence, rect, found):
+        """Remember the latest lookup (or its best miss) for the debugger inspector"""
+        self.last_match = {
+            "template": template_path,
+            "found": found,
+            "threshold": confidence,
+            "confidence": rect.get("confidence") if rect else None,
+            "scale": rect.get("scale") if rect else None,
+            "rect": (rect["left"], rect["top"], rect["width"], rect["height"]) if rect else None,
+            "time": datetime.datetime.now().strftime("%H:%M:%S"),
+        }
+
+    def _locate_in_screenshot(
+        self, screenshot_np, template_path, scale_range, confidence, grayscale,
+        record=None, maps=None, color=None, spectrum=None, seed_scales=None, scan=None,
+    ):
+        """
+        Multi-scale search of template_path in an already captured screenshot array
+
+        Transparent pixels of a PNG template are left out of the comparison.
+
+        :param record: Optional falconMatch.LookupRecord collecting per-scale diagnostics
+        :param maps: Optional list receiving (scale, result map, template shape) of every
+                     scale that reached the threshold, for finding all occurrences
+        :param color: Optional (RGB frame array, tolerance); a grayscale match must then
+                      also have the template's colors (see _verify_match_color)
+        :param spectrum: Optional falconMatch.FrameSpectrum of screenshot_np, large templates
+                         are then correlated in the frequency domain
+        :param seed_scales: Ratios tried before the common ones, e.g. the DPI ratios of
+                            the captured monitors
+        :param scan: Optional callable(scales, factor, confidence) scoring ratios in other
+                     processes (falconPool.MatchPool.scan); it returns None when the frame
+                     changed meanwhile, those ratios are then matched here
+        """
+        from falconMatch import (
+            COMMON_SCALES, coarse_peaks, coarse_scale_grid, coarse_scan, golden_section_max, load_template,
+            match_template, reduce_factor, resize_template,
+        )
+
+        # Read template image (cached, with its transparency mask)
+        loaded = load_template(template_path)
+        if loaded is None:
             print(f"[X] Cannot read image: {template_path}")
             return None
+        template = loaded["gray"] if grayscale else loaded["color"]
+        mask = loaded["mask"]
         
         # Initialize best match tracking variables
-        best_match = None
+        best_shape = None
         best_confidence = 0
         best_scale = 1.0
         best_position = None
         
         # First try common scaling ratios (optimize performance)
-        common_scales = [1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 3.0]
-        # Sort common scales in ascending order
-        common_scales.sort()
+        common_scales = sorted(COMMON_SCALES)
+        if seed_scales:
+            # The monitor's own DPI ratio is the most likely one
+            common_scales = list(seed_scales) + [s for s in common_scales if s not in seed_scales]
         
         # Match process tracking variables
         found_common_match = False
-        confidence_trend = []  # Track confidence trend changes
-        fine_scales = []  # Initialize fine_scales for later use
         
         # Check common scaling ratios first
         print(f"Trying common scaling ratios...")
+        if record is not None:
+            record.phase("common")
+        # Ratios scored by the match pool: scale -> (confidence, location, template shape)
+        scanned = {}
+        if scan is not None:
+            in_range = [s for s in common_scales if scale_range[0] <= s <= scale_range[1]]
+            for scale, max_val, max_loc, shape in scan(in_range, None, confidence) or []:
+                # The color check needs the score map, such a hit is matched again here
+                if max_val < confidence or color is None:
+                    scanned[scale] = (max_val, max_loc, shape)
         for scale in common_scales:
             if scale < scale_range[0] or scale > scale_range[1]:
                 continue
-                
-            # Resize template based on scale
-            resized_template = cv2.resize(
-                template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
-            )
-            
-            # Skip if template is larger than screenshot
-            if (resized_template.shape[0] > screenshot_np.shape[0] or 
-                resized_template.shape[1] > screenshot_np.shape[1]):
-                continue
-            
-            # Perform template matching
-            result = cv2.matchTemplate(
-                screenshot_np, resized_template, cv2.TM_CCOEFF_NORMED
-            )
-            _, max_val, _, max_loc = cv2.minMaxLoc(result)
-            
-            # Record confidence trend
-            confidence_trend.append(max_val)
+            if scale in scanned:
+                max_val, max_loc, shape = scanned[scale]
+            else:
+                # Resize template based on scale (precomputed when it comes from a template pack)
+                resized_template = resize_template(loaded, scale, grayscale)
+                shape = resized_template.shape
+
+                # Skip if template is larger than screenshot
+                if (resized_template.shape[0] > screenshot_np.shape[0] or
+                    resized_template.shape[1] > screenshot_np.shape[1]):
+                    continue
+
+                # Perform template matching
+                result = match_template(screenshot_np, resized_template, mask, spectrum)
+                _, max_val, _, max_loc = cv2.minMaxLoc(result)
+                if record is not None:
+                    record.add(scale, max_val, result, resized_template.shape)
+                if maps is not None and max_val >= confidence:
+                    maps.append((scale, result, resized_template.shape))
+                if max_val >= confidence and color is not None:
+                    max_loc, max_val = self._verify_match_color(
+                        color, loaded, result, max_loc, resized_template.shape, scale, confidence
+                    )
+                    if max_loc is None:
+                        return None
             
             # If above confidence threshold, return immediately
             if max_val >= confidence:
-                h, w = resized_template.shape[:2]
+                h, w = shape[:2]
                 print(f"Match found at common ratio {scale:.2f} with confidence {max_val:.3f}")
                 found_common_match = True
                 center_x = max_loc[0] + w // 2
@@ -1079,140 +1965,313 @@ class AutoGUIController:
                     "top": max_loc[1],
                     "width": w,
                     "height": h,
+                    "confidence": float(max_val),
+                    "scale": float(scale),
                 }
                 
             # Update best match if better
             if max_val > best_confidence:
                 best_confidence = max_val
                 best_position = max_loc
-                best_match = resized_template
+                best_shape = shape
                 best_scale = scale
         
-        # If no match found, try to optimize search range based on confidence trend
-        if best_confidence > 0:
-            # Find the scale index with highest confidence
-            if confidence_trend:
-                peak_idx = confidence_trend.index(max(confidence_trend))
-                peak_scale = common_scales[peak_idx]
-                
-                # Narrow search range around peak
-                min_scale = max(scale_range[0], peak_scale * 0.6)
-                max_scale = min(scale_range[1], peak_scale * 1.4)
-                
-                # Search more precisely around peak
-                print(f"Searching for more precise ratio around peak {peak_scale:.2f} ({min_scale:.2f}-{max_scale:.2f})...")
-                
-                # Add more ratios around the peak
-                fine_scales = np.linspace(min_scale, max_scale, 20)
-                
-                for scale in fine_scales:
-                    # Avoid rechecking already tested scales
-                    if scale in common_scales:
-                        continue
-                        
-                    # Resize template based on scale
-                    resized_template = cv2.resize(
-                        template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
-                    )
-                    
-                    # Skip if template is larger than screenshot
-                    if (resized_template.shape[0] > screenshot_np.shape[0] or 
-                        resized_template.shape[1] > screenshot_np.shape[1]):
-                        continue
-                    
-                    # Perform template matching
-                    result = cv2.matchTemplate(
-                        screenshot_np, resized_template, cv2.TM_CCOEFF_NORMED
-                    )
-                    _, max_val, _, max_loc = cv2.minMaxLoc(result)
-                    
-                    # If confidence above threshold, return immediately
-                    if max_val >= confidence:
-                        h, w = resized_template.shape[:2]
-                        print(f"Match found at precise ratio {scale:.2f} with confidence {max_val:.3f}")
-                        return {
-                            "left": max_loc[0],
-                            "top": max_loc[1],
-                            "width": w,
-                            "height": h,
-                        }
-                    
-                    # Update best match if better
-                    if max_val > best_confidence:
-                        best_confidence = max_val
-                        best_position = max_loc
-                        best_match = resized_template
-                        best_scale = scale
-        
-        # If no match found meeting threshold, but have close match, accept best match with lower threshold
-        # This is particularly useful for images in different scaling environments
-        # if best_confidence >= (confidence * 0.85):  # Allow match slightly below threshold
-        #     h, w = best_match.shape[:2]
-        #     print(f"Accepting second-best match, ratio {best_scale:.2f}, confidence {best_confidence:.3f} (threshold is {confidence})")
-        #     return {
-        #         "left": best_position[0],
-        #         "top": best_position[1],
-        #         "width": w,
-        #         "height": h,
-        #     }
-        
-        # If even best match isn't good enough, do full range search
-        if best_confidence < (confidence * 0.7):
-            print(f"Trying full range search...")
-            # Search with coarser step size over entire range
-            step = 0.1  # Larger step size for performance
-            for scale in np.arange(scale_range[0], scale_range[1], step):
-                # Avoid rechecking already tested scales
-                if scale in common_scales or any(abs(scale - fs) < 0.05 for fs in fine_scales):
-                    continue
-                    
-                # Resize template based on scale
-                resized_template = cv2.resize(
-                    template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
-                )
-                
-                # Skip if template is larger than screenshot
-                if (resized_template.shape[0] > screenshot_np.shape[0] or 
-                    resized_template.shape[1] > screenshot_np.shape[1]):
-                    continue
-                
-                # Perform template matching
-                result = cv2.matchTemplate(
-                    screenshot_np, resized_template, cv2.TM_CCOEFF_NORMED
+        # Not found at a common ratio: bracket the confidence peaks over the whole range
+        # on a reduced resolution copy, then refine the best ones with golden-section search
+        factor = reduce_factor(template.shape)
+        print(f"Scanning ratios {scale_range[0]:.2f}-{scale_range[1]:.2f} at {factor:.0%} resolution...")
+        if record is not None:
+            record.phase("coarse")
+        grid_scales = coarse_scale_grid(scale_range, template.shape, factor)
+        scores = scan(grid_scales, factor, None) if scan is not None else None
+        if scores is None:
+            if factor < 1.0:
+                small_screenshot = cv2.resize(screenshot_np, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+            else:
+                small_screenshot = screenshot_np
+            scores = coarse_scan(small_screenshot, template, mask, grid_scales, factor)
+        grid = []
+        coarse = []
+        for scale, max_val, shape in scores:
+            if record is not None:
+                record.add(scale, max_val, None, shape)
+            grid.append(scale)
+            coarse.append(max_val)
+
+        found = None
+        rejected = False
+
+        def try_scale(scale):
+            """Full resolution match at one ratio; sets found when it reaches the threshold"""
+            nonlocal found, rejected, best_confidence, best_position, best_shape, best_scale
+            resized_template = cv2.resize(
+                template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
+            )
+            if (resized_template.shape[0] > screenshot_np.shape[0] or
+                resized_template.shape[1] > screenshot_np.shape[1]):
+                return -1.0
+            result = match_template(screenshot_np, resized_template, mask, spectrum)
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            if record is not None:
+                record.add(scale, max_val, result, resized_template.shape)
+            if maps is not None and max_val >= confidence:
+                maps.append((scale, result, resized_template.shape))
+            if max_val >= confidence and color is not None:
+                max_loc, max_val = self._verify_match_color(
+                    color, loaded, result, max_loc, resized_template.shape, scale, confidence
                 )
-                _, max_val, _, max_loc = cv2.minMaxLoc(result)
-                
-                # If confidence above threshold, return immediately
-                if max_val >= confidence:
-                    h, w = resized_template.shape[:2]
-                    print(f"Match found in full range search, ratio {scale:.2f}, confidence {max_val:.3f}")
-                    return {
-                        "left": max_loc[0],
-                        "top": max_loc[1],
-                        "width": w,
-                        "height": h,
-                    }
-                    
-                # Update best match if better
-                if max_val > best_confidence:
-                    best_confidence = max_val
-                    best_position = max_loc
-                    best_match = resized_template
-                    best_scale = scale
-        
+                if max_loc is None:
+                    rejected = True
+                    return max_val
+            if max_val >= confidence:
+                h, w = resized_template.shape[:2]
+                print(f"Match found at precise ratio {scale:.3f} with confidence {max_val:.3f}")
+                found = {
+                    "left": max_loc[0],
+                    "top": max_loc[1],
+                    "width": w,
+                    "height": h,
+                    "confidence": float(max_val),
+                    "scale": float(scale),
+                }
+            if max_val > best_confidence:
+                best_confidence = max_val
+                best_position = max_loc
+                best_shape = resized_template.shape
+                best_scale = scale
+            return max_val
+
+        if record is not None:
+            record.phase("golden")
+        # Half a pixel of movement at the template's edges
+        tolerance = min(0.05, max(0.002, 1.0 / max(template.shape[:2])))
+        for index in coarse_peaks(coarse, 2):
+            low = grid[max(0, index - 1)]
+            high = grid[min(len(grid) - 1, index + 1)]
+            print(f"Refining ratio between {low:.2f} and {high:.2f} (peak {coarse[index]:.3f})...")
+            golden_section_max(
+                try_scale, low, high, tolerance, stop=lambda value: found is not None or rejected
+            )
+            if found is not None:
+                return found
+            if rejected:
+                return None
+
         # Final check - return best match if good enough
         if best_confidence >= confidence:
-            h, w = best_match.shape[:2]
+            h, w = best_shape[:2]
             print(f"Final match, ratio {best_scale:.2f}, confidence {best_confidence:.3f}")
             return {
                 "left": best_position[0],
                 "top": best_position[1],
                 "width": w,
                 "height": h,
+                "confidence": float(best_confidence),
+                "scale": float(best_scale),
             }
         else:
             print(f"[X] No match found meeting confidence threshold ({confidence}), best: {best_confidence:.3f}")
+            if best_shape is not None:
+                h, w = best_shape[:2]
+                self._best_miss = {
+                    "left": best_position[0],
+                    "top": best_position[1],
+                    "width": w,
+                    "height": h,
+                    "confidence": float(best_confidence),
+                    "scale": float(best_scale),
+                }
             return None
+
+    def _locate_with_features(
+        self, frame, screenshot_np, template_path, confidence, grayscale,
+        record=None, maps=None, color=None, spectrum=None,
+    ):
+        """
+        Locate a template with the keypoint engine selected by --match-engine
+
+        Keypoints give the scale and position; matchTemplate then only
+        verifies that estimate (at the estimated scale and 3% around it,
+        inside a small region), so the cost does not depend on the scale range.
+
+        :return: (location or None, True when the template has too few keypoints
+                 and the multi-scale search has to be used instead)
+        """
+        from falconMatch import FeatureMatcher, color_difference, load_template, match_template
+
+        loaded = load_template(template_path)
+        if loaded is None:
+            print(f"[X] Cannot read image: {template_path}")
+            return None, False
+        matcher = self._feature_matchers.get(self.match_engine)
+        if matcher is None:
+            matcher = self._feature_matchers[self.match_engine] = FeatureMatcher(self.match_engine)
+
+        if record is not None:
+            record.phase("features")
+        estimate = matcher.estimate(
+            matcher.template_features(template_path, loaded),
+            matcher.frame_features(frame, self.frame_array(frame, grayscale=True)),
+            loaded["gray"].shape,
+        )
+        if estimate is not None and "error" in estimate:
+            print(
+                f"[Warning] {Path(template_path).name} has too few keypoints for the "
+                f"{self.match_engine} engine, using the scale search"
+            )
+            return None, True
+        if estimate is None:
+            print(f"[X] No {self.match_engine} keypoint match for: {template_path}")
+            return None, False
+        print(
+            f"Keypoints place the image at ({estimate['left']}, {estimate['top']}), "
+            f"ratio {estimate['scale']:.2f}, {estimate['inliers']} inliers"
+        )
+
+        template = loaded["gray"] if grayscale else loaded["color"]
+        best = None
+        for scale in (estimate["scale"], estimate["scale"] * 0.97, estimate["scale"] * 1.03):
+            resized_template = cv2.resize(
+                template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
+            )
+            h, w = resized_template.shape[:2]
+            pad = max(8, w // 4, h // 4)
+            x0 = max(0, estimate["left"] - pad)
+            y0 = max(0, estimate["top"] - pad)
+            region = screenshot_np[y0:estimate["top"] + h + pad, x0:estimate["left"] + w + pad]
+            if region.shape[0] < h or region.shape[1] < w:
+                continue
+            result = match_template(region, resized_template, loaded["mask"])
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            if record is not None:
+                record.add(scale, max_val, result, resized_template.shape, (x0, y0))
+            if best is None or max_val > best[0]:
+                best = (max_val, x0 + max_loc[0], y0 + max_loc[1], w, h, scale)
+            if max_val >= confidence:
+                break
+        if best is None:
+            print(f"[X] Keypoint estimate for {template_path} lies outside the screen")
+            return None, False
+
+        value, x, y, w, h, scale = best
+        location = {
+            "left": x, "top": y, "width": w, "height": h,
+            "confidence": float(value), "scale": float(scale),
+        }
+        if value < confidence:
+            print(f"[X] Keypoint estimate not confirmed, confidence {value:.3f} below threshold ({confidence})")
+            self._best_miss = location
+            return None, False
+        if color is not None:
+            frame_rgb, tolerance = color
+            template_rgb = cv2.resize(loaded["color"], (w, h), interpolation=cv2.INTER_LINEAR)
+            difference = color_difference(frame_rgb, template_rgb, loaded["mask"], x, y)
+            if difference > tolerance:
+                print(
+                    f"[X] Match at ratio {scale:.2f} failed the color check "
+                    f"(difference {difference:.1f} > tolerance {tolerance:.1f})"
+                )
+                self._best_miss = location
+                return None, False
+        if maps is not None:
+            # --find-all: one full-frame pass at the confirmed scale
+            resized_template = cv2.resize(template, (w, h), interpolation=cv2.INTER_LINEAR)
+            result = match_template(screenshot_np, resized_template, loaded["mask"], spectrum)
+            maps.append((scale, result, resized_template.shape))
+        print(f"Match found by {self.match_engine} keypoints, ratio {scale:.2f}, confidence {value:.3f}")
+        return location, False
+
+    def _locate_at_last_hit(
+        self, screenshot_np, template_path, scale_range, confidence, grayscale, record=None, color=None
+    ):
+        """
+        Check whether a template is still where the previous lookup found it
+
+        One matchTemplate at the previous ratio over the previous rectangle
+        plus a few pixels, instead of a multi-scale search of the whole frame.
+
+        :return: Location dictionary, or None when the full search is needed
+        """
+        from falconMatch import color_difference, load_template, match_template, resize_template
+
+        last = self._last_hits.get((template_path, grayscale))
+        if last is None:
+            return None
+        left, top, width, height, scale = last
+        if not scale_range[0] <= scale <= scale_range[1]:
+            return None
+        loaded = load_template(template_path)
+        if loaded is None:
+            return None
+        if record is not None:
+            record.phase("last")
+        resized_template = resize_template(loaded, scale, grayscale)
+        h, w = resized_template.shape[:2]
+        pad = 4
+        x0 = max(0, left - pad)
+        y0 = max(0, top - pad)
+        region = screenshot_np[y0:top + h + pad, x0:left + w + pad]
+        if region.shape[0] < h or region.shape[1] < w:
+            del self._last_hits[(template_path, grayscale)]
+            return None
+        result = match_template(region, resized_template, loaded["mask"])
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if record is not None:
+            record.add(scale, max_val, result, resized_template.shape, (x0, y0))
+        x, y = x0 + max_loc[0], y0 + max_loc[1]
+        if max_val >= confidence and color is not None:
+            frame_rgb, tolerance = color
+            template_rgb = cv2.resize(loaded["color"], (w, h), interpolation=cv2.INTER_LINEAR)
+            if color_difference(frame_rgb, template_rgb, loaded["mask"], x, y) > tolerance:
+                max_val = 0.0
+        if max_val < confidence:
+            del self._last_hits[(template_path, grayscale)]
+            print("Image moved or changed since the last lookup, searching the whole screen...")
+            return None
+        print(f"Match confirmed at last known location, ratio {scale:.2f}, confidence {max_val:.3f}")
+        return {"left": x, "top": y, "width": w, "height": h, "confidence": float(max_val), "scale": float(scale)}
+
+    def _verify_match_color(self, color, template, result, max_loc, shape, scale, confidence):
+        """
+        Check that a grayscale match also has the colors of the template
+
+        Only the winner is checked (and, if it fails, the next few peaks of the
+        same result map), so the check costs a few small crops instead of a
+        color matchTemplate pass. A failed check ends the search: the shape was
+        found at this scale, the other scales would only find it again.
+
+        :param color: (RGB frame array, tolerance) as passed to _locate_in_screenshot
+        :return: (location, confidence) of the first peak with matching colors, or (None, confidence)
+        """
+        from falconMatch import color_difference, find_peaks
+
+        frame_rgb, tolerance = color
+        h, w = shape[:2]
+        template_rgb = cv2.resize(template["color"], (w, h), interpolation=cv2.INTER_LINEAR)
+        difference = color_difference(frame_rgb, template_rgb, template["mask"], max_loc[0], max_loc[1])
+        if difference <= tolerance:
+            return max_loc, float(result[max_loc[1], max_loc[0]])
+
+        best = (max_loc[0], max_loc[1], float(result[max_loc[1], max_loc[0]]), difference)
+        for x, y, value in find_peaks(result, 5, (w, h), min_value=confidence)[1:]:
+            peak_difference = color_difference(frame_rgb, template_rgb, template["mask"], x, y)
+            if peak_difference <= tolerance:
+                print(f"Best grayscale match has other colors, using peak ({x}, {y}) instead")
+                return (x, y), value
+            if peak_difference < best[3]:
+                best = (x, y, value, peak_difference)
+
+        x, y, value, difference = best
+        print(
+            f"[X] Match at ratio {scale:.2f} failed the color check "
+            f"(difference {difference:.1f} > tolerance {tolerance:.1f})"
+        )
+        self._best_miss = {
+            "left": x, "top": y, "width": w, "height": h,
+            "confidence": value, "scale": float(scale),
+        }
+        return None, value
+
     def execute_command_file(self, file_path, stop_on_error=True):
         """
         Execute the commands in the command file
@@ -1234,12 +2293,24 @@ class AutoGUIController:
             log_buffer.write(f"Date/Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             log_buffer.write(f"Screen Resolution: {screen_width}x{screen_height}\n")
             log_buffer.write(f"Display Scale Factor: {scale_factor:.2f} ({int(scale_factor*100)}%)\n")
+            try:
+                from falconCapture import list_monitors
+
+                monitors = list_monitors()
+                if len(monitors) > 1:
+                    for monitor in monitors:
+                        log_buffer.write(
+                            f"Monitor {monitor['index']}: {monitor['width']}x{monitor['height']} "
+                            f"at ({monitor['left']}, {monitor['top']}), scale {monitor['scale']:.2f}\n"
+                        )
+            except Exception as e:
+                log_buffer.write(f"Monitors: unknown ({str(e)})\n")
             log_buffer.write(f"Stop on Error: {stop_on_error}\n\n")
             log_buffer.write("=== Command Execution ===\n\n")
 
             with open(file_path, "r", encoding="utf-8") as file:
                 commands = []
-                for line in file:
+                for line_number, line in enumerate(file, start=1):
                     line_msg = f"Reading line: {line.strip()}"
                     log_buffer.write(line_msg + "\n")
 
@@ -1247,84 +2318,11 @@ class AutoGUIController:
                     line = line.strip()
                     if not line or line.startswith("#"):
                         continue
-                    # try:
-                    #     # Handling spaces between quotes
-                    #     parts = []
-                    #     current_part = ""
-                    #     in_quotes = False
-                    #     i = 0
-
-                    #     while i < len(line):
-                    #         char = line[i]
-                    #         # Handle escaped quotes (\")
-                    #         if (
-                    #             char == "\\"
-                    #             and i + 1 < len(line)
-                    #             and line[i + 1] == '"'
-                    #         ):
-                    #             current_part += '"'
-                    #             i += 2
-                    #             continue
-                    #         # Handling quotes
-                    #         if char == '"':
-                    #             in_quotes = not in_quotes
-                    #             i += 1
-                    #             continue
-                    #         # Handling space
-                    #         if char == " " and not in_quotes:
-                    #             if current_part:
-                    #                 parts.append(current_part)
-                    #                 current_part = ""
-                    #             i += 1
-                    #             continue
-                    #         # Add other characters to the current part
-                    #         current_part += char
-                    #         i += 1
-                    #     # Add the last part
-                    #     if current_part:
-                    #         parts.append(current_part)
-                    #     if parts:  # Make sure the command is parsed
-                    #         commands.append(parts)
                     try:
-                        # Handling spaces between quotes
-                        parts = []
-                        current_part = ""
-                        in_quotes = False
-                        i = 0
-
-                        while i < len(line):
-                            char = line[i]
-                            # Handle escaped quotes (\")
-                            if (
-                                char == "\\"
-                                and i + 1 < len(line)
-                                and line[i + 1] == '"'
-                            ):
-                                current_part += '"'
-                                i += 2
-                                continue
-                            # Handling quotes - 保持引號
-                            if char == '"':
-                                in_quotes = not in_quotes
-                                # Don't add quotes to the current_part
-                                i += 1
-                                continue
-                                continue
-                            # Handling space
-                            if char == " " and not in_quotes:
-                                if current_part:
-                                    parts.append(current_part)
-                                    current_part = ""
-                                i += 1
-                                continue
-                            # Add other characters to the current part
-                            current_part += char
-                            i += 1
-                        # Add the last part
-                        if current_part:
-                            parts.append(current_part)
+                        # Quote-aware split, quotes are removed and \" is a literal quote
+                        parts = tokenize_line(line)
                         if parts:  # Make sure the command is parsed
-                            commands.append(parts)
+                            commands.append((line_number, parts))
                     except Exception as e:
                         error_msg = f"[Warning] Could not parse line: {line}"
                         print(error_msg)
@@ -1334,56 +2332,30 @@ class AutoGUIController:
                         log_buffer.write(error_msg + "\n")
                         continue
 
-                # execute all commands
-                for cmd in commands:
-                    try:
-                        cmd_msg = f"[command] {' '.join(cmd)}"
-                        print(cmd_msg)
-                        log_buffer.write(cmd_msg + "\n")
-
-                        # We need to modify the run method slightly for command file execution
-                        # to prevent it from saving logs for each command
-                        # Set a flag to indicate we're running from command file
-                        self._running_from_command_file = True
-
-                        # Execute the command without saving individual logs
-                        result = self.run(cmd)
-
-                        # Reset the flag
-                        self._running_from_command_file = False
-
-                        time.sleep(
-                            self.parser.get_default("delay") or 0.1
-                        )  # delay between commands
-
-                        # check result
-                        if result != 0 and stop_on_error:
-                            error_msg = f"Command failed with exit code {result}, stopping execution."
-                            print(error_msg)
-                            log_buffer.write(error_msg + "\n")
-
-                            # Only save the main log, not the intermediate logs
-                            if file_path.endswith(".temp"):
-                                # Skip saving log for .temp files
-                                return result
-                            else:
-                                self.save_log_to_file(log_buffer.getvalue(), file_path)
-                                return result
-
-                    except Exception as e:
-                        error_msg = f"Error executing command {cmd}: {str(e)}"
-                        print(error_msg)
-                        log_buffer.write(error_msg + "\n")
-
-                        if stop_on_error:
-                            error_msg = f"Command execution failed: {str(e)}"
-                            log_buffer.write(error_msg + "\n")
+                # Compile blocks (--batch/--repeat/--while-image/--foreach ... --end) once
+                try:
+                    program = self.compile_script(commands)
+                except ValueError as e:
+                    error_msg = f"[Error] {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    if not file_path.endswith(".temp"):
+                        self.save_log_to_file(log_buffer.getvalue(), file_path)
+                    return 1
 
-                            # Only save log for the original file, not temp files
-                            if not file_path.endswith(".temp"):
-                                self.save_log_to_file(log_buffer.getvalue(), file_path)
-                            return 1
-                        continue
+                # execute all commands
+                state = {
+                    "log_buffer": log_buffer,
+                    "stop_on_error": stop_on_error,
+                    "variables": {},
+                    "parsed": {},
+                }
+                result = self._execute_nodes(program, state)
+                if result != 0 and stop_on_error:
+                    # Only save the main log, not the intermediate logs
+                    if not file_path.endswith(".temp"):
+                        self.save_log_to_file(log_buffer.getvalue(), file_path)
+                    return result
 
                 # Write completion timestamp
                 log_buffer.write(
@@ -1395,6 +2367,11 @@ class AutoGUIController:
                     self.save_log_to_file(log_buffer.getvalue(), file_path)
                 return 0  # All commands completed successfully
 
+        except ExecutionCancelled:
+            log_buffer.write("\n=== Execution cancelled ===\n")
+            if not file_path.endswith(".temp"):
+                self.save_log_to_file(log_buffer.getvalue(), file_path)
+            raise
         except FileNotFoundError:
             error_msg = f"Command file not found: {file_path}"
             log_buffer.write(error_msg + "\n")
@@ -1412,6 +2389,198 @@ class AutoGUIController:
                 self.save_log_to_file(log_buffer.getvalue(), file_path)
             raise Exception(error_msg)
 
+    # Commands that never change what is on screen, so the cached frame stays valid
+    QUERY_COMMANDS = {
+        "--image-exists",
+        "--search-image",
+        "--list-monitors",
+        "--position",
+        "--screen-size",
+        "--window-info",
+        "--check-software",
+        "--clipboard-get",
+    }
+
+    def compile_script(self, commands):
+        """
+        Compile command file lines into a tree of nodes (see falconScript.compile_blocks)
+
+        :param commands: List of (line_number, parts) tuples
+        :return: List of node dictionaries
+        """
+        return compile_blocks(commands)
+
+    def _substitute_variables(self, args, variables):
+        """Replace ${VAR} in every argument"""
+        substituted = []
+        for arg in args:
+            for name, value in variables.items():
+                arg = arg.replace("${" + name + "}", str(value))
+            substituted.append(arg)
+        return substituted
+
+    def _execute_nodes(self, nodes, state):
+        """
+        Interpret compiled command file nodes
+
+        :param nodes: Nodes returned by compile_script
+        :param state: Execution state (log buffer, stop_on_error, loop variables, parse cache)
+        :return: 0 on success, otherwise the exit code that stopped execution
+        """
+        log_buffer = state["log_buffer"]
+        stop_on_error = state["stop_on_error"]
+        variables = state["variables"]
+
+        for position, node in enumerate(nodes):
+            self.check_cancelled()
+            node_type = node["type"]
+
+            if node_type in ("if-image", "if-process"):
+                target = self._substitute_variables([node["target"]], variables)[0].strip('"\'')
+                if node_type == "if-image":
+                    # Evaluated on the cached frame: no extra capture if the screen was just grabbed
+                    matched = bool(self.locate_image_multi_scale_auto(
+                        target, confidence=0.9, max_frame_age=self.frame_max_age
+                    ))
+                else:
+                    matched = self.is_process_running(target)
+                branch_msg = f"[if] {node_type[3:]} {target}: {'true' if matched else 'false'}"
+                print(branch_msg)
+                log_buffer.write(branch_msg + "\n")
+                branch = node["body"] if matched else node.get("else", [])
+                result = self._execute_nodes(branch, state)
+                if result != 0 and stop_on_error:
+                    return result
+                continue
+
+            if node_type == "command":
+                args = node["args"]
+                if node["templated"]:
+                    args = self._substitute_variables(args, variables)
+                state["line"] = node["line"]
+                upcoming = nodes[position + 1] if position + 1 < len(nodes) else None
+                state["upcoming"] = None
+                if upcoming is not None and upcoming["type"] == "command":
+                    state["upcoming"] = (
+                        self._substitute_variables(upcoming["args"], variables)
+                        if upcoming["templated"] else upcoming["args"]
+                    )
+                if self.debug_hook is not None and not self.debug_hook(args, state):
+                    skip_msg = f"[debug] Skipped line {node['line']}: {' '.join(args)}"
+                    print(skip_msg)
+                    log_buffer.write(skip_msg + "\n")
+                    continue
+                result = self._execute_script_command(args, state)
+                if result != 0 and stop_on_error:
+                    return result
+                continue
+
+            if node_type == "repeat":
+                iterations = ((i + 1) for i in range(node["count"]))
+                loop_msg = f"[loop] repeat {node['count']}"
+            elif node_type == "foreach":
+                iterations = iter(node["values"])
+                loop_msg = f"[loop] foreach {node['var']} in {' '.join(node['values'])}"
+            else:
+                iterations = None
+                loop_msg = f"[loop] while image exists: {node['image']}"
+            print(loop_msg)
+            log_buffer.write(loop_msg + "\n")
+
+            var = node.get("var")
+            saved = variables.get(var) if var else None
+            count = 0
+            try:
+                while True:
+                    self.check_cancelled()
+                    if node_type == "while-image":
+                        if node["max"] is not None and count >= node["max"]:
+                            break
+                        image_path = self._substitute_variables([node["image"]], variables)[0]
+                        if not self.locate_image_multi_scale_auto(
+                            image_path.strip('"\''), confidence=0.9, max_frame_age=self.frame_max_age
+                        ):
+                            break
+                    else:
+                        value = next(iterations, None)
+                        if value is None:
+                            break
+                        if var:
+                            variables[var] = value
+                    count += 1
+                    result = self._execute_nodes(node["body"], state)
+                    if result != 0 and stop_on_error:
+                        return result
+            finally:
+                if var:
+                    if saved is None:
+                        variables.pop(var, None)
+                    else:
+                        variables[var] = saved
+
+            done_msg = f"[loop] finished after {count} iteration(s)"
+            print(done_msg)
+            log_buffer.write(done_msg + "\n")
+
+        return 0
+
+    def _execute_script_command(self, cmd, state):
+        """Execute one command file command, parsing each distinct argument list only once"""
+        log_buffer = state["log_buffer"]
+        try:
+            cmd_msg = f"[command] {' '.join(cmd)}"
+            print(cmd_msg)
+            log_buffer.write(cmd_msg + "\n")
+            if self.listener is not None:
+                self.listener({"type": "command", "args": list(cmd), "line": state.get("line")})
+
+            key = tuple(cmd)
+            namespace = state["parsed"].get(key)
+            if namespace is None:
+                namespace = self.parser.parse_args(cmd)
+                state["parsed"][key] = namespace
+
+            # Set a flag to indicate we're running from command file,
+            # to prevent run() from saving logs for each command
+            self._running_from_command_file = True
+            try:
+                result = self.run(namespace)
+            finally:
+                self._running_from_command_file = False
+                # --match-color/--match-engine apply to their own line only,
+                # not to later --if-image/--while-image checks
+                self.color_tolerance = None
+                self.match_engine = "template"
+                # Anything but a pure query may have changed the screen
+                if cmd[0] not in self.QUERY_COMMANDS:
+                    self.invalidate_frame()
+
+            # Look up the next command's image while waiting
+            self.start_prefetch(state.pop("upcoming", None), state)
+            self.wait(
+                self.parser.get_default("delay") or 0.1
+            )  # delay between commands
+
+            if self.listener is not None:
+                self.listener({"type": "result", "args": list(cmd), "line": state.get("line"), "code": result})
+
+            if result != 0 and state["stop_on_error"]:
+                error_msg = f"Command failed with exit code {result}, stopping execution."
+                print(error_msg)
+                log_buffer.write(error_msg + "\n")
+            return result
+
+        except Exception as e:
+            error_msg = f"Error executing command {cmd}: {str(e)}"
+            print(error_msg)
+            log_buffer.write(error_msg + "\n")
+
+            if state["stop_on_error"]:
+                error_msg = f"Command execution failed: {str(e)}"
+                log_buffer.write(error_msg + "\n")
+                return 1
+            return 0
+
     def execute_run_command(self, args_list):
         """
         Execute the run command to repeatedly perform a specific operation or a series of operations continuously.
@@ -1432,11 +2601,11 @@ class AutoGUIController:
                         print(
                             f"[Warning] Invalid repeat count '{args_list[i+1]}', using default 1"
                         )
-            # Extract the command to be executed
+            # Extract the command to be executed (as a copy, args_list is left untouched)
             if repeat_index != -1:
-                command_args = args_list[:repeat_index]
+                command_args = list(args_list[:repeat_index])
             else:
-                command_args = args_list
+                command_args = list(args_list)
 
             if not command_args:
                 print("[Error] No command specified for --run")
@@ -1451,12 +2620,15 @@ class AutoGUIController:
 
             print(f"Running command: {' '.join(command_args)} (repeat: {repeat_count})")
 
+            # Parse once, every repetition reuses the same namespace
+            namespace = self.parser.parse_args(command_args)
+
             # Repeat the specified command
             for i in range(repeat_count):
                 print(f"Execution {i+1}/{repeat_count}")
-                self.run(command_args)
+                self.run(namespace)
                 if i < repeat_count - 1:  # If it is not the last execution, wait
-                    time.sleep(self.parser.get_default("delay") or 0.1)
+                    self.wait(self.parser.get_default("delay") or 0.1)
 
             return 0
 
@@ -1466,7 +2638,11 @@ class AutoGUIController:
 
     def fast_click(self, x=None, y=None, count=1, delay=0.01):
         """
-        Perform super fast clicks, skipping intermediate processing steps by calling pyautogui directly
+        Perform super fast clicks through the native input engine (falconInput)
+
+        The click stream is precomputed and injected on a monotonic deadline
+        schedule, so the interval does not drift and rates well above what
+        pyautogui.click + PAUSE can reach are possible.
 
         Parameters:
         x (int, optional): X coordinate, if not provided the current mouse position is used
@@ -1474,6 +2650,8 @@ class AutoGUIController:
         count (int): number of clicks
         delay (float): click interval time (seconds)
         """
+        import falconInput
+
         if x is None or y is None:
             current_pos = pyautogui.position()
             if x is None:
@@ -1481,22 +2659,174 @@ class AutoGUIController:
             if y is None:
                 y = current_pos.y
 
-        pyautogui.moveTo(x, y)
         print(f"Fast clicking at ({x}, {y}) {int(count)} times with {delay}s delay")
+        report = self._run_input_stream(falconInput.click_events(x, y, count), delay)
+        print(f"Completed {int(count)} fast clicks: {falconInput.format_report(report)}")
+        return 0
 
-        original_pause = pyautogui.PAUSE
+    def fast_press(self, key, count=1, delay=0.01):
+        """
+        Press a key (or key combination such as ctrl+v) count times at a fixed rate
+
+        Parameters:
+        key (str): key name, e.g. "a", "enter", "ctrl+v"
+        count (int): number of keystrokes
+        delay (float): keystroke interval time (seconds)
+        """
+        import falconInput
+
+        print(f"Fast pressing '{key}' {int(count)} times with {delay}s delay")
+        report = self._run_input_stream(falconInput.key_events(key, count), delay)
+        print(f"Completed {int(count)} fast key presses: {falconInput.format_report(report)}")
+        return 0
+
+    def _run_input_stream(self, batches, interval):
+        """
+        Inject precomputed batches with self.input_injector (or the platform default)
+
+        :raises ExecutionCancelled: when cancel_event stops the stream
+        """
+        import falconInput
 
+        injector = self.input_injector
+        owns_injector = injector is None
+        if owns_injector:
+            injector = falconInput.default_injector(batches)
         try:
+            report = falconInput.run_stream(injector, batches, interval, self.cancel_event)
+        finally:
+            if owns_injector:
+                injector.close()
+        if report["cancelled"]:
+            print(f"Input stream cancelled after {report['count']} of {len(batches)}")
+            raise ExecutionCancelled()
+        return report
+
+    BATCH_EVENTS = {
+        "moveto": (2, 2),
+        "click": (0, 2),
+        "double-click": (0, 2),
+        "right-click": (0, 2),
+        "press": (1, 1),
+        "type": (1, None),
+        "scroll": (1, 3),
+        "sleep": (1, 1),
+    }
+
+    def parse_batch_events(self, tokens):
+        """
+        Split --batch tokens into a list of (event, args) tuples
+
+        Events are separated by ';' tokens (or a token ending with ';').
+        A leading '--' is allowed, so command file lines can be used as events.
+
+        :param tokens: e.g. ["click", "100", "200", ";", "press", "tab"]
+        :return: List of (event_name, [args]) tuples
+        """
+        groups = []
+        current = []
+        for token in tokens:
+            if token == ";":
+                if current:
+                    groups.append(current)
+                current = []
+            elif token.endswith(";") and not token.endswith("\\;"):
+                current.append(token[:-1])
+                groups.append(current)
+                current = []
+            else:
+                current.append(token.replace("\\;", ";"))
+        if current:
+            groups.append(current)
+
+        events = []
+        for group in groups:
+            name = group[0].lstrip("-").lower()
+            params = group[1:]
+            if name not in self.BATCH_EVENTS:
+                raise ValueError(f"Unknown batch event: {group[0]}")
+            min_count, max_count = self.BATCH_EVENTS[name]
+            if name == "type":
+                params = [" ".join(params)]
+            if len(params) < min_count or (max_count is not None and len(params) > max_count):
+                raise ValueError(f"Invalid arguments for batch event '{' '.join(group)}'")
+            if name in ("click", "double-click", "right-click") and len(params) == 1:
+                raise ValueError(f"Batch event '{name}' requires 0 or 2 coordinates")
+            if name == "scroll" and len(params) == 2:
+                raise ValueError("Batch event 'scroll' requires 1 (CLICKS) or 3 (CLICKS, X, Y) arguments")
+            if name not in ("press", "type"):
+                params = [float(p) if name == "sleep" else int(float(p)) for p in params]
+            events.append((name, params))
+        return events
+
+    # Seconds a paste target gets to read the clipboard before a batch copies over it
+    CLIPBOARD_SETTLE = 0.05
+
+    def execute_batch(self, events, gap=0.0):
+        """
+        Execute input events back-to-back, without pyautogui's per-call PAUSE
 
-            pyautogui.PAUSE = delay
+        Parameters:
+        events (list): (event_name, args) tuples from parse_batch_events
+        gap (float): minimal delay between two events (seconds)
+
+        Returns:
+        float: elapsed time in seconds
+        """
+        import falconInput
 
-            for i in range(int(count)):
-                pyautogui.click(x=x, y=y)
+        original_pause = pyautogui.PAUSE
+        start_time = time.perf_counter()
+        # Injector typing the text of type events (created by the first one)
+        text_injector = None
+        owns_text_injector = self.input_injector is None
+        try:
+            pyautogui.PAUSE = 0
+            for index, (name, params) in enumerate(events):
+                if index and gap > 0:
+                    self.wait(gap)
+                if name == "moveto":
+                    pyautogui.moveTo(params[0], params[1])
+                elif name == "click":
+                    pyautogui.click(*params)
+                elif name == "double-click":
+                    pyautogui.doubleClick(*params)
+                elif name == "right-click":
+                    pyautogui.rightClick(*params)
+                elif name == "press":
+                    keys = params[0].split("+")
+                    if len(keys) > 1:
+                        pyautogui.hotkey(*keys)
+                    else:
+                        pyautogui.press(keys[0])
+                elif name == "type":
+                    text = params[0]
+                    if text.startswith('"') and text.endswith('"'):
+                        text = text[1:-1]
+                    text = text.replace('\\n', '\n').replace('\\t', '\t').replace('\\r', '\r')
+                    if text_injector is None:
+                        text_injector = self.input_injector or falconInput.default_injector()
+                    if isinstance(text_injector, falconInput.PyAutoGUIInjector):
+                        # No native Unicode input: same clipboard method as --type for Chinese
+                        # characters. The target reads the clipboard after ctrl+v returns, so
+                        # give it time before the next event copies over it
+                        pyperclip.copy(text)
+                        pyautogui.hotkey("ctrl", "v")
+                        self.wait(self.CLIPBOARD_SETTLE)
+                    else:
+                        # Typed as Unicode characters in one injection, the clipboard is not used
+                        text_injector.inject(falconInput.text_events(text)[0])
+                elif name == "scroll":
+                    if len(params) == 3:
+                        pyautogui.moveTo(params[1], params[2])
+                    pyautogui.scroll(params[0])
+                elif name == "sleep":
+                    self.wait(params[0])
         finally:
             pyautogui.PAUSE = original_pause
-
-        print(f"Completed {int(count)} fast clicks")
-        return 0
+            if owns_text_injector and text_injector is not None:
+                text_injector.close()
+        return time.perf_counter() - start_time
 
     def launch_application(self, exe_path):
         """
@@ -1596,13 +2926,29 @@ class AutoGUIController:
                 print(f"...Still waiting for '{software_name}' to be installed... ({int(remaining)}s remaining)")
                 last_status_time = current_time
 
-            time.sleep(interval)
+            self.wait(interval)
 
         print(f"[X] Timeout: Software '{software_name}' was not installed within {timeout}s")
         return False
 
 
     def run(self, args=None):
+        """
+        Execute one command line (argument list, parsed namespace, or sys.argv when None)
+
+        :return: Exit code
+        """
+        nested = getattr(self, "_running_from_command_file", False)
+        try:
+            return self._run_args(args)
+        finally:
+            # A --diagnostics recorder enabled by this run (or a line of its command file)
+            # is written now; a reused controller must not keep it open
+            if not nested and self.diagnostics is not None:
+                self.diagnostics.close()
+                self.diagnostics = None
+
+    def _run_args(self, args):
 
         log_buffer = io.StringIO()
         script_path = None
@@ -1622,10 +2968,93 @@ class AutoGUIController:
         )
 
         pyautogui.PAUSE = args.delay
+        self.color_tolerance = args.match_color
+        self.match_engine = args.match_engine
         timeout_sec = args.timeout
 
+        if getattr(args, "replay_frames", None):
+            from falconCapture import FileReplayScreenSource
+
+            self.screen_source = FileReplayScreenSource(args.replay_frames)
+
+        if getattr(args, "monitors", None):
+            from falconCapture import MonitorScreenSource, list_monitors, load_monitor_layout, select_monitors
+
+            try:
+                layout = load_monitor_layout(args.monitor_layout) if args.monitor_layout else list_monitors()
+                selected = select_monitors(layout, args.monitors)
+            except (OSError, ValueError) as e:
+                error_msg = f"[Error] {str(e)}"
+                print(error_msg)
+                log_buffer.write(error_msg + "\n")
+                return 1
+            source = self.screen_source
+            if isinstance(source, MonitorScreenSource):
+                source = source.source
+            self.screen_source = MonitorScreenSource(selected, source, layout)
+            self.invalidate_frame()
+            self._last_hits.clear()
+
+        if getattr(args, "overlay", None):
+            from falconCapture import MatchOverlay
+
+            self.overlay = MatchOverlay(args.overlay)
+
+        if getattr(args, "diagnostics", None):
+            from falconMatch import MatchDiagnostics
+
+            if self.diagnostics is not None:
+                # Write what the previous recorder collected before replacing it
+                self.diagnostics.close()
+            self.diagnostics = MatchDiagnostics(args.diagnostics)
+
+        if getattr(args, "match_tiles", None) is not None:
+            self.match_tile_size = max(0, args.match_tiles)
+
+        if getattr(args, "match_workers", None) is not None:
+            self.set_match_workers(args.match_workers, getattr(args, "match_split", False))
+
         try:
 
+            if getattr(args, "list_monitors", False):
+                from falconCapture import list_monitors, load_monitor_layout
+
+                try:
+                    monitors = load_monitor_layout(args.monitor_layout) if args.monitor_layout else list_monitors()
+                except (OSError, ValueError) as e:
+                    error_msg = f"[Error] {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    return 1
+                for monitor in monitors:
+                    msg = (
+                        f"Monitor {monitor['index']}: {monitor['width']}x{monitor['height']} "
+                        f"at ({monitor['left']}, {monitor['top']}), scale {monitor['scale']:.2f} "
+                        f"({int(round(monitor['scale'] * 100))}%)" + (" primary" if monitor["primary"] else "")
+                    )
+                    print(msg)
+                    log_buffer.write(msg + "\n")
+                return 0
+
+            if getattr(args, "build_pack", None):
+                from falconPack import build_pack
+
+                start = time.perf_counter()
+                try:
+                    output, count, size = build_pack(args.build_pack)
+                except Exception as e:
+                    error_msg = f"[Error] Failed to build template pack: {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    return 1
+                msg = (
+                    f"[V] Packed {count} templates into {output} "
+                    f"({size / 1048576:.1f} MB, {time.perf_counter() - start:.2f}s)"
+                )
+                print(msg)
+                log_buffer.write(msg + "\n")
+                return 0
+
             if hasattr(args, "run") and args.run:
                 result = self.execute_run_command(args.run)
                 # Save log for run command
@@ -1696,6 +3125,51 @@ class AutoGUIController:
                     log_buffer.write(msg + "\n")
                     return self.fast_click()
 
+            if hasattr(args, "fast_press") and args.fast_press is not None:
+                if len(args.fast_press) not in [1, 2, 3]:
+                    msg = "[Error] --fast-press requires KEY, optional COUNT and optional DELAY"
+                    print(msg)
+                    log_buffer.write(msg + "\n")
+                    return 1
+                try:
+                    key = args.fast_press[0]
+                    count = int(float(args.fast_press[1])) if len(args.fast_press) > 1 else 1
+                    delay = float(args.fast_press[2]) if len(args.fast_press) > 2 else 0.01
+                except ValueError:
+                    msg = "[Error] --fast-press COUNT and DELAY must be numbers"
+                    print(msg)
+                    log_buffer.write(msg + "\n")
+                    return 1
+                msg = f"Fast pressing '{key}' {count} times with {delay}s delay"
+                print(msg)
+                log_buffer.write(msg + "\n")
+                return self.fast_press(key, count, delay)
+
+            if args.batch:
+                try:
+                    events = self.parse_batch_events(args.batch)
+                except ValueError as e:
+                    error_msg = f"[Error] {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    return 1
+
+                try:
+                    elapsed = self.execute_batch(events, args.batch_gap)
+                except Exception as e:
+                    error_msg = f"Error executing batch: {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    return 1
+                rate = len(events) / elapsed if elapsed > 0 else float(len(events))
+                summary = " ; ".join(
+                    " ".join([name] + [str(p) for p in params]) for name, params in events
+                )
+                # One log record for the whole batch
+                msg = f"Batch executed {len(events)} events in {elapsed:.3f}s ({rate:.1f} events/s): {summary}"
+                print(msg)
+                log_buffer.write(msg + "\n")
+
             if args.moveto:
                 if len(args.moveto) not in [2, 3]:
                     msg = "[Error] --moveto requires exactly 2 (X, Y) or 3 (X, Y, DURATION) arguments"
@@ -1804,19 +3278,19 @@ class AutoGUIController:
                     log_buffer.write(err_msg + "\n")
 
             if args.screenshot:
-                pyautogui.screenshot(args.screenshot)
+                self.capture_screen().save(args.screenshot)
                 msg = f"Screenshot saved as: {args.screenshot}"
                 print(msg)
                 log_buffer.write(msg + "\n")
 
             if args.position:
-                x, y = pyautogui.position()
+                x, y = self.cursor_position()
                 msg = f"Current mouse position: ({x}, {y})"
                 print(msg)
                 log_buffer.write(msg + "\n")
 
             if args.screen_size:
-                width, height = pyautogui.size()
+                width, height = self.screen_size()
                 msg = f"Screen size: {width}x{height} pixels"
                 print(msg)
                 log_buffer.write(msg + "\n")
@@ -1868,7 +3342,7 @@ class AutoGUIController:
                             int((time.time() - start_time) * 10) % 10 == 0
                         ):  # Log every ~1 second
                             log_buffer.write(f"Position: {position_str}\n")
-                        time.sleep(0.1)
+                        self.wait(0.1)
                 except KeyboardInterrupt:
                     stop_msg = "\nMouse position tracking stopped."
                     print(stop_msg)
@@ -1895,7 +3369,7 @@ class AutoGUIController:
                 log_buffer.write(center_msg + "\n")
 
             if args.position_to_clipboard:
-                x, y = pyautogui.position()
+                x, y = self.cursor_position()
                 position_str = f"({x}, {y})"
                 try:
 
@@ -1963,7 +3437,7 @@ class AutoGUIController:
                     log_buffer.write(click_img_msg + "\n")
 
                     result = self.locate_and_click_image(
-                        image_path, timeout=timeout_sec, show_location=False
+                        image_path, timeout=timeout_sec, show_location=False, index=args.index
                     )
                     if result:
                         center_x, center_y = result
@@ -1988,7 +3462,7 @@ class AutoGUIController:
                     log_buffer.write(click_img_msg + "\n")
 
                     result = self.locate_and_right_click_image(
-                        image_path, timeout=timeout_sec, show_location=False
+                        image_path, timeout=timeout_sec, show_location=False, index=args.index
                     )
                     if result:
                         center_x, center_y = result
@@ -2016,6 +3490,7 @@ class AutoGUIController:
                         image_path,
                         timeout=timeout_sec,
                         show_location=False,
+                        index=args.index,
                     )
                     if result:
                         center_x, center_y = result
@@ -2032,6 +3507,32 @@ class AutoGUIController:
                     log_buffer.write(error_msg + "\n")
                     return 1
 
+            if args.find_all:
+                try:
+                    image_path = args.find_all.strip('"\'')
+                    find_all_msg = f"Finding all occurrences of image: {image_path}"
+                    print(find_all_msg)
+                    log_buffer.write(find_all_msg + "\n")
+
+                    matches = self.find_all_images(image_path, timeout=timeout_sec)
+                    count_msg = f"Found {len(matches)} match(es)"
+                    print(count_msg)
+                    log_buffer.write(count_msg + "\n")
+                    for number, match in enumerate(matches, start=1):
+                        center_x = match["left"] + match["width"] // 2
+                        center_y = match["top"] + match["height"] // 2
+                        match_msg = (
+                            f"  #{number} center ({center_x}, {center_y}), "
+                            f"confidence {match['confidence']:.3f}, scale {match['scale']:.2f}"
+                        )
+                        print(match_msg)
+                        log_buffer.write(match_msg + "\n")
+                except Exception as e:
+                    error_msg = f"[Error] {str(e)}"
+                    print(error_msg)
+                    log_buffer.write(error_msg + "\n")
+                    return 1
+
             if args.image_exists:
                 try:
                     image_path = args.image_exists.strip('"\'')
@@ -2202,7 +3703,7 @@ class AutoGUIController:
                 print(sleep_msg)
                 log_buffer.write(sleep_msg + "\n")
 
-                time.sleep(args.sleep)
+                self.wait(args.sleep)
 
                 continue_msg = f"Continue after {args.sleep} seconds..."
                 print(continue_msg)
@@ -2239,5 +3740,13 @@ class AutoGUIController:
 
 
 if __name__ == "__main__":
+    # Match pool workers of the frozen executable start through this entry point
+    multiprocessing.freeze_support()
     controller = AutoGUIController()
-    sys.exit(controller.run())
+    exit_code = controller.run()
+    if controller.match_pool is not None:
+        controller.match_pool.shutdown()
+    if controller.overlay is not None:
+        # Let the background overlay finish writing the last annotated frame
+        controller.overlay.flush()
+    sys.exit(exit_code)
@@ -0,0 +1,427 @@
+# falconEngine.py
+#
+# In-process execution engine for the Falcon UI script builder.
+#
+# Instead of spawning falconCommand.exe for every run and every debug step,
+# the GUI submits jobs to one worker thread that owns a warm
+# AutoGUIController. Each job reports structured events through a queue:
+#
+#   {"type": "started", "job": 1, "kind": "file", "target": "script.txt"}
+#   {"type": "command", "job": 1, "args": ["--click", "100", "200"], "line": 3}
+#   {"type": "output", "job": 1, "stream": "stdout", "text": "Clicked at position (100, 200)\n"}
+#   {"type": "result", "job": 1, "args": [...], "line": 3, "code": 0}
+#   {"type": "paused", "job": 1, "line": 5, "reason": "breakpoint", "variables": {...}, ...}
+#   {"type": "finished", "job": 1, "code": 0, "cancelled": False, "elapsed": 0.42}
+#
+# A job also behaves like the subprocess.Popen object the GUI used before
+# (poll/stdout.readline/communicate/returncode/terminate/kill), so the
+# existing output handling works unchanged. Cancelling sets the controller's
+# cancel_event, which interrupts waits and stops between commands.
+import io
+import itertools
+import queue
+import sys
+import threading
+import time
+
+# Seconds readline() waits for a line before returning "" (like a quiet pipe)
+READLINE_TIMEOUT = 0.1
+
+
+class _JobStream(io.TextIOBase):
+    """File-like writer that turns the job's output into one event per line"""
+
+    def __init__(self, job, stream):
+        self.job = job
+        self.stream = stream
+        self._partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not text:
+            return 0
+        data = self._partial + text
+        lines = data.split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.job._emit_output(self.stream, line + "\n")
+        return len(text)
+
+    def flush(self):
+        if self._partial:
+            self.job._emit_output(self.stream, self._partial)
+            self._partial = ""
+
+
+class _JobReader:
+    """Read side of a job's stdout, mimicking Popen.stdout.readline()"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def readline(self):
+        try:
+            return self.job._lines.get(timeout=READLINE_TIMEOUT)
+        except queue.Empty:
+            return ""
+
+
+class EngineJob:
+    """
+    A script or command running on the engine
+
+    :ivar events: queue.Queue of structured event dictionaries
+    :ivar returncode: Exit code once finished, otherwise None
+    """
+
+    def __init__(self, engine, job_id, kind, target, stop_on_error=True):
+        self.engine = engine
+        self.id = job_id
+        self.kind = kind
+        self.target = target
+        self.stop_on_error = stop_on_error
+        self.events = queue.Queue()
+        self.returncode = None
+        self.cancelled = False
+        self.stdout = _JobReader(self)
+        self.session = None
+        self._lines = queue.Queue()
+        self._stderr = []
+        self._done = threading.Event()
+
+    def _emit(self, event):
+        event["job"] = self.id
+        self.events.put(event)
+        if self.engine.listener is not None:
+            self.engine.listener(event)
+
+    def _emit_output(self, stream, text):
+        if stream == "stdout":
+            self._lines.put(text)
+        else:
+            self._stderr.append(text)
+        self._emit({"type": "output", "stream": stream, "text": text})
+
+    def _finish(self, code, cancelled, elapsed):
+        self.cancelled = cancelled
+        self.returncode = code
+        self._emit({"type": "finished", "code": code, "cancelled": cancelled, "elapsed": elapsed})
+        self._done.set()
+
+    # subprocess.Popen compatible subset
+
+    def poll(self):
+        return self.returncode if self._done.is_set() else None
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.poll()
+
+    def communicate(self, timeout=None):
+        """Wait for the job and return (remaining stdout, stderr) like Popen.communicate()"""
+        self.wait(timeout)
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._lines.get_nowait())
+            except queue.Empty:
+                break
+        return "".join(remaining), "".join(self._stderr)
+
+    def terminate(self):
+        self.engine.cancel(self)
+
+    kill = terminate
+
+
+class DebugSession:
+    """
+    Breakpoints and stepping for a command file running on the engine
+
+    The engine thread calls before_command() ahead of every command; it
+    blocks on a condition variable while the script is paused, so a paused
+    session costs nothing until the GUI calls step(), skip(), resume(),
+    run_to() or stop().
+
+    :param breakpoints: Line numbers (1-based) to pause at
+    :param pause_on_start: Pause before the first command (step mode)
+    """
+
+    def __init__(self, breakpoints=(), pause_on_start=True):
+        self._cond = threading.Condition()
+        self.breakpoints = set(breakpoints)
+        # "step": pause before the next command, "continue": only at breakpoints,
+        # "run_to": at breakpoints or when reaching target_line
+        self.mode = "step" if pause_on_start else "continue"
+        self.target_line = None
+        self.paused = None
+        self._action = None
+        self._stopped = False
+        self.emit = None
+
+    def set_breakpoints(self, lines):
+        with self._cond:
+            self.breakpoints = set(lines)
+
+    # Engine thread side
+
+    def before_command(self, controller, args, state):
+        """Pause if needed; return False when the command should be skipped"""
+        from falconCommand import ExecutionCancelled
+
+        line = state.get("line")
+        with self._cond:
+            if self._stopped:
+                raise ExecutionCancelled()
+            if line in self.breakpoints:
+                reason = "breakpoint"
+            elif self.mode == "step":
+                reason = "step"
+            elif self.mode == "run_to" and line == self.target_line:
+                reason = "cursor"
+            else:
+                return True
+
+            self.paused = {
+                "type": "paused",
+                "reason": reason,
+                "line": line,
+                "args": list(args),
+                "variables": dict(state.get("variables", {})),
+                "last_match": dict(controller.last_match) if controller.last_match else None,
+            }
+            self._action = None
+            if self.emit is not None:
+                self.emit(dict(self.paused))
+            while self._action is None and not self._stopped:
+                self._cond.wait()
+            self.paused = None
+            if self._stopped:
+                raise ExecutionCancelled()
+            action = self._action
+        if self.emit is not None:
+            self.emit({"type": "resumed", "line": line, "action": action})
+        return action != "skip"
+
+    # GUI side
+
+    def _release(self, action, mode, target_line=None):
+        with self._cond:
+            self.mode = mode
+            self.target_line = target_line
+            self._action = action
+            self._cond.notify_all()
+
+    def step(self):
+        """Run the paused command and pause before the next one"""
+        self._release("run", "step")
+
+    def skip(self):
+        """Skip the paused command and pause before the next one"""
+        self._release("skip", "step")
+
+    def resume(self):
+        """Continue until the next breakpoint"""
+        self._release("run", "continue")
+
+    def run_to(self, line):
+        """Continue until line (or an earlier breakpoint) is reached"""
+        self._release("run", "run_to", line)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class FalconEngine:
+    """
+    Worker thread executing falconCommand scripts in this process
+
+    :param controller: AutoGUIController to use (created in the worker if None)
+    :param listener: Optional callable receiving every event of every job
+    :param warm_up: Import the vision/input modules in the background at start
+    """
+
+    def __init__(self, controller=None, listener=None, warm_up=True):
+        self.controller = controller
+        self.listener = listener
+        self.warm_up = warm_up
+        self._jobs = queue.Queue()
+        self._ids = itertools.count(1)
+        self._current = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = threading.Event()
+        self.error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="falcon-engine", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """Wait until the controller exists; raises the start-up error, if any"""
+        self._ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self._ready.is_set()
+
+    @property
+    def busy(self):
+        return self._current is not None or not self._jobs.empty()
+
+    def run_file(self, path, stop_on_error=True):
+        """Queue a command file, same as `falconCommand --command-file path`"""
+        return self._submit("file", path, stop_on_error)
+
+    def run_debug(self, path, session, stop_on_error=True):
+        """Queue a command file that pauses according to a DebugSession"""
+        job = self._submit("debug", path, stop_on_error)
+        job.session = session
+        return job
+
+    def run_command(self, args):
+        """Queue a single command given as an argument list (quotes already removed)"""
+        return self._submit("command", [str(arg) for arg in args], False)
+
+    def _submit(self, kind, target, stop_on_error):
+        self.start()
+        job = EngineJob(self, next(self._ids), kind, target, stop_on_error)
+        self._jobs.put(job)
+        return job
+
+    def cancel(self, job=None):
+        """
+        Cancel job (or the running job and everything queued when None)
+
+        Waits and image searches of the running command return immediately;
+        the job finishes with cancelled=True.
+        """
+        with self._lock:
+            current = self._current
+            if current is not None and (job is None or job is current):
+                session = getattr(current, "session", None)
+                if session is not None:
+                    session.stop()
+            if job is None or job is self._current:
+                if self._current is not None and self.controller is not None:
+                    self.controller.cancel_event.set()
+            if job is not None and job is not self._current and job.poll() is None:
+                job.cancelled = True
+        if job is None:
+            while True:
+                try:
+                    pending = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                pending._finish(1, True, 0.0)
+
+    def shutdown(self):
+        self.cancel()
+        self._jobs.put(None)
+
+    def _worker(self):
+        try:
+            if self.controller is None:
+                from falconCommand import AutoGUIController
+
+                self.controller = AutoGUIController()
+        except BaseException as e:
+            self.error = e
+        self._ready.set()
+
+        if self.error is not None:
+            # Fail every job instead of leaving callers waiting forever
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                job._emit_output("stderr", f"[Error] In-process engine unavailable: {str(self.error)}\n")
+                job._finish(1, False, 0.0)
+
+        if self.warm_up:
+            self._warm_up()
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if job.cancelled:
+                job._finish(1, True, 0.0)
+                continue
+            with self._lock:
+                self.controller.cancel_event.clear()
+                self._current = job
+            try:
+                self._execute(job)
+            finally:
+                with self._lock:
+                    self._current = None
+
+    def _warm_up(self):
+        """Load the lazily imported modules now, so the first command does not pay for it"""
+        import falconCommand
+
+        for module in (falconCommand.pyautogui, falconCommand.np, falconCommand.cv2):
+            try:
+                module._load()
+            except Exception as e:
+                print(f"[Warning] Engine warm-up could not import {module._name}: {str(e)}")
+
+    def _execute(self, job):
+        from falconCommand import ExecutionCancelled, capture_thread_output
+
+        controller = self.controller
+        stdout = _JobStream(job, "stdout")
+        stderr = _JobStream(job, "stderr")
+        job._emit({"type": "started", "kind": job.kind, "target": job.target})
+        controller.listener = job._emit
+        start = time.perf_counter()
+        code = 1
+        cancelled = False
+        try:
+            with capture_thread_output(stdout, stderr):
+                try:
+                    if job.kind in ("file", "debug"):
+                        args = ["--command-file", job.target]
+                        if job.stop_on_error:
+                            args.append("--stop-on-error")
+                        if job.kind == "debug":
+                            session = job.session
+                            session.emit = job._emit
+                            controller.debug_hook = (
+                                lambda cmd, state: session.before_command(controller, cmd, state)
+                            )
+                        code = controller.run(args)
+                    else:
+                        # The GUI keeps its own debug log, skip the per-command log file
+                        controller._running_from_command_file = True
+                        try:
+                            code = controller.run(job.target)
+                        finally:
+                            controller._running_from_command_file = False
+                except ExecutionCancelled:
+                    cancelled = True
+                    print("[Warning] Execution cancelled")
+                except SystemExit as e:
+                    # argparse reports bad arguments through sys.exit
+                    code = e.code if isinstance(e.code, int) else 1
+                except Exception as e:
+                    print(f"[Error] {str(e)}", file=sys.stderr)
+                finally:
+                    stdout.flush()
+                    stderr.flush()
+        finally:
+            controller.listener = None
+            controller.debug_hook = None
+            # Replayed frames, overlays, monitor selection ... belong to this job only
+            try:
+                controller.reset_run_state()
+            except Exception as e:
+                job._emit_output("stderr", f"[Warning] Could not reset engine state: {str(e)}\n")
+            controller.cancel_event.clear()
+            job._finish(1 if cancelled else (code or 0), cancelled, time.perf_counter() - start)
@@ -0,0 +1,410 @@
+# falconInput.py
+#
+# High-rate input engine used by fast_click / --fast-press.
+#
+# The event stream is precomputed, grouped into batches and injected on a
+# monotonic deadline schedule. On Windows every batch is a single SendInput
+# call; elsewhere pyautogui is used without its per-call PAUSE.
+import math
+import statistics
+import sys
+import time
+
+# Event kinds of the precomputed stream
+MOVE = "move"
+MOUSE_DOWN = "mouse_down"
+MOUSE_UP = "mouse_up"
+KEY_DOWN = "key_down"
+KEY_UP = "key_up"
+# A typed character (down and up), independent of the keyboard layout
+CHAR = "char"
+
+# The scheduler never slices batches finer than this (seconds)
+MIN_BATCH_INTERVAL = 0.001
+# Sleep until this close to a deadline, then spin on the clock (seconds)
+SPIN_THRESHOLD = 0.002
+
+VIRTUAL_KEYS = {
+    "backspace": 0x08, "tab": 0x09, "enter": 0x0D, "return": 0x0D,
+    "shift": 0x10, "ctrl": 0x11, "alt": 0x12, "pause": 0x13, "capslock": 0x14,
+    "esc": 0x1B, "escape": 0x1B, "space": 0x20, "pageup": 0x21, "pagedown": 0x22,
+    "end": 0x23, "home": 0x24, "left": 0x25, "up": 0x26, "right": 0x27,
+    "down": 0x28, "insert": 0x2D, "delete": 0x2E, "del": 0x2E, "win": 0x5B,
+}
+VIRTUAL_KEYS.update({f"f{i}": 0x6F + i for i in range(1, 13)})
+VIRTUAL_KEYS.update({chr(c): c for c in range(ord("0"), ord("9") + 1)})
+VIRTUAL_KEYS.update({chr(c).lower(): c for c in range(ord("A"), ord("Z") + 1)})
+
+
+def click_events(x, y, count, button="left"):
+    """
+    Precompute the event stream of count clicks at (x, y)
+
+    :return: List of batches, one [mouse_down, mouse_up] pair per click;
+             the first batch also moves the cursor when x/y are given
+    """
+    batches = [[(MOUSE_DOWN, button), (MOUSE_UP, button)] for _ in range(int(count))]
+    if batches and x is not None and y is not None:
+        batches[0].insert(0, (MOVE, int(x), int(y)))
+    return batches
+
+
+def text_events(text):
+    """
+    Precompute the event stream typing text (any Unicode, \n and \t included)
+
+    :return: A single batch, so the whole text is delivered in one injection
+    """
+    return [[(CHAR, char) for char in text.replace("\r\n", "\n")]]
+
+
+def key_events(key, count):
+    """
+    Precompute the event stream of count presses of key (e.g. "a", "enter", "ctrl+v")
+
+    :return: List of batches, one full press/release sequence per keystroke
+    """
+    keys = [k.strip().lower() for k in key.split("+")]
+    press = [(KEY_DOWN, k) for k in keys] + [(KEY_UP, k) for k in reversed(keys)]
+    return [list(press) for _ in range(int(count))]
+
+
+class FakeInjector:
+    """Injector that only records events with their timestamps (for testing)"""
+
+    def __init__(self):
+        self.events = []
+
+    def inject(self, batch):
+        now = time.perf_counter()
+        self.events.extend((now, event) for event in batch)
+
+    def close(self):
+        pass
+
+
+class PyAutoGUIInjector:
+    """Portable injector built on pyautogui, with the global PAUSE disabled"""
+
+    def __init__(self):
+        import pyautogui
+
+        self.pyautogui = pyautogui
+
+    def inject(self, batch):
+        pyautogui = self.pyautogui
+        for event in batch:
+            kind = event[0]
+            if kind == MOVE:
+                pyautogui.moveTo(event[1], event[2], _pause=False)
+            elif kind == MOUSE_DOWN:
+                pyautogui.mouseDown(button=event[1], _pause=False)
+            elif kind == MOUSE_UP:
+                pyautogui.mouseUp(button=event[1], _pause=False)
+            elif kind == KEY_DOWN:
+                pyautogui.keyDown(event[1], _pause=False)
+            elif kind == KEY_UP:
+                pyautogui.keyUp(event[1], _pause=False)
+            elif kind == CHAR:
+                # pyautogui only types characters of the keyboard layout (no CJK)
+                pyautogui.write(event[1], _pause=False)
+
+    def close(self):
+        pass
+
+
+class SendInputInjector:
+    """Windows injector: every batch is delivered with one SendInput call"""
+
+    MOUSE_FLAGS = {
+        (MOUSE_DOWN, "left"): 0x0002,
+        (MOUSE_UP, "left"): 0x0004,
+        (MOUSE_DOWN, "right"): 0x0008,
+        (MOUSE_UP, "right"): 0x0010,
+        (MOUSE_DOWN, "middle"): 0x0020,
+        (MOUSE_UP, "middle"): 0x0040,
+    }
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [
+                ("dx", wintypes.LONG),
+                ("dy", wintypes.LONG),
+                ("mouseData", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t),
+            ]
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [
+                ("wVk", wintypes.WORD),
+                ("wScan", wintypes.WORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t),
+            ]
+
+        class HARDWAREINPUT(ctypes.Structure):
+            _fields_ = [
+                ("uMsg", wintypes.DWORD),
+                ("wParamL", wintypes.WORD),
+                ("wParamH", wintypes.WORD),
+            ]
+
+        class _INPUTUNION(ctypes.Union):
+            _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT), ("hi", HARDWAREINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("union", _INPUTUNION)]
+
+        self.ctypes = ctypes
+        self.INPUT = INPUT
+        self._cursor = wintypes.POINT()
+        self.user32 = ctypes.windll.user32
+        self.winmm = ctypes.windll.winmm
+        # 1ms timer resolution for the duration of the stream
+        self.winmm.timeBeginPeriod(1)
+        self._prepared = {}
+
+    def _key_input(self, vk, up, scan=0, flags=0):
+        item = self.INPUT()
+        item.type = 1  # INPUT_KEYBOARD
+        item.union.ki.wVk = vk
+        item.union.ki.wScan = scan
+        item.union.ki.dwFlags = flags | (self.KEYEVENTF_KEYUP if up else 0)
+        return item
+
+    # Typed characters sent as keys rather than as Unicode characters
+    CHAR_KEYS = {"\n": "enter", "\r": "enter", "\t": "tab"}
+
+    def _to_inputs(self, event):
+        """INPUT structures of one event (a shifted character also presses shift, like pyautogui)"""
+        kind = event[0]
+        if kind in (MOUSE_DOWN, MOUSE_UP):
+            item = self.INPUT()
+            item.type = 0  # INPUT_MOUSE
+            item.union.mi.dwFlags = self.MOUSE_FLAGS[(kind, event[1])]
+            return [item]
+        if kind == CHAR:
+            key = self.CHAR_KEYS.get(event[1])
+            if key is not None:
+                return [self._key_input(VIRTUAL_KEYS[key], False), self._key_input(VIRTUAL_KEYS[key], True)]
+            # KEYEVENTF_UNICODE types the UTF-16 code units, so characters outside the BMP
+            # are sent as their surrogate pair
+            units = event[1].encode("utf-16-le")
+            inputs = []
+            for offset in range(0, len(units), 2):
+                unit = int.from_bytes(units[offset:offset + 2], "little")
+                inputs.append(self._key_input(0, False, unit, self.KEYEVENTF_UNICODE))
+                inputs.append(self._key_input(0, True, unit, self.KEYEVENTF_UNICODE))
+            return inputs
+        key = event[1]
+        up = kind == KEY_UP
+        vk = VIRTUAL_KEYS.get(key)
+        if vk is not None:
+            return [self._key_input(vk, up)]
+        if len(key) != 1:
+            raise ValueError(f"Unsupported key for native injection: {key}")
+        # Layout dependent virtual key of a character: low byte key, high byte shift state
+        scan = self.user32.VkKeyScanW(ord(key))
+        if scan == -1 or scan & 0xFF == 0xFF:
+            # Not on the keyboard layout: type the character itself
+            return [self._key_input(0, up, ord(key), self.KEYEVENTF_UNICODE)]
+        item = self._key_input(scan & 0xFF, up)
+        if not scan & 0x0100:
+            return [item]
+        shift = self._key_input(VIRTUAL_KEYS["shift"], up)
+        return [item, shift] if up else [shift, item]
+
+    def prepare(self, batch):
+        """Convert a batch into (cursor position, ctypes INPUT array) once"""
+        key = tuple(batch)
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            position = None
+            inputs = []
+            for event in batch:
+                if event[0] == MOVE:
+                    position = (event[1], event[2])
+                else:
+                    inputs.extend(self._to_inputs(event))
+            array = (self.INPUT * len(inputs))(*inputs)
+            prepared = (position, array, len(inputs))
+            self._prepared[key] = prepared
+        return prepared
+
+    def inject(self, batch):
+        position, array, count = self.prepare(batch)
+        # Keep pyautogui's fail-safe: moving the mouse to the top-left corner aborts
+        self.user32.GetCursorPos(self.ctypes.byref(self._cursor))
+        if self._cursor.x == 0 and self._cursor.y == 0:
+            raise RuntimeError("Fail-safe triggered from mouse moving to the top-left corner")
+        if position is not None:
+            self.user32.SetCursorPos(position[0], position[1])
+        if count:
+            self.user32.SendInput(count, array, self.ctypes.sizeof(self.INPUT))
+
+    def close(self):
+        self.winmm.timeEndPeriod(1)
+
+
+def default_injector(batches=()):
+    """
+    Native SendInput on Windows, pyautogui everywhere else
+
+    :param batches: Batches about to be injected; they are prepared now, and a key
+                    SendInput cannot express makes the stream use pyautogui instead
+    """
+    if sys.platform == "win32":
+        injector = None
+        try:
+            injector = SendInputInjector()
+            for batch in batches:
+                injector.prepare(batch)
+            return injector
+        except Exception as e:
+            if injector is not None:
+                injector.close()
+            print(f"[Warning] Native input injection unavailable, using pyautogui: {str(e)}")
+    return PyAutoGUIInjector()
+
+
+def cursor_position():
+    """
+    Current mouse position
+
+    Uses GetCursorPos directly on Windows so that simple queries do not
+    have to import pyautogui (and with it numpy/OpenCV).
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        point = wintypes.POINT()
+        if ctypes.windll.user32.GetCursorPos(ctypes.byref(point)):
+            return point.x, point.y
+    import pyautogui
+
+    x, y = pyautogui.position()
+    return x, y
+
+
+def screen_size():
+    """Primary screen size in pixels, natively on Windows like cursor_position()"""
+    if sys.platform == "win32":
+        import ctypes
+
+        user32 = ctypes.windll.user32
+        width, height = user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)  # SM_CXSCREEN, SM_CYSCREEN
+        if width and height:
+            return width, height
+    import pyautogui
+
+    width, height = pyautogui.size()
+    return width, height
+
+
+def wait_until(deadline, cancel_event=None):
+    """
+    Wait for a perf_counter deadline: coarse sleep first, then spin
+
+    :param cancel_event: Optional threading.Event that ends the wait early
+    :return: False when cancel_event was set, True otherwise
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_THRESHOLD:
+        if cancel_event is None:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        elif cancel_event.wait(remaining - SPIN_THRESHOLD):
+            return False
+    if cancel_event is None:
+        while time.perf_counter() < deadline:
+            pass
+        return True
+    while time.perf_counter() < deadline:
+        if cancel_event.is_set():
+            return False
+    return not cancel_event.is_set()
+
+
+def run_stream(injector, batches, interval, cancel_event=None):
+    """
+    Inject precomputed batches on a monotonic deadline schedule
+
+    Deadlines are absolute (start + i * interval), so a late batch does not
+    push every following one back and the average rate does not drift.
+    When interval is below MIN_BATCH_INTERVAL several batches are merged
+    into one injection.
+
+    :param injector: FakeInjector, PyAutoGUIInjector or SendInputInjector
+    :param batches: List of event lists (one per click/keystroke)
+    :param interval: Target time between two batches in seconds
+    :param cancel_event: Optional threading.Event; once set no further batch is
+                         injected (a batch is never cut in half, so no key stays down)
+    :return: Report dictionary with achieved rate and jitter; "cancelled" is True
+             when cancel_event stopped the stream, "count" is then the batches injected
+    """
+    if not batches or (cancel_event is not None and cancel_event.is_set()):
+        return {"count": 0, "elapsed": 0.0, "rate": 0.0, "target_rate": 0.0,
+                "batch_size": 0, "jitter_mean_ms": 0.0, "jitter_stdev_ms": 0.0,
+                "jitter_max_ms": 0.0, "cancelled": bool(batches)}
+
+    interval = max(0.0, float(interval))
+    group = 1
+    if 0 < interval < MIN_BATCH_INTERVAL:
+        group = int(math.ceil(MIN_BATCH_INTERVAL / interval))
+    elif interval == 0:
+        group = len(batches)
+    slices = [
+        [event for batch in batches[i:i + group] for event in batch]
+        for i in range(0, len(batches), group)
+    ]
+    slice_interval = interval * group
+
+    lateness = []
+    injected = []
+    cancelled = False
+    start = time.perf_counter()
+    for index, events in enumerate(slices):
+        deadline = start + index * slice_interval
+        if index and not wait_until(deadline, cancel_event):
+            cancelled = True
+            break
+        injected_at = time.perf_counter()
+        injector.inject(events)
+        injected.append(injected_at)
+        lateness.append(injected_at - deadline)
+    elapsed = time.perf_counter() - start
+
+    count = min(len(batches), len(injected) * group)
+    if len(injected) > 1:
+        # Rate between the first and the last injection
+        rate = (len(injected) - 1) * group / (injected[-1] - injected[0])
+    else:
+        rate = count / elapsed if elapsed > 0 else float(count)
+    return {
+        "count": count,
+        "elapsed": elapsed,
+        "rate": rate,
+        "target_rate": 1.0 / interval if interval > 0 else float("inf"),
+        "batch_size": group,
+        "jitter_mean_ms": statistics.mean(abs(v) for v in lateness) * 1000,
+        "jitter_stdev_ms": statistics.pstdev(lateness) * 1000,
+        "jitter_max_ms": max(abs(v) for v in lateness) * 1000,
+        "cancelled": cancelled,
+    }
+
+
+def format_report(report):
+    """One line summary of a run_stream report"""
+    return (
+        f"{report['count']} events in {report['elapsed']:.3f}s, "
+        f"achieved {report['rate']:.1f}/s (target {report['target_rate']:.1f}/s), "
+        f"jitter mean {report['jitter_mean_ms']:.3f}ms / max {report['jitter_max_ms']:.3f}ms"
+    )
@@ -0,0 +1,851 @@
+# falconMatch.py
+#
+# Template matching helpers used by AutoGUIController.
+import datetime
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+# Search phases of the multi-scale lookup. "fine" (linear ratios around the best
+# common one) and "full" (0.1 steps over the range) belong to the former search and
+# are kept so older diagnostics files still read; the current search runs "coarse"
+# (reduced resolution scan of the range) and "golden" (golden-section refinement).
+# New names are only ever appended: diagnostics store phases by index.
+PHASES = ("load", "common", "fine", "full", "features", "last", "coarse", "golden")
+
+# Ratios tried first by every multi-scale lookup (and precomputed in template packs)
+COMMON_SCALES = (1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 3.0)
+
+# Default largest per-channel difference of mean colors accepted by the color check (0-255)
+COLOR_TOLERANCE = 30.0
+
+# (path, modification time) -> loaded template
+_template_cache = {}
+
+# Templates with at least this many pixels are correlated in the frequency domain.
+# `python falconBench.py fft` measures the crossover (about 50000 pixels on a 1920x1080
+# frame); the threshold sits above it because the first large template of a frame
+# also pays for the frame spectrum.
+FFT_MIN_TEMPLATE_AREA = 100000
+
+# Frames with more pixels than two 4K screens are matched tile by tile (see TiledFrame);
+# cv2.matchTemplate would otherwise build float64 integral images of the whole frame
+TILED_MIN_PIXELS = 2 * 3840 * 2160
+# Side of the result area one tile produces
+TILE_SIZE = 1024
+
+
+def load_template(path):
+    """
+    Load a template image once, keeping its transparency as a matching mask
+
+    Images covered by a template pack (see falconPack) are served from the
+    pack without decoding.
+
+    :return: Dictionary {"gray", "color" (RGB), "mask" (uint8 or None)}, or None if unreadable;
+             the mask is only set when the image has an alpha channel with transparent pixels.
+             Packed templates also have a "pyramid" {ratio: grayscale template}.
+    """
+    from falconPack import pack_template
+
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    key = (str(path), stat.st_mtime)
+    template = _template_cache.get(key)
+    if template is not None:
+        return template
+
+    template = pack_template(path, stat)
+    if template is None:
+        template = decode_template(path)
+        if template is None:
+            return None
+    if len(_template_cache) > 256:
+        _template_cache.clear()
+    _template_cache[key] = template
+    return template
+
+
+def evict_templates(directory):
+    """Drop the cached templates of the images below directory (their pack is being replaced)"""
+    directory = os.path.normcase(os.path.abspath(directory))
+    for key in list(_template_cache):
+        path = os.path.normcase(os.path.abspath(key[0]))
+        if path.startswith(os.path.join(directory, "")):
+            _template_cache.pop(key, None)
+
+
+def decode_template(path):
+    """Decode an image file into a template dictionary (see load_template), without caching"""
+    import cv2
+
+    image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    mask = None
+    if image.dtype != "uint8":
+        # 16-bit images: let OpenCV convert them, transparency is not supported there
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if image.ndim == 2:
+        color = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    elif image.shape[2] == 4:
+        alpha = image[:, :, 3]
+        if (alpha < 255).any():
+            mask = alpha
+        color = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+    else:
+        color = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    return {"gray": cv2.cvtColor(color, cv2.COLOR_RGB2GRAY), "color": color, "mask": mask}
+
+
+def resize_template(template, scale, grayscale=True):
+    """Template at a ratio, taken from a pack's precomputed pyramid when it has that ratio"""
+    import cv2
+
+    if grayscale:
+        resized = template.get("pyramid", {}).get(scale)
+        if resized is not None:
+            return resized
+    image = template["gray"] if grayscale else template["color"]
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+
+class FrameSpectrum:
+    """
+    Normalized cross-correlation of templates against one grayscale frame via FFT
+
+    cv2.matchTemplate pays for every template and scale against the full
+    frame again. Here the frame's spectrum and integral images are computed
+    once (on first use) and shared by every template and scale matched on
+    the frame; each match then costs one template DFT, one spectrum product,
+    one inverse DFT and the normalization from the integral images.
+
+    The spectrum has the frame's own (DFT friendly) size: a template placed
+    at the origin never wraps around inside the valid result region, so no
+    padding by the template size is needed and one spectrum serves all sizes.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self._spectrum = None
+        self._sums = None
+        self._lock = threading.Lock()
+
+    def _prepare(self):
+        import cv2
+        import numpy as np
+
+        with self._lock:
+            if self._spectrum is None:
+                height, width = self.image.shape[:2]
+                self.shape = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+                padded = np.zeros(self.shape, np.float32)
+                padded[:height, :width] = self.image
+                self._sums = cv2.integral2(self.image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+                self._spectrum = cv2.dft(padded)
+
+    def match(self, template):
+        """Same result map as cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)"""
+        import cv2
+        import numpy as np
+
+        self._prepare()
+        height, width = self.image.shape[:2]
+        t_height, t_width = template.shape[:2]
+        r_height, r_width = height - t_height + 1, width - t_width + 1
+        count = t_height * t_width
+
+        # Correlating with the zero-mean template gives the numerator directly
+        centered = template.astype(np.float32)
+        centered -= centered.mean()
+        padded = np.zeros(self.shape, np.float32)
+        padded[:t_height, :t_width] = centered
+        product = cv2.mulSpectrums(self._spectrum, cv2.dft(padded), 0, conjB=True)
+        numerator = cv2.idft(product, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)[:r_height, :r_width]
+
+        # Window variance of the frame from the integral images
+        sums, squares = self._sums
+        window_sum = sums[t_height:, t_width:] - sums[:r_height, t_width:]
+        window_sum -= sums[t_height:, :r_width]
+        window_sum += sums[:r_height, :r_width]
+        window_sq = squares[t_height:, t_width:] - squares[:r_height, t_width:]
+        window_sq -= squares[t_height:, :r_width]
+        window_sq += squares[:r_height, :r_width]
+        window_sum *= window_sum
+        window_sum *= 1.0 / count
+        window_sq -= window_sum
+        np.maximum(window_sq, 0, out=window_sq)
+
+        template_energy = float(np.square(centered, dtype=np.float64).sum())
+        window_sq *= template_energy
+        denominator = np.sqrt(window_sq).astype(np.float32)
+        result = np.zeros((r_height, r_width), np.float32)
+        # Flat windows (or a flat template) have no defined correlation, like in OpenCV
+        valid = denominator > 1e-3
+        np.divide(numerator, denominator, out=result, where=valid)
+        np.clip(result, -1.0, 1.0, out=result)
+        return result
+
+
+class TiledFrame:
+    """
+    Memory-bounded TM_CCOEFF_NORMED matching of templates against one large frame
+
+    cv2.matchTemplate keeps float64 sum and square-sum integral images of
+    the whole frame next to the result map (about 20 bytes per screen pixel),
+    and FrameSpectrum needs a full-frame spectrum. Here each tile of the
+    result map is matched from the frame region it depends on (the tile plus
+    the template size, so tiles overlap by the template) and written straight
+    into the result map; the scratch memory depends on the tile size only.
+    Tiles can run on several threads, cv2 releases the GIL.
+
+    :param image: Grayscale or RGB frame
+    :param tile_size: Side of the result area of one tile
+    :param buffer: Optional flat float32 array reused for the result maps; each
+                   match then overwrites the previous map, so only use it when
+                   no caller keeps result maps (diagnostics, find-all)
+    :param workers: Threads matching tiles concurrently
+    """
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, image, tile_size=TILE_SIZE, buffer=None, workers=1):
+        self.image = image
+        self.tile_size = max(16, int(tile_size))
+        self.buffer = buffer
+        self.workers = max(1, int(workers))
+
+    @classmethod
+    def _pool(cls, workers):
+        with cls._executor_lock:
+            if cls._executor is None or cls._executor._max_workers < workers:
+                from concurrent.futures import ThreadPoolExecutor
+
+                cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="falcon-tiles")
+            return cls._executor
+
+    def tiles(self, template_shape):
+        """(top, left, bottom, right) result areas of the tiles for a template size"""
+        rows = self.image.shape[0] - template_shape[0] + 1
+        cols = self.image.shape[1] - template_shape[1] + 1
+        return [
+            (top, left, min(top + self.tile_size, rows), min(left + self.tile_size, cols))
+            for top in range(0, rows, self.tile_size)
+            for left in range(0, cols, self.tile_size)
+        ]
+
+    def match(self, template, mask=None):
+        """Result map like match_template(self.image, template, mask)"""
+        import cv2
+        import numpy as np
+
+        height, width = template.shape[:2]
+        shape = (self.image.shape[0] - height + 1, self.image.shape[1] - width + 1)
+        if shape[0] < 1 or shape[1] < 1:
+            return cv2.matchTemplate(self.image, template, cv2.TM_CCOEFF_NORMED)
+        if mask is not None and mask.shape[:2] != (height, width):
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        size = shape[0] * shape[1]
+        if self.buffer is not None and self.buffer.size >= size:
+            result = self.buffer[:size].reshape(shape)
+        else:
+            result = np.empty(shape, np.float32)
+
+        def run(tile):
+            top, left, bottom, right = tile
+            region = self.image[top:bottom + height - 1, left:right + width - 1]
+            target = result[top:bottom, left:right]
+            if mask is None:
+                cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED, result=target)
+            else:
+                cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED, result=target, mask=mask)
+                target[~np.isfinite(target)] = 0
+
+        tiles = self.tiles(template.shape)
+        if self.workers > 1 and len(tiles) > 1:
+            list(self._pool(self.workers).map(run, tiles))
+        else:
+            for tile in tiles:
+                run(tile)
+        return result
+
+
+def use_fft(template_shape, image_shape):
+    """Whether FrameSpectrum beats cv2.matchTemplate for this template size"""
+    return (
+        len(image_shape) == 2
+        and template_shape[0] * template_shape[1] >= FFT_MIN_TEMPLATE_AREA
+        and template_shape[0] <= image_shape[0]
+        and template_shape[1] <= image_shape[1]
+    )
+
+
+def match_template(image, template, mask=None, spectrum=None):
+    """
+    TM_CCOEFF_NORMED result map, honoring a transparency mask
+
+    :param mask: Template mask at any size, resized to the template here
+    :param spectrum: FrameSpectrum of image, used for large unmasked templates;
+                     or TiledFrame of image, then every template is matched in tiles
+    """
+    import cv2
+    import numpy as np
+
+    if isinstance(spectrum, TiledFrame):
+        return spectrum.match(template, mask)
+    if mask is None:
+        if spectrum is not None and use_fft(template.shape, image.shape):
+            return spectrum.match(template)
+        return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    height, width = template.shape[:2]
+    if mask.shape[:2] != (height, width):
+        mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+    result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED, mask=mask)
+    # Windows without variance under the mask divide by zero
+    result[~np.isfinite(result)] = 0
+    return result
+
+
+def frames_differ(previous, current, rect=None, tolerance=8.0, block=16):
+    """
+    Cheap check whether the screen changed between two grayscale captures
+
+    Both frames are reduced to block x block averages, so any visible change
+    of a few dozen pixels shows up while the comparison stays far cheaper
+    than a lookup. The area of a match, when given, is compared at full
+    resolution.
+
+    :param rect: Optional (left, top, width, height) that must be unchanged pixel for pixel
+    :param tolerance: Largest allowed difference in 0-255 levels
+    """
+    import cv2
+    import numpy as np
+
+    if previous.shape != current.shape:
+        return True
+    if rect is not None:
+        left, top, width, height = rect
+        region = (slice(top, top + height), slice(left, left + width))
+        if np.abs(previous[region].astype(np.int16) - current[region]).max(initial=0) > tolerance:
+            return True
+    size = (max(1, current.shape[1] // block), max(1, current.shape[0] // block))
+    small_previous = cv2.resize(previous, size, interpolation=cv2.INTER_AREA)
+    small_current = cv2.resize(current, size, interpolation=cv2.INTER_AREA)
+    return float(cv2.absdiff(small_previous, small_current).max()) > tolerance
+
+
+def color_difference(frame_rgb, template_rgb, mask, x, y):
+    """
+    Largest per-channel difference between the mean colors of a match and the template
+
+    Grayscale matching cannot tell an enabled button from its disabled or
+    highlighted state; the mean color of the matched area can, at the cost
+    of one small crop.
+
+    :param template_rgb: RGB template already resized to the match size
+    :param mask: Mask of the template (any size) or None
+    :return: Difference in 0-255 levels
+    """
+    import cv2
+    import numpy as np
+
+    height, width = template_rgb.shape[:2]
+    crop = frame_rgb[y:y + height, x:x + width]
+    if mask is None:
+        crop_mean = crop.reshape(-1, 3).mean(axis=0)
+        template_mean = template_rgb.reshape(-1, 3).mean(axis=0)
+    else:
+        if mask.shape[:2] != (height, width):
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        visible = mask > 0
+        if not visible.any():
+            return 0.0
+        crop_mean = crop[visible].mean(axis=0)
+        template_mean = template_rgb[visible].mean(axis=0)
+    return float(np.abs(crop_mean - template_mean).max())
+
+
+def find_peaks(result, k=5, suppress=(10, 10), min_value=None):
+    """
+    Top-k local maxima of a cv2.matchTemplate result map
+
+    Each peak suppresses a window of the given size around itself, so the
+    same match is not reported twice at neighbouring pixels.
+
+    :param result: TM_CCOEFF_NORMED result map (float32 numpy array)
+    :param k: Maximum number of peaks
+    :param suppress: (width, height) of the suppressed window, usually the template size
+    :param min_value: Stop at peaks below this value
+    :return: List of (x, y, value), best first
+    """
+    import cv2
+
+    result = result.copy()
+    height, width = result.shape[:2]
+    half_w = max(1, int(suppress[0]) // 2)
+    half_h = max(1, int(suppress[1]) // 2)
+    peaks = []
+    for _ in range(k):
+        _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+        if min_value is not None and max_val < min_value:
+            break
+        if peaks and max_val <= -1.0:
+            break
+        peaks.append((int(x), int(y), float(max_val)))
+        result[max(0, y - half_h):min(height, y + half_h + 1),
+               max(0, x - half_w):min(width, x + half_w + 1)] = -1.0
+    return peaks
+
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+def golden_section_max(evaluate, low, high, tolerance=0.01, stop=None):
+    """
+    Maximize a unimodal function on [low, high] by golden-section search
+
+    Every step keeps one of the two inner points, so each iteration costs a
+    single evaluation and shrinks the bracket by 0.618.
+
+    :param evaluate: callable(x) -> value
+    :param tolerance: Stop when the bracket is narrower than this
+    :param stop: Optional callable(value) -> True to end the search early
+    :return: (best x, best value) of the evaluated points
+    """
+    best = [None, -math.inf]
+
+    def probe(x):
+        value = evaluate(x)
+        if value > best[1]:
+            best[0], best[1] = x, value
+        return value
+
+    def stopped(value):
+        return stop is not None and stop(value)
+
+    a, b = low, high
+    c = b - GOLDEN_RATIO * (b - a)
+    d = a + GOLDEN_RATIO * (b - a)
+    fc = probe(c)
+    if stopped(fc):
+        return tuple(best)
+    fd = probe(d)
+    if stopped(fd):
+        return tuple(best)
+    while b - a > tolerance:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = b - GOLDEN_RATIO * (b - a)
+            fc = probe(c)
+            if stopped(fc):
+                break
+        else:
+            a, c, fc = c, d, fd
+            d = a + GOLDEN_RATIO * (b - a)
+            fd = probe(d)
+            if stopped(fd):
+                break
+    return tuple(best)
+
+
+def reduce_factor(template_shape, target=32, minimum=10):
+    """
+    Resolution factor of the coarse scale scan
+
+    The template's long side becomes about target pixels at ratio 1, its
+    short side never drops below minimum; small templates stay at full size.
+    """
+    height, width = template_shape[:2]
+    factor = min(1.0, target / max(height, width))
+    if min(height, width) * factor < minimum:
+        factor = min(1.0, minimum / min(height, width))
+    return factor
+
+
+def coarse_scale_grid(scale_range, template_shape, factor, max_shift=4.0):
+    """
+    Geometric ratios covering scale_range for the coarse scan
+
+    Neighbouring ratios move the edges of the reduced template by at most
+    max_shift pixels (and the ratio by 5-15%). The confidence peak of the true
+    ratio is wider than that, so it cannot fall between two grid points; the
+    golden-section refinement only needs the bracket.
+    """
+    long_side = max(template_shape[:2]) * factor
+    scales = []
+    scale = scale_range[0]
+    while scale <= scale_range[1]:
+        scales.append(scale)
+        step = 2 * max_shift / (long_side * scale)
+        scale *= 1 + min(0.15, max(0.05, step))
+    return scales
+
+
+def coarse_scan(small_frame, template, mask, scales, factor):
+    """
+    Best confidence of a template at each ratio on a reduced resolution frame
+
+    :param small_frame: The frame resized by factor (cv2.INTER_AREA)
+    :return: List of (scale, confidence, reduced template shape); ratios whose
+             reduced template is under 4 pixels or larger than the frame are left out
+    """
+    import cv2
+
+    results = []
+    for scale in scales:
+        small_template = cv2.resize(
+            template, None, fx=scale * factor, fy=scale * factor, interpolation=cv2.INTER_AREA
+        )
+        if (min(small_template.shape[:2]) < 4 or
+                small_template.shape[0] > small_frame.shape[0] or
+                small_template.shape[1] > small_frame.shape[1]):
+            continue
+        _, max_val, _, _ = cv2.minMaxLoc(match_template(small_frame, small_template, mask))
+        results.append((scale, max_val, small_template.shape))
+    return results
+
+
+def coarse_peaks(values, count=2):
+    """Indices of the count highest local maxima of a list of values"""
+    peaks = [
+        i for i, value in enumerate(values)
+        if (i == 0 or value >= values[i - 1]) and (i == len(values) - 1 or value >= values[i + 1])
+    ]
+    return sorted(peaks, key=lambda i: values[i], reverse=True)[:count]
+
+
+def nms_matches(result, threshold, size, overlap=0.3, limit=None):
+    """
+    Every match of one matchTemplate result map above threshold
+
+    Candidates are the local maxima above threshold (a grey dilation with a
+    template sized kernel, so a flat plateau yields one candidate per match).
+    Overlapping candidates are then removed with a vectorized greedy
+    non-maximum suppression: each kept box drops all remaining boxes whose
+    intersection over union with it exceeds overlap.
+
+    :param result: TM_CCOEFF_NORMED result map
+    :param threshold: Minimum confidence of a match
+    :param size: (width, height) of the template at this scale
+    :param overlap: Maximum intersection over union of two kept matches
+    :param limit: Maximum number of candidates fed to the suppression, best first
+    :return: List of (x, y, confidence), best first
+    """
+    import cv2
+    import numpy as np
+
+    width, height = int(size[0]), int(size[1])
+    kernel = np.ones((max(1, height // 2) | 1, max(1, width // 2) | 1), np.uint8)
+    local_max = cv2.dilate(result, kernel)
+    ys, xs = np.nonzero((result >= threshold) & (result >= local_max))
+    if xs.size == 0:
+        return []
+    scores = result[ys, xs]
+    order = np.argsort(-scores, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    return suppress_boxes(xs[order], ys[order], scores[order], width, height, overlap)
+
+
+def suppress_boxes(xs, ys, scores, widths, heights, overlap=0.3):
+    """
+    Greedy non-maximum suppression of boxes sorted best first
+
+    :param xs, ys: numpy arrays of the top-left corners
+    :param scores: numpy array of the confidences
+    :param widths, heights: Box size, scalars or numpy arrays
+    :return: List of (x, y, confidence) or, with per-box sizes, (x, y, confidence, index)
+    """
+    import numpy as np
+
+    per_box = np.ndim(widths) > 0
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    x2 = xs + widths
+    y2 = ys + heights
+    areas = np.broadcast_to(np.asarray(widths, dtype=np.float64) * heights, xs.shape)
+    remaining = np.arange(xs.size)
+    kept = []
+    while remaining.size:
+        best = remaining[0]
+        kept.append(best)
+        rest = remaining[1:]
+        inter_w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(xs[best], xs[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(ys[best], ys[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter)
+        remaining = rest[iou <= overlap]
+    if per_box:
+        return [(int(xs[i]), int(ys[i]), float(scores[i]), int(i)) for i in kept]
+    return [(int(xs[i]), int(ys[i]), float(scores[i])) for i in kept]
+
+
+def sort_by_position(matches):
+    """
+    Order match dictionaries like text is read: top to bottom, then left to right
+
+    Matches whose vertical centers are less than half a match height apart
+    count as one row, so a row of icons a pixel off is still read left to right.
+    """
+    rows = []
+    for match in sorted(matches, key=lambda m: m["top"] + m["height"] / 2):
+        center_y = match["top"] + match["height"] / 2
+        if rows and center_y - rows[-1][0] < rows[-1][1]["height"] / 2:
+            rows[-1][2].append(match)
+        else:
+            rows.append((center_y, match, [match]))
+    return [match for _, _, row in rows for match in sorted(row, key=lambda m: m["left"])]
+
+
+class FeatureMatcher:
+    """
+    Scale-invariant lookup of templates from keypoint descriptors
+
+    Keypoints are detected once per template (cached per path and
+    modification time) and once per frame (stored in the frame, shared by
+    all templates looked up on it). Matching descriptors, filtered with
+    Lowe's ratio test, give a RANSAC similarity transform (scale, rotation,
+    translation) from which the template's scale and position follow; the
+    caller verifies that estimate with matchTemplate at that one scale.
+
+    Small or flat templates have too few keypoints; estimate() reports
+    that as "no features" so the caller can fall back to the scale search.
+
+    :param kind: "orb" (fast) or "akaze" (slower, more robust)
+    :param ratio: Lowe ratio test threshold
+    :param min_inliers: Minimum RANSAC inliers of an accepted estimate
+    """
+
+    def __init__(self, kind="orb", ratio=0.8, min_inliers=6):
+        self.kind = kind
+        self.ratio = ratio
+        self.min_inliers = min_inliers
+        self._templates = {}
+        # OpenCV detectors are not safe to share between threads
+        self._lock = threading.Lock()
+        self._template_detector = None
+        self._frame_detector = None
+        self._matcher = None
+
+    def _create(self, max_features):
+        import cv2
+
+        if self.kind == "akaze":
+            # Part of the main modules in OpenCV 4, moved to the contrib modules in OpenCV 5
+            create = getattr(cv2, "AKAZE_create", None)
+            if create is None:
+                raise RuntimeError("AKAZE is not available in this OpenCV build, use --match-engine orb")
+            return create()
+        # Smaller patches than the default 31 so that button-sized templates keep keypoints
+        return cv2.ORB_create(nfeatures=max_features, edgeThreshold=15, patchSize=15, fastThreshold=10)
+
+    def _detect(self, detector_attr, max_features, image, mask=None):
+        import cv2
+
+        with self._lock:
+            if getattr(self, detector_attr) is None:
+                setattr(self, detector_attr, self._create(max_features))
+                self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+            keypoints, descriptors = getattr(self, detector_attr).detectAndCompute(image, mask)
+        return keypoints, descriptors
+
+    def template_features(self, path, template):
+        """(keypoints, descriptors) of a template loaded by load_template, cached"""
+        key = (str(path), template["gray"].shape)
+        try:
+            key += (Path(path).stat().st_mtime,)
+        except OSError:
+            pass
+        features = self._templates.get(key)
+        if features is None:
+            features = self._detect("_template_detector", 2000, template["gray"], template["mask"])
+            self._templates[key] = features
+        return features
+
+    def frame_features(self, frame, gray):
+        """(keypoints, descriptors) of a frame dictionary, detected on its first lookup"""
+        cache = frame.setdefault("features", {})
+        features = cache.get(self.kind)
+        if features is None:
+            features = self._detect("_frame_detector", 20000, gray)
+            cache[self.kind] = features
+        return features
+
+    def estimate(self, template_features, frame_features, template_shape):
+        """
+        Estimate where the template is in the frame
+
+        :return: {"left", "top", "scale", "inliers"}, {"error": "no features"} when the
+                 template cannot be matched by keypoints at all, or None when it is not found
+        """
+        import cv2
+        import numpy as np
+
+        template_points, template_descriptors = template_features
+        frame_points, frame_descriptors = frame_features
+        if template_descriptors is None or len(template_points) < self.min_inliers:
+            return {"error": "no features"}
+        if frame_descriptors is None or len(frame_points) < self.min_inliers:
+            return None
+
+        with self._lock:
+            pairs = self._matcher.knnMatch(template_descriptors, frame_descriptors, k=2)
+        good = [pair[0] for pair in pairs if len(pair) == 2 and pair[0].distance < self.ratio * pair[1].distance]
+        if len(good) < self.min_inliers:
+            return None
+
+        source = np.float32([template_points[m.queryIdx].pt for m in good])
+        target = np.float32([frame_points[m.trainIdx].pt for m in good])
+        transform, inliers = cv2.estimateAffinePartial2D(
+            source, target, method=cv2.RANSAC, ransacReprojThreshold=3.0
+        )
+        if transform is None or inliers is None or int(inliers.sum()) < self.min_inliers:
+            return None
+
+        scale = float(np.hypot(transform[0, 0], transform[1, 0]))
+        # Screen content is not rotated; reject estimates that are
+        if scale <= 0 or abs(np.arctan2(transform[1, 0], transform[0, 0])) > 0.1:
+            return None
+        left, top = transform[:, 2]
+        return {"left": int(round(left)), "top": int(round(top)), "scale": scale, "inliers": int(inliers.sum())}
+
+
+class LookupRecord:
+    """Diagnostics of one multi-scale lookup, filled in while the search runs"""
+
+    def __init__(self, lookup_id, template_path, threshold, frame_shape):
+        self.data = {
+            "id": lookup_id,
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "template": str(template_path),
+            "threshold": threshold,
+            "frame": list(frame_shape[:2]),
+        }
+        self.scales = []  # (scale, confidence, phase index)
+        self.phase_ms = {}
+        self._phase = None
+        self._phase_start = None
+        self._start = time.perf_counter()
+        self._best_value = None
+        self._best_map = None
+        self._best_size = None
+        self._best_offset = (0, 0)
+
+    def phase(self, name):
+        """Close the running phase and start timing the next one"""
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phase_ms[self._phase] = self.phase_ms.get(self._phase, 0.0) + (now - self._phase_start) * 1000
+        self._phase = name
+        self._phase_start = now
+
+    def add(self, scale, confidence, result, template_shape, offset=(0, 0)):
+        """
+        Record one scale; the result map of the best scale is kept for the peaks
+
+        :param offset: Frame position of result[0, 0] when only a region was matched
+        """
+        self.scales.append((float(scale), float(confidence), PHASES.index(self._phase or "common")))
+        # Without a result map (reduced resolution scans) only the curve is recorded
+        if result is not None and (self._best_value is None or confidence > self._best_value):
+            self._best_value = confidence
+            self._best_map = result
+            self._best_size = (template_shape[1], template_shape[0])
+            self._best_offset = offset
+
+    def finish(self, location, top_k):
+        self.phase(None)
+        data = self.data
+        data["found"] = location is not None
+        data["total_ms"] = round((time.perf_counter() - self._start) * 1000, 3)
+        data["phases_ms"] = {name: round(ms, 3) for name, ms in self.phase_ms.items()}
+        data["scales"] = [round(s, 4) for s, _, _ in self.scales]
+        data["confidences"] = [round(c, 4) for _, c, _ in self.scales]
+        data["scale_phases"] = [p for _, _, p in self.scales]
+        if self.scales:
+            best = max(self.scales, key=lambda item: item[1])
+            data["best"] = {"scale": round(best[0], 4), "confidence": round(best[1], 4)}
+        if self._best_map is not None and top_k:
+            offset_x, offset_y = self._best_offset
+            data["peaks"] = [
+                [x + offset_x, y + offset_y, round(value, 4)]
+                for x, y, value in find_peaks(self._best_map, top_k, self._best_size)
+            ]
+        self._best_map = None
+        return data
+
+
+class MatchDiagnostics:
+    """
+    Opt-in recorder of multi-scale lookup internals
+
+    Per lookup it keeps the scale -> confidence curve, the top-k peaks of the
+    best scale and the time spent in each phase (load, common, coarse, golden, ...).
+
+    :param path: *.jsonl streams one JSON object per lookup;
+                 *.npz collects everything and writes numpy arrays on close()
+    :param top_k: Number of peaks recorded per lookup
+    """
+
+    def __init__(self, path, top_k=5):
+        self.path = Path(str(path).strip('"\''))
+        self.top_k = top_k
+        self.records = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._npz = self.path.suffix.lower() == ".npz"
+
+    def begin(self, template_path, threshold, frame_shape):
+        with self._lock:
+            self._next_id += 1
+            lookup_id = self._next_id
+        record = LookupRecord(lookup_id, template_path, threshold, frame_shape)
+        record.phase("load")
+        return record
+
+    def end(self, record, location):
+        data = record.finish(location, self.top_k)
+        with self._lock:
+            if self._npz:
+                self.records.append(data)
+            else:
+                with open(self.path, "a", encoding="utf-8") as diagnostics_file:
+                    diagnostics_file.write(json.dumps(data, separators=(",", ":")) + "\n")
+        return data
+
+    def close(self):
+        """Write the collected lookups of an .npz target"""
+        if not self._npz or not self.records:
+            return
+        import numpy as np
+
+        with self._lock:
+            records, self.records = self.records, []
+        scale_lookup = [r["id"] for r in records for _ in r["scales"]]
+        np.savez_compressed(
+            self.path,
+            lookup_id=np.array([r["id"] for r in records], dtype=np.int32),
+            template=np.array([r["template"] for r in records]),
+            threshold=np.array([r["threshold"] for r in records], dtype=np.float32),
+            found=np.array([r["found"] for r in records], dtype=bool),
+            total_ms=np.array([r["total_ms"] for r in records], dtype=np.float32),
+            phase_names=np.array(PHASES),
+            phase_ms=np.array(
+                [[r["phases_ms"].get(name, 0.0) for name in PHASES] for r in records], dtype=np.float32
+            ),
+            scale_lookup_id=np.array(scale_lookup, dtype=np.int32),
+            scale=np.array([s for r in records for s in r["scales"]], dtype=np.float32),
+            confidence=np.array([c for r in records for c in r["confidences"]], dtype=np.float32),
+            scale_phase=np.array([p for r in records for p in r["scale_phases"]], dtype=np.int8),
+            peaks=np.array(
+                [[r["id"], x, y, v] for r in records for x, y, v in r.get("peaks", [])], dtype=np.float32
+            ).reshape(-1, 4),
+        )
@@ -0,0 +1,226 @@
+# falconPack.py
+#
+# Template packs: the template images of a project folder, decoded once and
+# stored in a single file that is memory-mapped at runtime.
+#
+# Build one with:
+#   falconCommand --build-pack C:\MyProject\images
+# which writes C:\MyProject\images\falcon_templates.fpack. Lookups of any
+# image below that folder then read the decoded arrays straight from the
+# mapped file instead of decoding and rescaling the PNG.
+#
+# File layout:
+#   8 bytes   magic b"FALCPACK"
+#   4 bytes   format version (little endian uint32)
+#   4 bytes   header length N (little endian uint32)
+#   N bytes   UTF-8 JSON header, padded so the data starts 64-byte aligned
+#   data      uint8 arrays, each starting 64-byte aligned
+#
+# The header maps each template's path (relative to the packed folder, with
+# forward slashes) to the offset and shape of its arrays - gray, color (RGB),
+# mask and the grayscale pyramid at the common lookup ratios - and the source
+# file's size and modification time, so a changed PNG is decoded again
+# instead of being served stale.
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+MAGIC = b"FALCPACK"
+VERSION = 1
+PACK_NAME = "falcon_templates.fpack"
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+ALIGNMENT = 64
+
+# Folder -> TemplatePack (or None), filled while looking for packs
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def build_pack(directory, output=None):
+    """
+    Decode every image below directory into a template pack
+
+    :param directory: Folder with the template images (searched recursively)
+    :param output: Pack file to write (default: directory/falcon_templates.fpack)
+    :return: (output path, number of templates, file size in bytes)
+    """
+    import cv2
+
+    from falconMatch import COMMON_SCALES, decode_template
+
+    root = Path(directory)
+    if not root.is_dir():
+        raise NotADirectoryError(f"Template folder not found: {directory}")
+    output = Path(output) if output else root / PACK_NAME
+
+    entries = {}
+    arrays = []
+    offset = 0
+
+    def add(array):
+        nonlocal offset
+        offset = _align(offset)
+        arrays.append((offset, array))
+        record = [offset] + list(array.shape)
+        offset += array.nbytes
+        return record
+
+    for image_path in sorted(root.rglob("*")):
+        if image_path.suffix.lower() not in IMAGE_SUFFIXES or not image_path.is_file():
+            continue
+        template = decode_template(image_path)
+        if template is None:
+            print(f"[Warning] Skipping unreadable image: {image_path}")
+            continue
+        stat = image_path.stat()
+        gray = template["gray"]
+        pyramid = {}
+        for scale in COMMON_SCALES:
+            # Same call as the lookup, so packed and decoded templates match bit for bit
+            resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            pyramid[repr(scale)] = add(resized)
+        entries[image_path.relative_to(root).as_posix()] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "gray": add(gray),
+            "color": add(template["color"]),
+            "mask": add(template["mask"]) if template["mask"] is not None else None,
+            "pyramid": pyramid,
+        }
+
+    header = json.dumps(
+        {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "templates": entries}, separators=(",", ":")
+    ).encode("utf-8")
+    data_start = _align(16 + len(header))
+    header += b" " * (data_start - 16 - len(header))
+
+    # Write next to the target and swap, so a running lookup never maps a half-written pack
+    temporary = output.with_name(output.name + ".tmp")
+    with open(temporary, "wb") as pack_file:
+        pack_file.write(MAGIC + struct.pack("<II", VERSION, len(header)) + header)
+        for array_offset, array in arrays:
+            pack_file.seek(data_start + array_offset)
+            pack_file.write(array.tobytes())
+    with _packs_lock:
+        # The pack being replaced may be mapped by this process: Windows refuses to replace
+        # a mapped file, and templates decoded from it must not outlive it
+        _release_pack(output)
+        os.replace(temporary, output)
+    return output, len(entries), output.stat().st_size
+
+
+def _release_pack(path):
+    """Forget and close the opened pack stored at path (called with _packs_lock held)"""
+    from falconMatch import evict_templates
+
+    directory = Path(os.path.abspath(path)).parent
+    pack = _packs.pop(directory, None)
+    if pack is None or Path(os.path.abspath(pack.path)) != Path(os.path.abspath(path)):
+        return
+    evict_templates(directory)
+    if not pack.close():
+        print(f"[Warning] Template pack {path} is still in use, it cannot be unmapped")
+
+
+class TemplatePack:
+    """
+    Read-only view of a template pack
+
+    Opening only parses the JSON header; arrays are numpy views on the
+    memory-mapped file, so templates are paged in when a lookup touches them.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        with open(self.path, "rb") as pack_file:
+            self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:8] != MAGIC:
+            raise ValueError(f"Not a template pack: {path}")
+        version, header_length = struct.unpack("<II", self._map[8:16])
+        if version != VERSION:
+            raise ValueError(f"Unsupported template pack version {version}: {path}")
+        self.header = json.loads(bytes(self._map[16:16 + header_length]).decode("utf-8"))
+        self.templates = self.header["templates"]
+        self._data_start = 16 + header_length
+
+    def __len__(self):
+        return len(self.templates)
+
+    def close(self):
+        """
+        Unmap the pack file
+
+        :return: False when arrays of the pack are still referenced (the file stays mapped)
+        """
+        try:
+            self._map.close()
+        except BufferError:
+            return False
+        return True
+
+    def _array(self, record):
+        import numpy as np
+
+        offset, shape = record[0], record[1:]
+        count = 1
+        for dimension in shape:
+            count *= dimension
+        return np.frombuffer(self._map, np.uint8, count, self._data_start + offset).reshape(shape)
+
+    def get(self, relative_path, stat=None):
+        """
+        Template dictionary of a packed image, like falconMatch.decode_template
+
+        :param stat: os.stat_result of the image; a size or time mismatch means
+                     the image changed after packing and None is returned
+        """
+        entry = self.templates.get(relative_path)
+        if entry is None:
+            return None
+        if stat is not None and (stat.st_size != entry["size"] or abs(stat.st_mtime - entry["mtime"]) > 1e-3):
+            return None
+        return {
+            "gray": self._array(entry["gray"]),
+            "color": self._array(entry["color"]),
+            "mask": self._array(entry["mask"]) if entry["mask"] is not None else None,
+            "pyramid": {float(scale): self._array(record) for scale, record in entry["pyramid"].items()},
+        }
+
+
+def _pack_in(directory):
+    """TemplatePack stored in directory, opened once per folder"""
+    with _packs_lock:
+        if directory in _packs:
+            return _packs[directory]
+        pack = None
+        candidate = directory / PACK_NAME
+        if candidate.is_file():
+            try:
+                pack = TemplatePack(candidate)
+            except (OSError, ValueError) as e:
+                print(f"[Warning] Ignoring template pack {candidate}: {str(e)}")
+        _packs[directory] = pack
+        return pack
+
+
+def pack_template(path, stat=None):
+    """
+    Look up an image in the nearest template pack of its folder or a parent folder
+
+    :return: Template dictionary, or None when no pack holds an up-to-date copy
+    """
+    image_path = Path(os.path.abspath(path))
+    for directory in image_path.parents:
+        pack = _pack_in(directory)
+        if pack is not None:
+            return pack.get(image_path.relative_to(directory).as_posix(), stat)
+    return None
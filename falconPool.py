@@ -0,0 +1,254 @@
+# falconPool.py
+#
+# Process pool running image lookups outside the script's process.
+#
+# Template matching is CPU bound (cv2.resize + cv2.matchTemplate), so one
+# process caps heavy scripts at a single core. MatchPool keeps a few
+# persistent worker processes, each with its own AutoGUIController whose
+# template cache stays warm. Frames reach the workers through
+# falconCapture.SharedFrameBuffer; a job only carries the frame handle, the
+# template path and the lookup parameters.
+#
+# submit() queues a whole lookup and returns a Future, so several lookups
+# (different templates, prefetches) run on different cores at once. A
+# template is always sent to the same worker (hash of its path), so it is
+# decoded once per pool, not once per worker.
+#
+# scan() (--match-split) spreads the ratios of a single lookup instead:
+# AutoGUIController._locate_in_screenshot hands it the common ratios in
+# rounds of one ratio per worker (stopping at the first round reaching the
+# threshold) and the reduced resolution grid split over all workers. The
+# golden-section refinement and the color check stay in the calling process.
+# Every worker then decodes the template, the price of using all cores for
+# one lookup.
+#
+#   pool = MatchPool(workers=4)
+#   handle = controller.share_frame(frame)
+#   future = pool.submit(handle, "ok.png", (0.5, 3.0), 0.9, True)
+#   future.result()  # {"location": {...} or None, "best_miss": ..., "output": "...", "stale": False}
+#   pool.scan(handle, "ok.png", True, [1.0, 1.25, 1.5], None, 0.9)
+#   # [(scale, confidence, (x, y), template shape), ...] or None when the frame changed
+import contextlib
+import io
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker process state: lookup controller, matching helper and reduced copy of the latest shared frame
+_controller = None
+_spectrum = None
+_reduced = None
+
+
+def _init_worker():
+    global _controller
+    from falconCommand import AutoGUIController
+
+    _controller = AutoGUIController()
+    # The script's process keeps the frame history, workers only match
+    _controller.frame_history = None
+
+
+def _frame_spectrum(handle, array, grayscale):
+    """Full-frame matching helper of a shared frame: TiledFrame, or the FrameSpectrum reused by jobs on the same frame"""
+    global _spectrum
+    from falconMatch import TILED_MIN_PIXELS, FrameSpectrum, TiledFrame
+
+    if array.shape[0] * array.shape[1] > TILED_MIN_PIXELS:
+        # Very large screens are matched in tiles, like in the script's process
+        return TiledFrame(array)
+    if not grayscale:
+        return None
+    key = (handle["name"], handle["generation"])
+    if _spectrum is None or _spectrum[0] != key:
+        _spectrum = (key, FrameSpectrum(array))
+    return _spectrum[1]
+
+
+def _reduced_frame(handle, array, factor):
+    """The shared frame resized by factor, like the coarse scan of the script's process"""
+    global _reduced
+    import cv2
+
+    if factor >= 1.0:
+        return array
+    key = (handle["name"], handle["generation"], factor)
+    if _reduced is None or _reduced[0] != key:
+        _reduced = (key, cv2.resize(array, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA))
+    return _reduced[1]
+
+
+def _match_job(
+    handle, template_path, scale_range, confidence, grayscale, color_handle=None, color_tolerance=None,
+    seed_scales=None,
+):
+    """Run AutoGUIController._locate_in_screenshot on a shared frame in a worker"""
+    from falconCapture import attach_shared_frame, shared_frame_valid
+
+    handles = [handle] + ([color_handle] if color_handle is not None else [])
+    screenshot_np = attach_shared_frame(handle)
+    color = None
+    if color_handle is not None:
+        color_np = attach_shared_frame(color_handle)
+        color = (color_np, color_tolerance) if color_np is not None else None
+    if screenshot_np is None or (color_handle is not None and color is None):
+        return {"location": None, "best_miss": None, "output": "", "stale": True}
+
+    _controller._best_miss = None
+    spectrum = _frame_spectrum(handle, screenshot_np, grayscale)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        location = _controller._locate_in_screenshot(
+            screenshot_np, template_path, scale_range, confidence, grayscale, color=color, spectrum=spectrum,
+            seed_scales=seed_scales,
+        )
+    return {
+        "location": location,
+        "best_miss": _controller._best_miss,
+        "output": output.getvalue(),
+        # The frame was overwritten while matching, the result cannot be trusted
+        "stale": not all(shared_frame_valid(h) for h in handles),
+    }
+
+
+def _scan_job(handle, template_path, grayscale, scales, factor):
+    """
+    Score a template at some ratios on a shared frame in a worker
+
+    :return: falconMatch.coarse_scan results when factor is given, otherwise
+             (scale, confidence, location, template shape) per full resolution ratio;
+             None when the frame was overwritten while matching
+    """
+    import cv2
+
+    from falconCapture import attach_shared_frame, shared_frame_valid
+    from falconMatch import coarse_scan, load_template, match_template, resize_template
+
+    array = attach_shared_frame(handle)
+    if array is None:
+        return None
+    loaded = load_template(template_path)
+    if loaded is None:
+        # The script's process reports the unreadable image
+        return []
+    if factor is not None:
+        template = loaded["gray"] if grayscale else loaded["color"]
+        results = coarse_scan(_reduced_frame(handle, array, factor), template, loaded["mask"], scales, factor)
+    else:
+        spectrum = _frame_spectrum(handle, array, grayscale)
+        results = []
+        for scale in scales:
+            resized = resize_template(loaded, scale, grayscale)
+            if resized.shape[0] > array.shape[0] or resized.shape[1] > array.shape[1]:
+                continue
+            _, max_val, _, max_loc = cv2.minMaxLoc(match_template(array, resized, loaded["mask"], spectrum))
+            results.append((scale, max_val, max_loc, resized.shape))
+    return results if shared_frame_valid(handle) else None
+
+
+class MatchPool:
+    """
+    Persistent worker processes matching templates on shared frames
+
+    :param workers: Number of worker processes (default: CPU count - 1)
+    :param split: Spread the ratios of each lookup over all workers (scan())
+                  instead of running whole lookups on their template's worker (submit())
+    """
+
+    def __init__(self, workers=None, split=False):
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        self.split = split
+        if os.name == "posix":
+            # Workers must share this process's resource tracker: one of their own would
+            # remove the shared frame segments when the worker exits
+            from multiprocessing import resource_tracker
+
+            resource_tracker.ensure_running()
+        # One single-process executor per worker, so a template can be pinned to one of them
+        self._executors = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_worker) for _ in range(int(workers))
+        ]
+
+    @property
+    def workers(self):
+        return len(self._executors)
+
+    def worker_for(self, template_path):
+        """Index of the worker that owns a template (stable across runs)"""
+        key = os.path.normcase(os.path.abspath(str(template_path))).encode("utf-8")
+        return zlib.crc32(key) % len(self._executors)
+
+    def _executors_from(self, template_path):
+        """All executors, starting with the template's own worker"""
+        first = self.worker_for(template_path)
+        return self._executors[first:] + self._executors[:first]
+
+    def submit(
+        self, handle, template_path, scale_range, confidence, grayscale, color_handle=None, color_tolerance=None,
+        seed_scales=None,
+    ):
+        """
+        Queue a lookup of template_path on a shared frame
+
+        :param handle: SharedFrameBuffer handle of the frame (grayscale or RGB like grayscale says)
+        :param color_handle: Optional handle of the RGB frame for the color check
+        :param seed_scales: Ratios tried before the common ones (see _locate_in_screenshot)
+        :return: concurrent.futures.Future of the result dictionary
+                 {"location", "best_miss", "output" (printed lookup messages), "stale"}
+        """
+        executor = self._executors[self.worker_for(template_path)]
+        return executor.submit(
+            _match_job, handle, str(template_path), tuple(scale_range), confidence, grayscale,
+            color_handle, color_tolerance, list(seed_scales) if seed_scales else None,
+        )
+
+    def scan(self, handle, template_path, grayscale, scales, factor=None, confidence=None):
+        """
+        Score a template at several ratios on a shared frame, spread over the workers
+
+        :param handle: SharedFrameBuffer handle of the frame (grayscale or RGB like grayscale says)
+        :param factor: Reduced resolution factor of a coarse scan (see falconMatch.coarse_scan),
+                       None for full resolution
+        :param confidence: Full resolution only: ratios are scored in rounds of one per
+                           worker, in order, and the rounds stop once one reaches this
+        :return: Results in ratio order like _scan_job, or None when the frame changed
+        """
+        template_path = str(template_path)
+        scales = list(scales)
+        executors = self._executors_from(template_path)
+        if factor is not None:
+            # Interleaved, so every worker gets small and large ratios alike
+            chunks = [scales[index::self.workers] for index in range(self.workers)]
+            futures = [
+                executor.submit(_scan_job, handle, template_path, grayscale, chunk, factor)
+                for executor, chunk in zip(executors, chunks) if chunk
+            ]
+            parts = [future.result() for future in futures]
+            if any(part is None for part in parts):
+                return None
+            return sorted((item for part in parts for item in part), key=lambda item: item[0])
+
+        results = []
+        for start in range(0, len(scales), self.workers):
+            futures = [
+                executor.submit(_scan_job, handle, template_path, grayscale, [scale], None)
+                for executor, scale in zip(executors, scales[start:start + self.workers])
+            ]
+            for future in futures:
+                part = future.result()
+                if part is None:
+                    return None
+                results.extend(part)
+            if confidence is not None and any(item[1] >= confidence for item in results):
+                break
+        return results
+
+    def warm_up(self):
+        """Start every worker process now instead of on its first job"""
+        for future in [executor.submit(os.getpid) for executor in self._executors]:
+            future.result()
+
+    def shutdown(self, wait=True):
+        for executor in self._executors:
+            executor.shutdown(wait=wait, cancel_futures=True)
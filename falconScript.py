@@ -0,0 +1,263 @@
+# falconScript.py
+#
+# Tokenizer and block compiler for Falcon command files.
+# Shared by falconCommand (execution), falconUI_Tool (validation) and the
+# debugger, so all of them split a line the same way.
+#
+# Line syntax:
+# - tokens are separated by whitespace
+# - "..." groups text with spaces into one token, it may touch other text
+#   (--name="a b" is one token)
+# - \" is a literal quote, inside or outside of quotes; any other backslash
+#   is kept as-is so Windows paths need no escaping
+# - lines starting with # are comments
+import collections
+import re
+
+Token = collections.namedtuple("Token", "value raw line column")
+
+
+class ScriptSyntaxError(ValueError):
+    """Syntax error in a command file, with 1-based line/column when known"""
+
+    def __init__(self, message, line=None, column=None):
+        self.message = message
+        self.line = line
+        self.column = column
+        location = ""
+        if line is not None:
+            location = f"Line {line}"
+            if column is not None:
+                location += f", column {column}"
+            location += ": "
+        super().__init__(location + message)
+
+
+# One token: runs of plain text, escaped quotes and quoted sections.
+# A quoted section may run to the end of the line (unterminated quote).
+# Both plain text and quoted text are matched in runs, not per character.
+_TOKEN_RE = re.compile(r'(?:[^\s"\\]+|\\"|\\|"(?:[^"\\]+|\\"|\\)*(?:"|$))+')
+
+# Commands that open a block closed by --end
+BLOCK_COMMANDS = {"--repeat", "--while-image", "--foreach", "--if-image", "--if-process"}
+CONDITIONAL_COMMANDS = {"--if-image", "--if-process"}
+
+
+def _unquote(raw):
+    # Drop bare quotes, \" becomes a literal quote
+    if '\\"' not in raw:
+        return raw.replace('"', "")
+    return '"'.join(part.replace('"', "") for part in raw.split('\\"'))
+
+
+def _has_open_quote(raw):
+    # Every \" is an escaped quote, so count only the bare ones
+    return raw.replace('\\"', "").count('"') % 2 == 1
+
+
+def tokenize(line, line_number=None, keep_quotes=False, strict=False):
+    """
+    Split one line into Token tuples with their 1-based column
+
+    :param line: Line text (comments are not handled here)
+    :param line_number: Line number stored in the tokens
+    :param keep_quotes: Keep quote characters in the token values
+    :param strict: Raise ScriptSyntaxError on an unterminated quote
+    :return: List of Token(value, raw, line, column)
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(line):
+        raw = match.group()
+        if strict and _has_open_quote(raw):
+            raise ScriptSyntaxError("Unterminated quote", line_number, match.start() + 1)
+        value = raw if keep_quotes or '"' not in raw else _unquote(raw)
+        tokens.append(Token(value, raw, line_number, match.start() + 1))
+    return tokens
+
+
+def tokenize_line(line, keep_quotes=False, strict=False):
+    """
+    Split one line into a list of strings
+
+    >>> tokenize_line('--type "Hello World"')
+    ['--type', 'Hello World']
+    >>> tokenize_line('--type "Hello World"', keep_quotes=True)
+    ['--type', '"Hello World"']
+    """
+    if strict:
+        return [token.value for token in tokenize(line, keep_quotes=keep_quotes, strict=True)]
+    if keep_quotes:
+        return _TOKEN_RE.findall(line)
+    return [raw if '"' not in raw else _unquote(raw) for raw in _TOKEN_RE.findall(line)]
+
+
+def is_comment_or_blank(line):
+    stripped = line.strip()
+    return not stripped or stripped.startswith("#")
+
+
+def parse_lines(lines, keep_quotes=False):
+    """
+    Tokenize the executable lines of a script
+
+    :param lines: Iterable of line strings (e.g. an open file or text.splitlines())
+    :return: List of (line_number, tokens) tuples, blank lines and comments skipped
+    """
+    parsed = []
+    for line_number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        # tokenize_line inlined: this runs once per line of large command files
+        parts = _TOKEN_RE.findall(stripped)
+        if not keep_quotes:
+            parts = [raw if '"' not in raw else _unquote(raw) for raw in parts]
+        if parts:
+            parsed.append((line_number, parts))
+    return parsed
+
+
+def is_batch_block_start(parts):
+    """A bare --batch (optionally with its gap option) opens a --batch block"""
+    return parts[0] == "--batch" and (
+        len(parts) == 1 or (len(parts) == 3 and parts[1] == "--batch-gap")
+    )
+
+
+def check_blocks(commands):
+    """
+    Report every block structure error instead of stopping at the first one
+
+    :param commands: List of (line_number, tokens) tuples
+    :return: List of (line_number, message) tuples
+    """
+    errors = []
+    stack = []  # (line_number, command)
+    for line_number, parts in commands:
+        command = parts[0]
+        if command in BLOCK_COMMANDS or is_batch_block_start(parts):
+            stack.append((line_number, command))
+        elif command == "--else":
+            if not stack or stack[-1][1] not in CONDITIONAL_COMMANDS:
+                errors.append((line_number, "--else without a matching --if-image/--if-process"))
+        elif command == "--end":
+            if stack:
+                stack.pop()
+            else:
+                errors.append((line_number, "--end without an open block"))
+    for line_number, command in stack:
+        errors.append((line_number, f"{command} block is missing its closing --end"))
+    return errors
+
+
+def compile_blocks(commands):
+    """
+    Compile tokenized command file lines into a tree of nodes, so loops run
+    without re-tokenizing or re-parsing their body on every iteration.
+
+    Block constructs (each closed by --end):
+    --repeat N [VAR]               run the body N times (VAR = 1..N)
+    --while-image IMAGE [--max N]  run the body while IMAGE is on screen
+    --foreach VAR VALUE1 VALUE2    run the body once per value
+    --batch [--batch-gap S]        send the body lines as one --batch
+
+    Conditional blocks (optionally split by --else, closed by --end):
+    --if-image IMAGE               run the body if IMAGE is on screen
+    --if-process NAME              run the body if process NAME is running
+
+    Inside a block ${VAR} is replaced with the loop variable.
+
+    :param commands: List of (line_number, tokens) tuples
+    :return: List of node dictionaries
+    :raises ScriptSyntaxError: on the first malformed block
+    """
+    root = []
+    stack = []  # (node, opening line number)
+    body = root
+
+    for line_number, parts in commands:
+        keyword = parts[0]
+
+        if stack and stack[-1][0]["type"] == "batch" and keyword != "--end":
+            batch = stack[-1][0]["args"]
+            if batch[-1] != "--batch":
+                batch.append(";")
+            # "--click 100 200" becomes event "click 100 200"
+            batch.append(keyword.lstrip("-"))
+            batch.extend(parts[1:])
+            continue
+
+        if keyword == "--end":
+            if len(parts) != 1:
+                raise ScriptSyntaxError("--end takes no arguments", line_number)
+            if not stack:
+                raise ScriptSyntaxError("--end without an open block", line_number)
+            node, _ = stack.pop()
+            if node["type"] == "batch":
+                if node["args"][-1] == "--batch":
+                    raise ScriptSyntaxError("--batch block does not contain any events", line_number)
+                node["type"] = "command"
+                node["templated"] = any("${" in arg for arg in node["args"])
+            body = stack[-1][0].get("else", stack[-1][0]["body"]) if stack else root
+            continue
+
+        if keyword == "--else":
+            if len(parts) != 1:
+                raise ScriptSyntaxError("--else takes no arguments", line_number)
+            if not stack or stack[-1][0]["type"] not in ("if-image", "if-process") or "else" in stack[-1][0]:
+                raise ScriptSyntaxError("--else without a matching --if-image/--if-process", line_number)
+            stack[-1][0]["else"] = []
+            body = stack[-1][0]["else"]
+            continue
+
+        node = None
+        if keyword in CONDITIONAL_COMMANDS:
+            if len(parts) != 2:
+                raise ScriptSyntaxError(f"{keyword} requires exactly one argument", line_number)
+            node = {"type": keyword[2:], "target": parts[1]}
+        elif keyword == "--repeat":
+            if len(parts) not in [2, 3]:
+                raise ScriptSyntaxError("--repeat requires COUNT and an optional VAR name", line_number)
+            try:
+                count = int(parts[1])
+            except ValueError:
+                raise ScriptSyntaxError(f"invalid repeat count '{parts[1]}'", line_number)
+            node = {"type": "repeat", "count": count,
+                    "var": parts[2] if len(parts) == 3 else None}
+        elif keyword == "--while-image":
+            if len(parts) == 2:
+                max_loops = None
+            elif len(parts) == 4 and parts[2] == "--max":
+                try:
+                    max_loops = int(parts[3])
+                except ValueError:
+                    raise ScriptSyntaxError(f"invalid --max value '{parts[3]}'", line_number)
+            else:
+                raise ScriptSyntaxError("--while-image requires IMAGE_PATH and an optional --max N", line_number)
+            node = {"type": "while-image", "image": parts[1], "max": max_loops}
+        elif keyword == "--foreach":
+            if len(parts) < 3:
+                raise ScriptSyntaxError("--foreach requires VAR and at least one value", line_number)
+            node = {"type": "foreach", "var": parts[1], "values": parts[2:]}
+        elif is_batch_block_start(parts):
+            node = {"type": "batch", "args": parts[1:] + ["--batch"], "line": line_number}
+
+        if node is not None:
+            node.setdefault("body", [])
+            node.setdefault("line", line_number)
+            body.append(node)
+            stack.append((node, line_number))
+            body = node["body"]
+            continue
+
+        body.append({
+            "type": "command",
+            "args": parts,
+            "line": line_number,
+            "templated": any("${" in arg for arg in parts),
+        })
+
+    if stack:
+        node, line_number = stack[-1]
+        raise ScriptSyntaxError(f"--{node['type']} block is missing its closing --end", line_number)
+    return root
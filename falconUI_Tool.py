@@ -11,6 +11,9 @@ import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 
+from falconEngine import FalconEngine
+from falconScript import ScriptSyntaxError, check_blocks, tokenize_line
+
 # 確保控制台輸出使用 UTF-8
 if sys.platform == 'win32':
     import codecs
@@ -126,6 +129,11 @@ class FalconUIScriptBuilder:
 
         # Initialize process and queue for execution logs
         self.current_process = None
+        # In-process engine (created on first use) instead of spawning falconCommand.exe
+        self.engine = None
+        self.use_engine_var = tk.BooleanVar(value=True)
+        # Start it once the window is up, so the first run finds it warm
+        self.root.after_idle(self.get_engine)
         self.log_queue = queue.Queue()
 
         # Initialize autosave and backup settings
@@ -560,6 +568,11 @@ class FalconUIScriptBuilder:
             "Keyboard Input": [
                 {"name": "--type", "description": "Type text", "params": ["TEXT"]},
                 {"name": "--press", "description": "Press a key", "params": ["KEY"]},
+                {
+                    "name": "--fast-press",
+                    "description": "Press a key many times at a fixed rate",
+                    "params": ["KEY", "COUNT(optional)", "DELAY(optional)"],
+                },
                 {
                     "name": "--clipboard-copy",
                     "description": "Copy selection to clipboard",
@@ -633,7 +646,7 @@ class FalconUIScriptBuilder:
                 {
                     "name": "--click-image",
                     "description": "Click on image",
-                    "params": ["IMAGE_PATH"],
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
                 },
                 {
                     "name": "--search-image",
@@ -643,11 +656,16 @@ class FalconUIScriptBuilder:
                 {
                     "name": "--double-click-image",
                     "description": "Double-click on image",
-                    "params": ["IMAGE_PATH"],
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
                 },
                 {
                     "name": "--right-click-image",
                     "description": "Right-click on image",
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
+                },
+                {
+                    "name": "--find-all",
+                    "description": "List every occurrence of an image",
                     "params": ["IMAGE_PATH"],
                 },
                 {
@@ -667,9 +685,58 @@ class FalconUIScriptBuilder:
                     "description": "Execute command file",
                     "params": ["FILE_PATH"],
                 },
+                {
+                    "name": "--batch",
+                    "description": "Send input events back-to-back (';' separated, or a block closed by --end)",
+                    "params": ["EVENTS(optional)", "--batch-gap(optional)"],
+                },
+            ],
+            "Flow Control": [
+                {
+                    "name": "--repeat",
+                    "description": "Repeat the following block N times (until --end)",
+                    "params": ["COUNT", "VAR(optional)"],
+                },
+                {
+                    "name": "--while-image",
+                    "description": "Repeat the following block while an image is on screen",
+                    "params": ["IMAGE_PATH", "--max N(optional)"],
+                },
+                {
+                    "name": "--foreach",
+                    "description": "Run the following block once per value, use ${VAR} inside",
+                    "params": ["VAR", "VALUES"],
+                },
+                {
+                    "name": "--if-image",
+                    "description": "Run the following block only if an image is on screen",
+                    "params": ["IMAGE_PATH"],
+                },
+                {
+                    "name": "--if-process",
+                    "description": "Run the following block only if a process is running",
+                    "params": ["PROCESS_NAME"],
+                },
+                {
+                    "name": "--else",
+                    "description": "Start the alternative branch of --if-image/--if-process",
+                    "params": [],
+                },
+                {
+                    "name": "--end",
+                    "description": "Close a --repeat, --while-image, --foreach, --if-* or --batch block",
+                    "params": [],
+                },
             ],
         }
 
+        # Name -> definition index used by the validator
+        self.command_index = {
+            command["name"]: command
+            for commands in self.command_categories.values()
+            for command in commands
+        }
+
         # Create pages for each category with improved styling
         for category_name, commands in self.command_categories.items():
             category_frame = ttk.Frame(self.command_notebook)
@@ -973,6 +1040,11 @@ class FalconUIScriptBuilder:
         )
         self.script_editor.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.script_editor.bind("<KeyRelease>", lambda e: self.on_script_modified())
+        self.script_editor.bind("<<Modified>>", self.on_editor_modified)
+        self.script_editor.bind("<Motion>", self.show_validation_tooltip)
+        self.script_editor.tag_configure(
+            "validation_error", underline=True, foreground="#CC0000", background="#FFECEC"
+        )
 
         # Add shortcut key bindings - but with custom event handlers to prevent double actions
         self.script_editor.bind("<Control-s>", lambda e: self.save_script())
@@ -1048,6 +1120,18 @@ class FalconUIScriptBuilder:
         # Start periodic check for log messages
         self.check_log_queue()
 
+        # Background validation: the worker validates, the Tk thread only renders
+        self._validation_cache = {}
+        # The cache is shared by the Tk thread and the validation worker
+        self._validation_lock = threading.Lock()
+        self._validation_errors = {}
+        self._validation_generation = 0
+        self._validation_after_id = None
+        self._validation_requests = queue.Queue()
+        self._validation_results = queue.Queue()
+        threading.Thread(target=self.validation_worker, daemon=True).start()
+        self.check_validation_results()
+
     def save_log(self):
         """Save log to file"""
         file_path = filedialog.asksaveasfilename(
@@ -1131,6 +1215,102 @@ class FalconUIScriptBuilder:
                 text="Script execution will continue even if errors occur"
             )
 
+    def validate_line(self, line):
+        """
+        Validate a single script line
+
+        Only depends on the line text and self.command_index, so results are
+        cached per line text and it is safe to call from the validation thread.
+
+        :return: Error message, or None if the line is valid
+        """
+        return self._check_line(line)[0]
+
+    def _check_line(self, line):
+        """Cached (error message, block tokens) of a line; block tokens are None for blank lines and comments"""
+        with self._validation_lock:
+            cached = self._validation_cache.get(line)
+        if cached is not None:
+            return cached
+
+        error = None
+        block_parts = None
+        stripped = line.strip()
+
+        # Skip empty lines and comments
+        if not stripped or stripped.startswith("#"):
+            pass
+        # Validate basic command syntax
+        elif not stripped.startswith("--"):
+            error = "Command must start with '--'"
+        else:
+            # Split command and parameters (quotes are kept, like the CLI receives them)
+            try:
+                parts = tokenize_line(stripped, keep_quotes=True, strict=True)
+            except ScriptSyntaxError as e:
+                parts = None
+                error = f"{e.message} at column {e.column}"
+
+            if parts is None:
+                block_parts = stripped.split()
+                pass
+            elif not parts:
+                error = "Empty command"
+            else:
+                command = parts[0]
+                parameters = parts[1:]
+                # Only --batch needs its options to tell a block from a single line
+                block_parts = parts if command == "--batch" else parts[:1]
+                command_def = self.command_index.get(command)
+
+                if command_def is None:
+                    error = f"Unknown command: {command}"
+                # Check parameter count if the command definition exists
+                elif "params" in command_def:
+                    required_params = [
+                        p for p in command_def["params"] if not p.endswith("(optional)")
+                    ]
+                    if len(parameters) < len(required_params):
+                        missing = len(required_params) - len(parameters)
+                        error = f"Missing {missing} required parameter(s). Expected: {', '.join(required_params)}"
+
+        if block_parts is None and stripped and not stripped.startswith("#"):
+            block_parts = stripped.split()[:1]
+        with self._validation_lock:
+            # Half-typed lines pile up while editing, keep the cache bounded
+            if len(self._validation_cache) > 10000:
+                self._validation_cache.clear()
+            self._validation_cache[line] = (error, block_parts)
+        return error, block_parts
+
+    def validate_blocks(self, lines):
+        """
+        Check that block commands (--repeat, --if-image, ..., --else, --end) are balanced
+
+        Reuses the command tokens cached by validate_line, so an edit does not
+        re-tokenize the whole script.
+
+        :return: List of (line_number, error message) tuples
+        """
+        commands = []
+        for line_number, line in enumerate(lines, start=1):
+            block_parts = self._check_line(line)[1]
+            if block_parts:
+                commands.append((line_number, block_parts))
+        return check_blocks(commands)
+
+    def collect_validation_errors(self, lines):
+        """Return sorted (line_number, line, error message) tuples for all script lines"""
+        errors = []
+        for line_number, line in enumerate(lines, start=1):
+            error = self.validate_line(line)
+            if error:
+                errors.append((line_number, line.strip(), error))
+        for line_number, error in self.validate_blocks(lines):
+            errors.append((line_number, lines[line_number - 1].strip(), error))
+        errors.sort(key=lambda e: e[0])
+        return errors
+
     def validate_script(self):
         """Validate the script by checking command syntax without executing"""
         script_content = self.script_editor.get("1.0", tk.END)
@@ -1140,88 +1320,9 @@ class FalconUIScriptBuilder:
         self.clear_log()
         self.add_to_log("=== Script Validation ===\n\n", "header")
 
-        valid = True
-        errors = []
-        line_number = 0
-
-        for line in lines:
-            line_number += 1
-            line = line.strip()
-
-            # Skip empty lines and comments
-            if not line or line.startswith("#"):
-                continue
-
-            # Validate basic command syntax
-            if not line.startswith("--"):
-                errors.append((line_number, line, "Command must start with '--'"))
-                valid = False
-                continue
-
-            # Split command and parameters
-            parts = []
-            cmd_parts = []
-            in_quotes = False
-            current_part = ""
-
-            for char in line:
-                if char == '"' and (not in_quotes):
-                    in_quotes = True
-                    current_part += char
-                elif char == '"' and in_quotes:
-                    in_quotes = False
-                    current_part += char
-                elif char == " " and not in_quotes:
-                    if current_part:
-                        parts.append(current_part)
-                        current_part = ""
-                else:
-                    current_part += char
-
-            if current_part:
-                parts.append(current_part)
-
-            if not parts:
-                errors.append((line_number, line, "Empty command"))
-                valid = False
-                continue
-
-            command = parts[0]
-            parameters = parts[1:] if len(parts) > 1 else []
-
-            # Check if the command exists in any category
-            command_exists = False
-            command_def = None
-
-            for category in self.command_categories.values():
-                for cmd in category:
-                    if cmd["name"] == command:
-                        command_exists = True
-                        command_def = cmd
-                        break
-                if command_exists:
-                    break
-
-            if not command_exists:
-                errors.append((line_number, line, f"Unknown command: {command}"))
-                valid = False
-                continue
-
-            # Check parameter count if the command definition exists
-            if command_def and "params" in command_def:
-                required_params = [
-                    p for p in command_def["params"] if not p.endswith("(optional)")
-                ]
-                if len(parameters) < len(required_params):
-                    missing = len(required_params) - len(parameters)
-                    errors.append(
-                        (
-                            line_number,
-                            line,
-                            f"Missing {missing} required parameter(s). Expected: {', '.join(required_params)}",
-                        )
-                    )
-                    valid = False
+        errors = self.collect_validation_errors(lines)
+        valid = not errors
+        self.render_validation_markers(errors)
 
         # Report validation results
         if valid:
@@ -1236,6 +1337,80 @@ class FalconUIScriptBuilder:
 
         return valid
 
+    def on_editor_modified(self, event=None):
+        """Schedule a background validation shortly after the user stops typing"""
+        # Resetting the flag below fires <<Modified>> again, ignore that one
+        if not self.script_editor.edit_modified():
+            return
+        # Reset the flag, otherwise Tk never sends <<Modified>> again
+        self.script_editor.edit_modified(False)
+        if self._validation_after_id is not None:
+            self.root.after_cancel(self._validation_after_id)
+        self._validation_after_id = self.root.after(
+            300, self.request_background_validation
+        )
+
+    def request_background_validation(self):
+        """Hand a snapshot of the editor lines to the validation thread"""
+        self._validation_after_id = None
+        self._validation_generation += 1
+        lines = self.script_editor.get("1.0", "end-1c").splitlines()
+        self._validation_requests.put((self._validation_generation, lines))
+
+    def validation_worker(self):
+        """Validation thread: only lines whose text was not seen before are re-validated"""
+        while True:
+            generation, lines = self._validation_requests.get()
+            # Skip straight to the newest snapshot if the user kept typing
+            try:
+                while True:
+                    generation, lines = self._validation_requests.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                errors = self.collect_validation_errors(lines)
+            except Exception as e:
+                errors = [(0, "", f"Validation failed: {str(e)}")]
+            self._validation_results.put((generation, errors))
+
+    def check_validation_results(self):
+        """Render validation results from the worker thread (Tk thread only)"""
+        try:
+            while True:
+                generation, errors = self._validation_results.get_nowait()
+                # Results for an older snapshot are outdated
+                if generation == self._validation_generation:
+                    self.render_validation_markers(errors)
+        except queue.Empty:
+            pass
+        self.root.after(100, self.check_validation_results)
+
+    def render_validation_markers(self, errors):
+        """Mark lines with errors inline and summarize them in the status bar"""
+        self.script_editor.tag_remove("validation_error", "1.0", tk.END)
+        for line_num, _, _ in errors:
+            if line_num > 0:
+                self.script_editor.tag_add(
+                    "validation_error", f"{line_num}.0", f"{line_num}.end"
+                )
+        self._validation_errors = {line_num: error_msg for line_num, _, error_msg in errors}
+
+        if errors:
+            line_num, _, error_msg = errors[0]
+            self.statusbar.config(
+                text=f"{len(errors)} syntax error(s) - Line {line_num}: {error_msg}"
+            )
+        else:
+            self.statusbar.config(text="Ready")
+
+    def show_validation_tooltip(self, event):
+        """Show the validation error of the line under the mouse in the status bar"""
+        index = self.script_editor.index(f"@{event.x},{event.y}")
+        line_num = int(index.split(".")[0])
+        error_msg = self._validation_errors.get(line_num)
+        if error_msg:
+            self.statusbar.config(text=f"Line {line_num}: {error_msg}")
+
     def create_statusbar(self):
         # Status bar with improved styling
         self.statusbar = ttk.Label(
@@ -1363,6 +1538,10 @@ class FalconUIScriptBuilder:
             variable=self.stop_on_error_var,
             command=self.update_stop_on_error_status,
         )
+        tools_menu.add_checkbutton(
+            label="Run In-Process",
+            variable=self.use_engine_var,
+        )
 
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -2042,8 +2221,8 @@ class FalconUIScriptBuilder:
                 self.stop_btn.config(state=tk.DISABLED)
                 return
 
-        # Check if falconui.exe exists
-        if not os.path.exists(self.falconui_path):
+        # Check if falconui.exe exists (not needed by the in-process engine)
+        if not self.use_engine_var.get() and not os.path.exists(self.falconui_path):
             file_path = filedialog.askopenfilename(
                 title="Select falconCommand.exe location",
                 filetypes=[("Executable Files", "*.exe"), ("All Files", "*.*")],
@@ -2074,24 +2253,30 @@ class FalconUIScriptBuilder:
             # Minimize the main window
             self.root.iconify()
 
-            # Use subprocess to execute with creationflags for non-blocking behavior
-            startupinfo = None
-            creationflags = 0
-            if os.name == "nt":  # Windows
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                # This flag allows child processes to continue running after the parent is closed
-                creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
-
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                encoding="utf-8",
-                startupinfo=startupinfo,
-                creationflags=creationflags,
-            )
+            if self.use_engine_var.get():
+                # The engine job behaves like the process (poll/readline/communicate/terminate)
+                process = self.get_engine().run_file(
+                    self.current_script, self.stop_on_error_var.get()
+                )
+            else:
+                # Use subprocess to execute with creationflags for non-blocking behavior
+                startupinfo = None
+                creationflags = 0
+                if os.name == "nt":  # Windows
+                    startupinfo = subprocess.STARTUPINFO()
+                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                    # This flag allows child processes to continue running after the parent is closed
+                    creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
+
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                    encoding="utf-8",
+                    startupinfo=startupinfo,
+                    creationflags=creationflags,
+                )
 
             # Store the process for potential stopping
             self.current_process = process
@@ -2220,6 +2405,9 @@ class FalconUIScriptBuilder:
 
         # Signal the debug thread to stop
         self.debug_stop_event.set()
+        # Interrupt a step that is still running on the engine
+        if self.engine is not None:
+            self.engine.cancel()
 
         # Reset debug state
         self.exit_debug_mode()
@@ -2304,37 +2492,22 @@ class FalconUIScriptBuilder:
 
                     # Execute the command
                     try:
-                        # Split the command into parts
-                        parts = []
-                        current_part = ""
-                        in_quotes = False
-                        i = 0
-
-                        while i < len(line):
-                            char = line[i]
-                            if char == '"':
-                                in_quotes = not in_quotes
-                                current_part += char
-                            elif char == " " and not in_quotes:
-                                if current_part:
-                                    parts.append(current_part)
-                                    current_part = ""
-                            else:
-                                current_part += char
-                            i += 1
-
-                        if current_part:
-                            parts.append(current_part)
+                        # Split the command into parts (quotes are kept for the CLI)
+                        parts = tokenize_line(line, keep_quotes=True)
 
                         if parts:
-                            # Execute using subprocess
-                            cmd = [self.falconui_path] + parts
-                            process = subprocess.Popen(
-                                cmd,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True,
-                            )
+                            if self.use_engine_var.get():
+                                # Run on the warm in-process engine, without quotes like the CLI sees them
+                                process = self.get_engine().run_command(tokenize_line(line))
+                            else:
+                                # Execute using subprocess
+                                cmd = [self.falconui_path] + parts
+                                process = subprocess.Popen(
+                                    cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True,
+                                )
 
                             stdout, stderr = process.communicate()
 
@@ -2443,6 +2616,12 @@ class FalconUIScriptBuilder:
 
             self.root.after(0, self.exit_debug_mode)
 
+    def get_engine(self):
+        """Return the in-process execution engine, starting it on first use"""
+        if self.engine is None:
+            self.engine = FalconEngine().start()
+        return self.engine
+
     def stop_execution(self):
         """Stop the currently running process"""
         if self.current_process and self.current_process.poll() is None:
@@ -2564,6 +2743,9 @@ class FalconUIScriptBuilder:
             except:
                 pass
 
+        if self.engine is not None:
+            self.engine.shutdown()
+
         self.root.destroy()
 
 
@@ -10,6 +10,9 @@ import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 
+from falconEngine import DebugSession, FalconEngine
+from falconScript import ScriptSyntaxError, check_blocks, parse_lines, tokenize_line
+
 
 class FalconUIScriptBuilder:
     def __init__(self, root):
@@ -120,6 +123,15 @@ class FalconUIScriptBuilder:
 
         # Initialize process and queue for execution logs
         self.current_process = None
+        # In-process engine (created on first use) instead of spawning falconCommand.exe
+        self.engine = None
+        self.use_engine_var = tk.BooleanVar(value=True)
+        # Start it once the window is up, so the first run finds it warm
+        self.root.after_idle(self.get_engine)
+        # Live preview of image matches drawn by the engine's overlay
+        self.match_preview_var = tk.BooleanVar(value=False)
+        self.match_preview_window = None
+        self._match_preview_frames = queue.Queue(maxsize=1)
         self.log_queue = queue.Queue()
 
         # Initialize autosave and backup settings
@@ -164,12 +176,9 @@ class FalconUIScriptBuilder:
 
         # Initialize debug state variables
         self.debug_mode = False
-        self.current_debug_line = 0
-        self.debug_lines = []
-        self.debug_line_numbers = []
-        self.debug_step_event = threading.Event()
-        self.debug_skip_event = threading.Event()
-        self.debug_stop_event = threading.Event()
+        self.debug_session = None
+        self.debug_job = None
+        self.debug_paused_line = None
 
         # Start autosave timer
         self.schedule_autosave()
@@ -554,6 +563,11 @@ class FalconUIScriptBuilder:
             "Keyboard Input": [
                 {"name": "--type", "description": "Type text", "params": ["TEXT"]},
                 {"name": "--press", "description": "Press a key", "params": ["KEY"]},
+                {
+                    "name": "--fast-press",
+                    "description": "Press a key many times at a fixed rate",
+                    "params": ["KEY", "COUNT(optional)", "DELAY(optional)"],
+                },
                 {
                     "name": "--clipboard-copy",
                     "description": "Copy selection to clipboard",
@@ -627,7 +641,7 @@ class FalconUIScriptBuilder:
                 {
                     "name": "--click-image",
                     "description": "Click on image",
-                    "params": ["IMAGE_PATH"],
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
                 },
                 {
                     "name": "--search-image",
@@ -637,11 +651,16 @@ class FalconUIScriptBuilder:
                 {
                     "name": "--double-click-image",
                     "description": "Double-click on image",
-                    "params": ["IMAGE_PATH"],
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
                 },
                 {
                     "name": "--right-click-image",
                     "description": "Right-click on image",
+                    "params": ["IMAGE_PATH", "--index N(optional)"],
+                },
+                {
+                    "name": "--find-all",
+                    "description": "List every occurrence of an image",
                     "params": ["IMAGE_PATH"],
                 },
                 {
@@ -661,9 +680,58 @@ class FalconUIScriptBuilder:
                     "description": "Execute command file",
                     "params": ["FILE_PATH"],
                 },
+                {
+                    "name": "--batch",
+                    "description": "Send input events back-to-back (';' separated, or a block closed by --end)",
+                    "params": ["EVENTS(optional)", "--batch-gap(optional)"],
+                },
+            ],
+            "Flow Control": [
+                {
+                    "name": "--repeat",
+                    "description": "Repeat the following block N times (until --end)",
+                    "params": ["COUNT", "VAR(optional)"],
+                },
+                {
+                    "name": "--while-image",
+                    "description": "Repeat the following block while an image is on screen",
+                    "params": ["IMAGE_PATH", "--max N(optional)"],
+                },
+                {
+                    "name": "--foreach",
+                    "description": "Run the following block once per value, use ${VAR} inside",
+                    "params": ["VAR", "VALUES"],
+                },
+                {
+                    "name": "--if-image",
+                    "description": "Run the following block only if an image is on screen",
+                    "params": ["IMAGE_PATH"],
+                },
+                {
+                    "name": "--if-process",
+                    "description": "Run the following block only if a process is running",
+                    "params": ["PROCESS_NAME"],
+                },
+                {
+                    "name": "--else",
+                    "description": "Start the alternative branch of --if-image/--if-process",
+                    "params": [],
+                },
+                {
+                    "name": "--end",
+                    "description": "Close a --repeat, --while-image, --foreach, --if-* or --batch block",
+                    "params": [],
+                },
             ],
         }
 
+        # Name -> definition index used by the validator
+        self.command_index = {
+            command["name"]: command
+            for commands in self.command_categories.values()
+            for command in commands
+        }
+
         # Create pages for each category with improved styling
         for category_name, commands in self.command_categories.items():
             category_frame = ttk.Frame(self.command_notebook)
@@ -925,6 +993,33 @@ class FalconUIScriptBuilder:
         )
         self.skip_step_btn.pack(side=tk.LEFT, padx=3)
 
+        # Continue to the next breakpoint
+        self.continue_btn = ttk.Button(
+            debug_frame,
+            text="Continue",
+            command=self.continue_debug,
+            state=tk.DISABLED,
+        )
+        self.continue_btn.pack(side=tk.LEFT, padx=3)
+
+        # Run to the line of the cursor (also starts a session)
+        run_to_cursor_btn = ttk.Button(
+            debug_frame,
+            text="Run to Cursor",
+            command=self.run_to_cursor,
+            style="Secondary.TButton",
+        )
+        run_to_cursor_btn.pack(side=tk.LEFT, padx=3)
+
+        # Toggle a breakpoint on the cursor line (F9)
+        breakpoint_btn = ttk.Button(
+            debug_frame,
+            text="Breakpoint",
+            command=self.toggle_breakpoint,
+            style="Secondary.TButton",
+        )
+        breakpoint_btn.pack(side=tk.LEFT, padx=3)
+
         # Stop debug button
         self.stop_debug_btn = ttk.Button(
             debug_frame,
@@ -935,6 +1030,14 @@ class FalconUIScriptBuilder:
         )
         self.stop_debug_btn.pack(side=tk.LEFT, padx=3)
 
+        # Buttons that are only active during a debug session
+        self.debug_control_buttons = [
+            self.next_step_btn,
+            self.skip_step_btn,
+            self.continue_btn,
+            self.stop_debug_btn,
+        ]
+
         # Line indicator in debug mode
         self.current_line_var = tk.StringVar(value="")
         current_line_label = ttk.Label(
@@ -967,6 +1070,15 @@ class FalconUIScriptBuilder:
         )
         self.script_editor.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.script_editor.bind("<KeyRelease>", lambda e: self.on_script_modified())
+        self.script_editor.bind("<<Modified>>", self.on_editor_modified)
+        self.script_editor.bind("<Motion>", self.show_validation_tooltip)
+        self.script_editor.tag_configure(
+            "validation_error", underline=True, foreground="#CC0000", background="#FFECEC"
+        )
+        self.script_editor.tag_configure("breakpoint", background="#FFC7C7")
+        self.script_editor.tag_configure("current_line", background="#FFD700")  # Gold highlight
+        self.script_editor.tag_raise("current_line")
+        self.script_editor.bind("<F9>", self.toggle_breakpoint)
 
         # Add shortcut key bindings - but with custom event handlers to prevent double actions
         self.script_editor.bind("<Control-s>", lambda e: self.save_script())
@@ -987,6 +1099,18 @@ class FalconUIScriptBuilder:
             "# Click commands on the left to add them here\n# Or edit script content directly\n\n",
         )
 
+        # Debug inspector: paused location, loop variables and last image match
+        inspector_container = ttk.LabelFrame(editor_paned, text="Debug Inspector")
+        editor_paned.add(inspector_container, weight=1)
+        self.inspector_tree = ttk.Treeview(
+            inspector_container, columns=("name", "value"), show="headings", height=5
+        )
+        self.inspector_tree.heading("name", text="Name")
+        self.inspector_tree.heading("value", text="Value")
+        self.inspector_tree.column("name", width=160, stretch=False)
+        self.inspector_tree.column("value", width=400)
+        self.inspector_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
         # Execution log area with improved styling
         log_container = ttk.LabelFrame(editor_paned, text="Execution Log")
         editor_paned.add(log_container, weight=1)
@@ -1041,6 +1165,18 @@ class FalconUIScriptBuilder:
         # Start periodic check for log messages
         self.check_log_queue()
 
+        # Background validation: the worker validates, the Tk thread only renders
+        self._validation_cache = {}
+        # The cache is shared by the Tk thread and the validation worker
+        self._validation_lock = threading.Lock()
+        self._validation_errors = {}
+        self._validation_generation = 0
+        self._validation_after_id = None
+        self._validation_requests = queue.Queue()
+        self._validation_results = queue.Queue()
+        threading.Thread(target=self.validation_worker, daemon=True).start()
+        self.check_validation_results()
+
     def save_log(self):
         """Save log to file"""
         file_path = filedialog.asksaveasfilename(
@@ -1124,6 +1260,102 @@ class FalconUIScriptBuilder:
                 text="Script execution will continue even if errors occur"
             )
 
+    def validate_line(self, line):
+        """
+        Validate a single script line
+
+        Only depends on the line text and self.command_index, so results are
+        cached per line text and it is safe to call from the validation thread.
+
+        :return: Error message, or None if the line is valid
+        """
+        return self._check_line(line)[0]
+
+    def _check_line(self, line):
+        """Cached (error message, block tokens) of a line; block tokens are None for blank lines and comments"""
+        with self._validation_lock:
+            cached = self._validation_cache.get(line)
+        if cached is not None:
+            return cached
+
+        error = None
+        block_parts = None
+        stripped = line.strip()
+
+        # Skip empty lines and comments
+        if not stripped or stripped.startswith("#"):
+            pass
+        # Validate basic command syntax
+        elif not stripped.startswith("--"):
+            error = "Command must start with '--'"
+        else:
+            # Split command and parameters (quotes are kept, like the CLI receives them)
+            try:
+                parts = tokenize_line(stripped, keep_quotes=True, strict=True)
+            except ScriptSyntaxError as e:
+                parts = None
+                error = f"{e.message} at column {e.column}"
+
+            if parts is None:
+                block_parts = stripped.split()
+                pass
+            elif not parts:
+                error = "Empty command"
+            else:
+                command = parts[0]
+                parameters = parts[1:]
+                # Only --batch needs its options to tell a block from a single line
+                block_parts = parts if command == "--batch" else parts[:1]
+                command_def = self.command_index.get(command)
+
+                if command_def is None:
+                    error = f"Unknown command: {command}"
+                # Check parameter count if the command definition exists
+                elif "params" in command_def:
+                    required_params = [
+                        p for p in command_def["params"] if not p.endswith("(optional)")
+                    ]
+                    if len(parameters) < len(required_params):
+                        missing = len(required_params) - len(parameters)
+                        error = f"Missing {missing} required parameter(s). Expected: {', '.join(required_params)}"
+
+        if block_parts is None and stripped and not stripped.startswith("#"):
+            block_parts = stripped.split()[:1]
+        with self._validation_lock:
+            # Half-typed lines pile up while editing, keep the cache bounded
+            if len(self._validation_cache) > 10000:
+                self._validation_cache.clear()
+            self._validation_cache[line] = (error, block_parts)
+        return error, block_parts
+
+    def validate_blocks(self, lines):
+        """
+        Check that block commands (--repeat, --if-image, ..., --else, --end) are balanced
+
+        Reuses the command tokens cached by validate_line, so an edit does not
+        re-tokenize the whole script.
+
+        :return: List of (line_number, error message) tuples
+        """
+        commands = []
+        for line_number, line in enumerate(lines, start=1):
+            block_parts = self._check_line(line)[1]
+            if block_parts:
+                commands.append((line_number, block_parts))
+        return check_blocks(commands)
+
+    def collect_validation_errors(self, lines):
+        """Return sorted (line_number, line, error message) tuples for all script lines"""
+        errors = []
+        for line_number, line in enumerate(lines, start=1):
+            error = self.validate_line(line)
+            if error:
+                errors.append((line_number, line.strip(), error))
+        for line_number, error in self.validate_blocks(lines):
+            errors.append((line_number, lines[line_number - 1].strip(), error))
+        errors.sort(key=lambda e: e[0])
+        return errors
+
     def validate_script(self):
         """Validate the script by checking command syntax without executing"""
         script_content = self.script_editor.get("1.0", tk.END)
@@ -1133,88 +1365,9 @@ class FalconUIScriptBuilder:
         self.clear_log()
         self.add_to_log("=== Script Validation ===\n\n", "header")
 
-        valid = True
-        errors = []
-        line_number = 0
-
-        for line in lines:
-            line_number += 1
-            line = line.strip()
-
-            # Skip empty lines and comments
-            if not line or line.startswith("#"):
-                continue
-
-            # Validate basic command syntax
-            if not line.startswith("--"):
-                errors.append((line_number, line, "Command must start with '--'"))
-                valid = False
-                continue
-
-            # Split command and parameters
-            parts = []
-            cmd_parts = []
-            in_quotes = False
-            current_part = ""
-
-            for char in line:
-                if char == '"' and (not in_quotes):
-                    in_quotes = True
-                    current_part += char
-                elif char == '"' and in_quotes:
-                    in_quotes = False
-                    current_part += char
-                elif char == " " and not in_quotes:
-                    if current_part:
-                        parts.append(current_part)
-                        current_part = ""
-                else:
-                    current_part += char
-
-            if current_part:
-                parts.append(current_part)
-
-            if not parts:
-                errors.append((line_number, line, "Empty command"))
-                valid = False
-                continue
-
-            command = parts[0]
-            parameters = parts[1:] if len(parts) > 1 else []
-
-            # Check if the command exists in any category
-            command_exists = False
-            command_def = None
-
-            for category in self.command_categories.values():
-                for cmd in category:
-                    if cmd["name"] == command:
-                        command_exists = True
-                        command_def = cmd
-                        break
-                if command_exists:
-                    break
-
-            if not command_exists:
-                errors.append((line_number, line, f"Unknown command: {command}"))
-                valid = False
-                continue
-
-            # Check parameter count if the command definition exists
-            if command_def and "params" in command_def:
-                required_params = [
-                    p for p in command_def["params"] if not p.endswith("(optional)")
-                ]
-                if len(parameters) < len(required_params):
-                    missing = len(required_params) - len(parameters)
-                    errors.append(
-                        (
-                            line_number,
-                            line,
-                            f"Missing {missing} required parameter(s). Expected: {', '.join(required_params)}",
-                        )
-                    )
-                    valid = False
+        errors = self.collect_validation_errors(lines)
+        valid = not errors
+        self.render_validation_markers(errors)
 
         # Report validation results
         if valid:
@@ -1229,6 +1382,80 @@ class FalconUIScriptBuilder:
 
         return valid
 
+    def on_editor_modified(self, event=None):
+        """Schedule a background validation shortly after the user stops typing"""
+        # Resetting the flag below fires <<Modified>> again, ignore that one
+        if not self.script_editor.edit_modified():
+            return
+        # Reset the flag, otherwise Tk never sends <<Modified>> again
+        self.script_editor.edit_modified(False)
+        if self._validation_after_id is not None:
+            self.root.after_cancel(self._validation_after_id)
+        self._validation_after_id = self.root.after(
+            300, self.request_background_validation
+        )
+
+    def request_background_validation(self):
+        """Hand a snapshot of the editor lines to the validation thread"""
+        self._validation_after_id = None
+        self._validation_generation += 1
+        lines = self.script_editor.get("1.0", "end-1c").splitlines()
+        self._validation_requests.put((self._validation_generation, lines))
+
+    def validation_worker(self):
+        """Validation thread: only lines whose text was not seen before are re-validated"""
+        while True:
+            generation, lines = self._validation_requests.get()
+            # Skip straight to the newest snapshot if the user kept typing
+            try:
+                while True:
+                    generation, lines = self._validation_requests.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                errors = self.collect_validation_errors(lines)
+            except Exception as e:
+                errors = [(0, "", f"Validation failed: {str(e)}")]
+            self._validation_results.put((generation, errors))
+
+    def check_validation_results(self):
+        """Render validation results from the worker thread (Tk thread only)"""
+        try:
+            while True:
+                generation, errors = self._validation_results.get_nowait()
+                # Results for an older snapshot are outdated
+                if generation == self._validation_generation:
+                    self.render_validation_markers(errors)
+        except queue.Empty:
+            pass
+        self.root.after(100, self.check_validation_results)
+
+    def render_validation_markers(self, errors):
+        """Mark lines with errors inline and summarize them in the status bar"""
+        self.script_editor.tag_remove("validation_error", "1.0", tk.END)
+        for line_num, _, _ in errors:
+            if line_num > 0:
+                self.script_editor.tag_add(
+                    "validation_error", f"{line_num}.0", f"{line_num}.end"
+                )
+        self._validation_errors = {line_num: error_msg for line_num, _, error_msg in errors}
+
+        if errors:
+            line_num, _, error_msg = errors[0]
+            self.statusbar.config(
+                text=f"{len(errors)} syntax error(s) - Line {line_num}: {error_msg}"
+            )
+        else:
+            self.statusbar.config(text="Ready")
+
+    def show_validation_tooltip(self, event):
+        """Show the validation error of the line under the mouse in the status bar"""
+        index = self.script_editor.index(f"@{event.x},{event.y}")
+        line_num = int(index.split(".")[0])
+        error_msg = self._validation_errors.get(line_num)
+        if error_msg:
+            self.statusbar.config(text=f"Line {line_num}: {error_msg}")
+
     def create_statusbar(self):
         # Status bar with improved styling
         self.statusbar = ttk.Label(
@@ -1356,6 +1583,15 @@ class FalconUIScriptBuilder:
             variable=self.stop_on_error_var,
             command=self.update_stop_on_error_status,
         )
+        tools_menu.add_checkbutton(
+            label="Run In-Process",
+            variable=self.use_engine_var,
+        )
+        tools_menu.add_checkbutton(
+            label="Match Preview",
+            variable=self.match_preview_var,
+            command=self.toggle_match_preview,
+        )
 
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -1928,8 +2164,8 @@ class FalconUIScriptBuilder:
                 self.stop_btn.config(state=tk.DISABLED)
                 return
 
-        # Check if falconui.exe exists
-        if not os.path.exists(self.falconui_path):
+        # Check if falconui.exe exists (not needed by the in-process engine)
+        if not self.use_engine_var.get() and not os.path.exists(self.falconui_path):
             file_path = filedialog.askopenfilename(
                 title="Select falconCommand.exe location",
                 filetypes=[("Executable Files", "*.exe"), ("All Files", "*.*")],
@@ -1960,24 +2196,30 @@ class FalconUIScriptBuilder:
             # Minimize the main window
             self.root.iconify()
 
-            # Use subprocess to execute with creationflags for non-blocking behavior
-            startupinfo = None
-            creationflags = 0
-            if os.name == "nt":  # Windows
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                # This flag allows child processes to continue running after the parent is closed
-                creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
-
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                encoding="utf-8",
-                startupinfo=startupinfo,
-                creationflags=creationflags,
-            )
+            if self.use_engine_var.get():
+                # The engine job behaves like the process (poll/readline/communicate/terminate)
+                process = self.get_engine().run_file(
+                    self.current_script, self.stop_on_error_var.get()
+                )
+            else:
+                # Use subprocess to execute with creationflags for non-blocking behavior
+                startupinfo = None
+                creationflags = 0
+                if os.name == "nt":  # Windows
+                    startupinfo = subprocess.STARTUPINFO()
+                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                    # This flag allows child processes to continue running after the parent is closed
+                    creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
+
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                    encoding="utf-8",
+                    startupinfo=startupinfo,
+                    creationflags=creationflags,
+                )
 
             # Store the process for potential stopping
             self.current_process = process
@@ -1996,8 +2238,15 @@ class FalconUIScriptBuilder:
             self.statusbar.config(text=f"Execution failed: {str(e)}")
             self.stop_btn.config(state=tk.DISABLED)
 
-    def run_step_by_step(self):
-        """Run the script in step-by-step debug mode"""
+    def run_step_by_step(self, pause_on_start=True, run_to_line=None):
+        """
+        Debug the script on the in-process engine
+
+        :param pause_on_start: Pause before the first command (Step Mode)
+        :param run_to_line: Run until this editor line (Run to Cursor)
+        """
+        if self.debug_mode:
+            return
         if self.is_script_modified:
             response = messagebox.askyesno(
                 "Unsaved Changes", "Script must be saved before running. Continue?"
@@ -2007,22 +2256,8 @@ class FalconUIScriptBuilder:
             if not self.save_script():
                 return
 
-        # Parse the script to extract executable lines
         script_content = self.script_editor.get("1.0", tk.END)
-        lines = script_content.splitlines()
-
-        self.debug_lines = []
-        self.debug_line_numbers = []
-        line_num = 0
-
-        for line in lines:
-            line_num += 1
-            stripped = line.strip()
-            if stripped and not stripped.startswith("#"):
-                self.debug_lines.append(stripped)
-                self.debug_line_numbers.append(line_num)
-
-        if not self.debug_lines:
+        if not parse_lines(script_content.splitlines()):
             messagebox.showinfo(
                 "Debug Mode", "No executable commands found in the script."
             )
@@ -2030,16 +2265,18 @@ class FalconUIScriptBuilder:
 
         # Initialize debug state
         self.debug_mode = True
-        self.current_debug_line = 0
-        self.debug_step_event.clear()
-        self.debug_skip_event.clear()
-        self.debug_stop_event.clear()
+        self.debug_paused_line = None
+        self.debug_session = DebugSession(
+            breakpoints=self.get_breakpoint_lines(), pause_on_start=pause_on_start
+        )
+        if run_to_line is not None:
+            self.debug_session.mode = "run_to"
+            self.debug_session.target_line = run_to_line
 
         # Update UI for debug mode
         self.step_btn.config(state=tk.DISABLED)
-        self.next_step_btn.config(state=tk.NORMAL)
-        self.skip_step_btn.config(state=tk.NORMAL)
-        self.stop_debug_btn.config(state=tk.NORMAL)
+        for button in self.debug_control_buttons:
+            button.config(state=tk.NORMAL)
 
         # Disable normal run button during debug
         for widget in self.root.winfo_children():
@@ -2050,75 +2287,140 @@ class FalconUIScriptBuilder:
         # Clear the log
         self.clear_log()
         self.add_to_log("=== Starting Step-by-Step Debug Mode ===\n\n", "header")
-        self.add_to_log(f"Loaded {len(self.debug_lines)} executable commands\n", "info")
-        self.add_to_log("Press 'Next Step' to execute the first command\n\n", "info")
+        if pause_on_start:
+            self.add_to_log("Paused before the first command, press 'Next Step' to execute it\n\n", "info")
+        else:
+            self.add_to_log("Running to the next breakpoint or cursor line...\n\n", "info")
 
-        # Highlight the first command in the editor
-        self.highlight_debug_line()
+        self.debug_job = self.get_engine().run_debug(
+            self.current_script, self.debug_session, self.stop_on_error_var.get()
+        )
 
-        # Start debug thread
-        debug_thread = threading.Thread(target=self.debug_execution_thread)
+        # The thread blocks on the job's event queue, it never polls
+        debug_thread = threading.Thread(
+            target=self.debug_execution_thread, args=(self.debug_job,)
+        )
         debug_thread.daemon = True
         debug_thread.start()
 
-    def highlight_debug_line(self):
-        """Highlight the current debug line in the editor"""
-        # Clear previous highlights
-        self.script_editor.tag_remove("current_line", "1.0", tk.END)
+    def get_breakpoint_lines(self):
+        """Line numbers carrying the breakpoint tag (the tag moves with edits)"""
+        ranges = self.script_editor.tag_ranges("breakpoint")
+        return {
+            int(str(ranges[i]).split(".")[0]) for i in range(0, len(ranges), 2)
+        }
 
-        if self.current_debug_line < len(self.debug_line_numbers):
-            line_num = self.debug_line_numbers[self.current_debug_line]
-            self.script_editor.tag_add(
-                "current_line", f"{line_num}.0", f"{line_num}.end"
-            )
-            self.script_editor.tag_config(
-                "current_line", background="#FFD700"
-            )  # Gold highlight
-            self.script_editor.see(f"{line_num}.0")  # Scroll to show the line
-
-            # Update line indicator
-            self.current_line_var.set(
-                f"Line {line_num}: {self.debug_lines[self.current_debug_line]}"
-            )
+    def toggle_breakpoint(self, event=None):
+        """Toggle a breakpoint on the line of the insert cursor"""
+        line_num = int(self.script_editor.index(tk.INSERT).split(".")[0])
+        start, end = f"{line_num}.0", f"{line_num}.0 lineend"
+        if "breakpoint" in self.script_editor.tag_names(start):
+            self.script_editor.tag_remove("breakpoint", start, end)
         else:
-            self.current_line_var.set("Debug completed")
+            self.script_editor.tag_add("breakpoint", start, end)
+        if self.debug_session is not None:
+            self.debug_session.set_breakpoints(self.get_breakpoint_lines())
+        return "break"
 
-    def execute_next_step(self):
-        """Execute the next step in debug mode"""
-        if not self.debug_mode or self.current_debug_line >= len(self.debug_lines):
+    def run_to_cursor(self):
+        """Run until the line of the insert cursor, starting a session if needed"""
+        line_num = int(self.script_editor.index(tk.INSERT).split(".")[0])
+        if self.debug_mode:
+            self.debug_session.run_to(line_num)
+        else:
+            self.run_step_by_step(pause_on_start=False, run_to_line=line_num)
+
+    def highlight_debug_line(self, line_num=None, text=""):
+        """Highlight the paused line in the editor (None clears the highlight)"""
+        self.script_editor.tag_remove("current_line", "1.0", tk.END)
+        if line_num is None:
+            self.current_line_var.set(text)
+            return
+        self.script_editor.tag_add("current_line", f"{line_num}.0", f"{line_num}.end")
+        self.script_editor.see(f"{line_num}.0")  # Scroll to show the line
+        self.current_line_var.set(f"Line {line_num}: {text}")
+
+    def update_debug_inspector(self, paused=None):
+        """Show the paused location, loop variables and the last image match"""
+        tree = self.inspector_tree
+        tree.delete(*tree.get_children())
+        if paused is None:
             return
+        tree.insert("", tk.END, values=("Line", paused["line"]))
+        tree.insert("", tk.END, values=("Command", " ".join(paused["args"])))
+        tree.insert("", tk.END, values=("Paused by", paused["reason"]))
+        for name, value in sorted(paused["variables"].items()):
+            tree.insert("", tk.END, values=("${" + name + "}", value))
+        match = paused["last_match"]
+        if match:
+            tree.insert("", tk.END, values=("Last match", match["template"]))
+            tree.insert("", tk.END, values=("  found", "yes" if match["found"] else "no"))
+            if match["confidence"] is not None:
+                tree.insert("", tk.END, values=(
+                    "  confidence", f"{match['confidence']:.3f} (threshold {match['threshold']})"
+                ))
+                tree.insert("", tk.END, values=("  scale", f"{match['scale']:.2f}"))
+                tree.insert("", tk.END, values=("  rect (x, y, w, h)", match["rect"]))
+            tree.insert("", tk.END, values=("  at", match["time"]))
+        else:
+            tree.insert("", tk.END, values=("Last match", "(no image lookup yet)"))
 
-        # Signal the debug thread to execute the next command
-        self.debug_step_event.set()
+    def show_debug_pause(self, paused):
+        """Tk thread: reflect a pause reported by the engine"""
+        if not self.debug_mode:
+            return
+        self.debug_paused_line = paused["line"]
+        self.highlight_debug_line(
+            paused["line"], f"{' '.join(paused['args'])}  [{paused['reason']}]"
+        )
+        self.update_debug_inspector(paused)
 
-    def skip_current_step(self):
-        """Skip the current step in debug mode"""
-        if not self.debug_mode or self.current_debug_line >= len(self.debug_lines):
+    def show_debug_running(self):
+        """Tk thread: the engine left the paused line"""
+        if not self.debug_mode:
             return
+        self.debug_paused_line = None
+        self.highlight_debug_line(None, "Running...")
 
-        # Signal the debug thread to skip the current command
-        self.debug_skip_event.set()
+    def execute_next_step(self):
+        """Execute the paused command and pause before the next one"""
+        if self.debug_mode:
+            self.debug_session.step()
+
+    def skip_current_step(self):
+        """Skip the paused command and pause before the next one"""
+        if self.debug_mode:
+            self.debug_session.skip()
+
+    def continue_debug(self):
+        """Run until the next breakpoint"""
+        if self.debug_mode:
+            self.debug_session.resume()
 
     def stop_debug(self):
         """Stop the debug session"""
         if not self.debug_mode:
             return
 
-        # Signal the debug thread to stop
-        self.debug_stop_event.set()
+        # Release a paused session and interrupt a running command
+        self.debug_session.stop()
+        if self.engine is not None:
+            self.engine.cancel(self.debug_job)
 
         # Reset debug state
         self.exit_debug_mode()
 
     def exit_debug_mode(self):
         """Clean up after debug session ends"""
+        if not self.debug_mode:
+            return
         self.debug_mode = False
+        self.debug_paused_line = None
 
         # Reset UI
         self.step_btn.config(state=tk.NORMAL)
-        self.next_step_btn.config(state=tk.DISABLED)
-        self.skip_step_btn.config(state=tk.DISABLED)
-        self.stop_debug_btn.config(state=tk.DISABLED)
+        for button in self.debug_control_buttons:
+            button.config(state=tk.DISABLED)
 
         # Re-enable normal run button
         for widget in self.root.winfo_children():
@@ -2127,13 +2429,12 @@ class FalconUIScriptBuilder:
                 break
 
         # Clear any highlights
-        self.script_editor.tag_remove("current_line", "1.0", tk.END)
-        self.current_line_var.set("")
+        self.highlight_debug_line(None)
 
         self.add_to_log("\n=== Debug Session Ended ===\n", "header")
 
-    def debug_execution_thread(self):
-        """Thread that handles the actual execution of commands in debug mode"""
+    def debug_execution_thread(self, job):
+        """Thread that turns the engine's debug events into log lines and UI updates"""
 
         # Create a buffer to store all debug output
         debug_log = io.StringIO()
@@ -2145,126 +2446,53 @@ class FalconUIScriptBuilder:
         debug_log.write(
             f"Stop on Error: {'Yes' if self.stop_on_error_var.get() else 'No'}\n"
         )
-        debug_log.write(f"Total Debug Lines: {len(self.debug_lines)}\n\n")
+        debug_log.write(f"Breakpoints: {sorted(self.debug_session.breakpoints) or 'none'}\n\n")
 
         try:
-            while self.current_debug_line < len(self.debug_lines) and self.debug_mode:
-                # Wait for user to press Next, Skip or Stop
-                while not any(
-                    [
-                        self.debug_step_event.is_set(),
-                        self.debug_skip_event.is_set(),
-                        self.debug_stop_event.is_set(),
-                    ]
-                ):
-                    time.sleep(0.1)
-
-                # Check if stop was requested
-                if self.debug_stop_event.is_set():
-                    self.debug_stop_event.clear()
-                    debug_log.write("\n=== Debug Session Stopped by User ===\n")
-                    break
-
-                # Check if skip was requested
-                if self.debug_skip_event.is_set():
-                    self.debug_skip_event.clear()
-                    line = self.debug_lines[self.current_debug_line]
-                    skip_msg = f"Skipping: {line}\n"
-                    debug_log.write(skip_msg)
-                    self.add_to_log(skip_msg, "warning")
-                    self.current_debug_line += 1
-                    self.highlight_debug_line()
-                    continue
-
-                # Next step requested
-                if self.debug_step_event.is_set():
-                    self.debug_step_event.clear()
-
-                    # Get the current command
-                    line = self.debug_lines[self.current_debug_line]
-                    line_num = self.debug_line_numbers[self.current_debug_line]
-
-                    exec_msg = f"Executing line {line_num}: {line}\n"
+            while True:
+                # Blocks until the engine reports something
+                event = job.events.get()
+                event_type = event["type"]
+
+                if event_type == "paused":
+                    pause_msg = f"Paused at line {event['line']} ({event['reason']}): {' '.join(event['args'])}\n"
+                    debug_log.write(pause_msg)
+                    self.add_to_log(pause_msg, "warning")
+                    self.root.after(0, lambda paused=event: self.show_debug_pause(paused))
+                elif event_type == "resumed":
+                    if event["action"] == "skip":
+                        skip_msg = f"Skipping line {event['line']}\n"
+                        debug_log.write(skip_msg)
+                        self.add_to_log(skip_msg, "warning")
+                    self.root.after(0, self.show_debug_running)
+                elif event_type == "command":
+                    exec_msg = f"Executing line {event['line']}: {' '.join(event['args'])}\n"
                     debug_log.write(exec_msg)
                     self.add_to_log(exec_msg, "command")
-
-                    # Execute the command
-                    try:
-                        # Split the command into parts
-                        parts = []
-                        current_part = ""
-                        in_quotes = False
-                        i = 0
-
-                        while i < len(line):
-                            char = line[i]
-                            if char == '"':
-                                in_quotes = not in_quotes
-                                current_part += char
-                            elif char == " " and not in_quotes:
-                                if current_part:
-                                    parts.append(current_part)
-                                    current_part = ""
-                            else:
-                                current_part += char
-                            i += 1
-
-                        if current_part:
-                            parts.append(current_part)
-
-                        if parts:
-                            # Execute using subprocess
-                            cmd = [self.falconui_path] + parts
-                            process = subprocess.Popen(
-                                cmd,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True,
-                            )
-
-                            stdout, stderr = process.communicate()
-
-                            if stdout:
-                                debug_log.write(stdout)
-                                self.add_to_log(stdout, "info")
-
-                            if stderr:
-                                debug_log.write("\n--- Error Output ---\n")
-                                debug_log.write(stderr)
-                                self.add_to_log(stderr, "error")
-
-                            if process.returncode == 0:
-                                success_msg = f"Command completed successfully\n"
-                                debug_log.write(success_msg)
-                                self.add_to_log(success_msg, "success")
-                            else:
-                                error_msg = f"Command failed with exit code {process.returncode}\n"
-                                debug_log.write(error_msg)
-                                self.add_to_log(error_msg, "error")
-
-                                # Check if we should stop on error
-                                if (
-                                    hasattr(self, "stop_on_error_var")
-                                    and self.stop_on_error_var.get()
-                                ):
-                                    stop_msg = "Stopping debug execution due to error\n"
-                                    debug_log.write(stop_msg)
-                                    self.add_to_log(stop_msg, "error")
-                                    break
-                    except Exception as e:
-                        error_msg = f"Error executing command: {str(e)}\n"
-                        debug_log.write(error_msg)
-                        self.add_to_log(error_msg, "error")
-
-                    # Move to next line
-                    self.current_debug_line += 1
-                    self.highlight_debug_line()
-
-            # Debug session completed or stopped
-            if self.current_debug_line >= len(self.debug_lines) and self.debug_mode:
-                completion_msg = "\n=== Debug Execution Completed ===\n"
-                debug_log.write(completion_msg)
-                self.add_to_log(completion_msg, "success")
+                elif event_type == "output":
+                    if event["text"].startswith("[command]"):
+                        continue
+                    debug_log.write(event["text"])
+                    self.add_to_log(
+                        event["text"], "error" if event["stream"] == "stderr" else "info"
+                    )
+                elif event_type == "result":
+                    if event["code"] == 0:
+                        result_msg = "Command completed successfully\n"
+                    else:
+                        result_msg = f"Command failed with exit code {event['code']}\n"
+                    debug_log.write(result_msg)
+                    self.add_to_log(result_msg, "success" if event["code"] == 0 else "error")
+                elif event_type == "finished":
+                    if event["cancelled"]:
+                        end_msg = "\n=== Debug Session Stopped by User ===\n"
+                    elif event["code"] == 0:
+                        end_msg = "\n=== Debug Execution Completed ===\n"
+                    else:
+                        end_msg = f"\n=== Debug Execution Failed (code: {event['code']}) ===\n"
+                    debug_log.write(end_msg)
+                    self.add_to_log(end_msg, "success" if event["code"] == 0 else "error")
+                    break
 
             # Write completion timestamp
             debug_log.write(
@@ -2278,7 +2506,6 @@ class FalconUIScriptBuilder:
                 log_dir = os.path.join("C:/", "Falcon_Log", today)
                 os.makedirs(log_dir, exist_ok=True)
 
-
                 # Extract original script name
                 script_name = os.path.basename(self.current_script)
                 script_name = os.path.splitext(script_name)[0]
@@ -2328,6 +2555,71 @@ class FalconUIScriptBuilder:
 
             self.root.after(0, self.exit_debug_mode)
 
+    def toggle_match_preview(self):
+        """Show or hide the window previewing every image match of the engine"""
+        engine = self.get_engine()
+        try:
+            engine.wait_ready(10)
+        except Exception as e:
+            self.match_preview_var.set(False)
+            messagebox.showerror("Match Preview", f"In-process engine unavailable: {str(e)}")
+            return
+
+        if not self.match_preview_var.get():
+            engine.controller.overlay = None
+            if self.match_preview_window is not None:
+                self.match_preview_window.destroy()
+                self.match_preview_window = None
+            return
+
+        from falconCapture import MatchOverlay
+
+        self.match_preview_window = tk.Toplevel(self.root)
+        self.match_preview_window.title("Match Preview")
+        self.match_preview_window.attributes("-topmost", True)
+        self.match_preview_window.protocol(
+            "WM_DELETE_WINDOW",
+            lambda: (self.match_preview_var.set(False), self.toggle_match_preview()),
+        )
+        self.match_preview_label = ttk.Label(
+            self.match_preview_window, text="Waiting for the next image match..."
+        )
+        self.match_preview_label.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        # Frames are drawn on the overlay thread, the Tk thread only displays them
+        engine.controller.overlay = MatchOverlay(callback=self.queue_match_preview)
+        self.refresh_match_preview()
+
+    def queue_match_preview(self, image):
+        """Overlay thread: keep only the newest annotated frame"""
+        image.thumbnail((640, 360))
+        try:
+            self._match_preview_frames.get_nowait()
+        except queue.Empty:
+            pass
+        self._match_preview_frames.put_nowait(image)
+
+    def refresh_match_preview(self):
+        """Display the newest annotated frame, if any, while the preview is open"""
+        if self.match_preview_window is None:
+            return
+        try:
+            image = self._match_preview_frames.get_nowait()
+            from PIL import ImageTk
+
+            self._match_preview_photo = ImageTk.PhotoImage(image)
+            self.match_preview_label.config(image=self._match_preview_photo, text="")
+        except queue.Empty:
+            pass
+        except Exception as e:
+            self.match_preview_label.config(text=f"Cannot display preview: {str(e)}")
+        self.root.after(200, self.refresh_match_preview)
+
+    def get_engine(self):
+        """Return the in-process execution engine, starting it on first use"""
+        if self.engine is None:
+            self.engine = FalconEngine().start()
+        return self.engine
+
     def stop_execution(self):
         """Stop the currently running process"""
         if self.current_process and self.current_process.poll() is None:
@@ -2449,6 +2741,9 @@ class FalconUIScriptBuilder:
             except:
                 pass
 
+        if self.engine is not None:
+            self.engine.shutdown()
+
         self.root.destroy()
 
 
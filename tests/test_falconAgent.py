@@ -0,0 +1,94 @@
+# Localhost round trips through FalconAgent and FalconAgentPool.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falconAgent import FalconAgent, FalconAgentPool  # noqa: E402
+from falconCommand import AutoGUIController  # noqa: E402
+
+
+def write_scene(directory):
+    """Replayed desktop with a button at (200, 100), the button template and an empty desktop"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(3)
+    frame = rng.integers(0, 60, (400, 640, 3), dtype=np.uint8)
+    button = np.full((40, 90, 3), 230, np.uint8)
+    cv2.rectangle(button, (3, 3), (86, 36), (40, 90, 200), -1)
+    cv2.putText(button, "OK", (28, 29), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    empty = frame.copy()
+    frame[100:140, 200:290] = button
+    paths = {name: os.path.join(directory, f"{name}.png") for name in ("desktop", "button", "empty")}
+    cv2.imwrite(paths["desktop"], frame)
+    cv2.imwrite(paths["button"], button)
+    cv2.imwrite(paths["empty"], empty)
+    return paths
+
+
+class FalconAgentTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from falconCapture import FileReplayScreenSource
+
+        cls.scene = tempfile.TemporaryDirectory()
+        cls.paths = write_scene(cls.scene.name)
+        controller = AutoGUIController()
+        controller.screen_source = FileReplayScreenSource(cls.paths["desktop"])
+        cls.agent = FalconAgent(controller, port=0, token="secret").start()
+        cls.address = cls.agent.address
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agent.shutdown()
+        cls.scene.cleanup()
+
+    def test_ping(self):
+        with FalconAgentPool(token="secret") as pool:
+            self.assertEqual(pool.ping(self.address), self.agent.controller.version)
+
+    def test_wrong_token_rejected(self):
+        with FalconAgentPool(token="wrong") as pool:
+            with self.assertRaises(RuntimeError):
+                pool.ping(self.address)
+
+    def test_two_requests_keep_the_agent_source(self):
+        with FalconAgentPool(token="secret") as pool:
+            for _ in range(2):
+                result = pool.run(self.address, "--image-exists", self.paths["button"])
+                self.assertEqual(result["code"], 0, result["output"])
+                self.assertIn("(245,120)", result["output"])
+
+    def test_request_flags_do_not_leak(self):
+        with FalconAgentPool(token="secret") as pool:
+            # This request replays an empty desktop, the next one is back on the agent's own frames
+            missing = pool.run(self.address, "--replay-frames", self.paths["empty"], "--image-exists", self.paths["button"])
+            self.assertNotIn("(245,120)", missing["output"])
+            found = pool.run(self.address, "--image-exists", self.paths["button"])
+            self.assertEqual(found["code"], 0, found["output"])
+            self.assertIn("(245,120)", found["output"])
+
+    def test_batch_and_broadcast(self):
+        second = FalconAgent(AutoGUIController(), port=0, token="secret").start()
+        second.controller.screen_source = self.agent.controller.screen_source
+        second.screen_source = second.controller.screen_source
+        try:
+            with FalconAgentPool(token="secret") as pool:
+                results = pool.broadcast(
+                    [self.address, second.address],
+                    [["--image-exists", self.paths["button"]], ["--image-exists", self.paths["button"]]],
+                )
+            for address, batch in results.items():
+                self.assertEqual([r["code"] for r in batch], [0, 0], address)
+        finally:
+            second.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+# Capture helpers: frame history ring buffer, monitor selection, shared frames.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falconCapture import (  # noqa: E402
+    FileReplayScreenSource,
+    FrameRingBuffer,
+    MonitorScreenSource,
+    SharedFrameBuffer,
+    attach_shared_frame,
+    load_monitor_layout,
+    select_monitors,
+    shared_frame_valid,
+)
+from falconCommand import AutoGUIController  # noqa: E402
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class FrameRingBufferTest(unittest.TestCase):
+    def capture(self, width=3840, height=2160, value=40):
+        from PIL import Image
+
+        return Image.new("RGB", (width, height), (value, value, value))
+
+    def test_keeps_last_frames_only(self):
+        ring = FrameRingBuffer(capacity=3)
+        entries = [ring.add(self.capture(320, 200), label=str(i)) for i in range(5)]
+        self.assertEqual(len(ring), 3)
+        with ring._lock:
+            kept = list(ring._frames)
+        self.assertEqual([entry["label"] for entry in kept], ["2", "3", "4"])
+        self.assertIs(kept[-1], entries[-1])
+
+    def test_frames_are_downscaled_in_the_background(self):
+        ring = FrameRingBuffer(capacity=4, max_width=960)
+        captures = [self.capture() for _ in range(4)]
+        for capture in captures:
+            ring.add(capture)
+        self.assertTrue(wait_until(lambda: all(entry["scale"] is not None for entry in ring._frames)))
+        for entry in ring._frames:
+            self.assertEqual(entry["image"].size, (960, 540))
+            self.assertEqual(entry["size"], (3840, 2160))
+            self.assertAlmostEqual(entry["scale"], 0.25)
+        # The captures the matcher used are left alone
+        self.assertEqual(captures[0].size, (3840, 2160))
+
+    def test_dump_draws_scaled_rectangles(self):
+        from PIL import Image
+
+        ring = FrameRingBuffer(capacity=2, max_width=960)
+        capture = self.capture()
+        entry = ring.add(capture)
+        ring.annotate(entry, "ok.png", (400, 200, 200, 100), 0.97, True)
+        ring.annotate(entry, "cancel.png", None, None, False)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = ring.dump(directory, reason="Timeout")
+            self.assertEqual(len(paths), 1)
+            with Image.open(paths[0]) as image:
+                self.assertEqual(image.size, (960, 540))
+                # Found matches are drawn in lime at a quarter of their screen position
+                self.assertEqual(image.getpixel((100, 75)), (0, 255, 0))
+                self.assertEqual(image.getpixel((300, 300)), (40, 40, 40))
+            with open(os.path.join(directory, "frames.txt"), encoding="utf-8") as index_file:
+                index = index_file.read()
+        self.assertIn("Reason: Timeout", index)
+        self.assertIn("found ok.png confidence=0.970 rect=(400, 200, 200, 100)", index)
+        self.assertIn("miss  cancel.png confidence=n/a rect=None", index)
+        self.assertEqual(capture.getpixel((400, 300)), (40, 40, 40))
+
+
+
+class MonitorLayoutTest(unittest.TestCase):
+    """Synthetic desktop: a 1.0 primary monitor and a 1.5 one to its right, 100 pixels higher"""
+
+    LAYOUT = [
+        {"left": 400, "top": -100, "width": 320, "height": 240, "scale": 1.5, "primary": False},
+        {"left": 0, "top": 0, "width": 400, "height": 300, "scale": 1.0, "primary": True},
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        import cv2
+        import numpy as np
+
+        cls.directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(7)
+        # Virtual desktop from (0, -100) to (720, 300)
+        desktop = rng.integers(0, 80, (400, 720, 3), dtype=np.uint8)
+        button = np.full((24, 40, 3), 220, np.uint8)
+        cv2.rectangle(button, (2, 2), (37, 21), (30, 120, 210), -1)
+        cv2.line(button, (6, 6), (33, 17), (255, 255, 255), 2)
+        # At screen (500, 20) on the 1.5 monitor
+        scaled = cv2.resize(button, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+        desktop[120:120 + scaled.shape[0], 500:500 + scaled.shape[1]] = scaled
+        cls.paths = {name: os.path.join(cls.directory.name, f"{name}.png") for name in ("desktop", "button")}
+        cv2.imwrite(cls.paths["desktop"], desktop)
+        cv2.imwrite(cls.paths["button"], button)
+        cls.paths["layout"] = os.path.join(cls.directory.name, "layout.json")
+        with open(cls.paths["layout"], "w", encoding="utf-8") as layout_file:
+            json.dump(cls.LAYOUT, layout_file)
+        cls.layout = load_monitor_layout(cls.paths["layout"])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def source(self, spec):
+        return MonitorScreenSource(
+            select_monitors(self.layout, spec), FileReplayScreenSource(self.paths["desktop"]), self.layout
+        )
+
+    def test_layout_is_numbered_primary_first(self):
+        self.assertEqual([(m["index"], m["left"]) for m in self.layout], [(1, 0), (2, 400)])
+
+    def test_select_monitors(self):
+        self.assertEqual([m["index"] for m in select_monitors(self.layout, "primary")], [1])
+        self.assertEqual([m["index"] for m in select_monitors(self.layout, "2")], [2])
+        self.assertEqual([m["index"] for m in select_monitors(self.layout, "2,1,2")], [2, 1])
+        self.assertEqual(len(select_monitors(self.layout, "all")), 2)
+        for spec in ("3", "0", "left"):
+            with self.assertRaises(ValueError):
+                select_monitors(self.layout, spec)
+
+    def test_frames_cover_the_selected_monitors(self):
+        source = self.source("2")
+        self.assertEqual(source.origin, (400, -100))
+        self.assertEqual(source.scales, [1.5])
+        self.assertEqual(source.grab().size, (320, 240))
+        both = self.source("all")
+        self.assertEqual((both.origin, both.scales), ((0, -100), [1.0, 1.5]))
+        frame = both.grab()
+        self.assertEqual(frame.size, (720, 400))
+        # Above the primary monitor is no monitor at all
+        self.assertEqual(frame.getpixel((10, 10)), (0, 0, 0))
+
+    def lookup(self, source, diagnostics=None):
+        controller = AutoGUIController()
+        controller.frame_history = None
+        controller.screen_source = source
+        controller.diagnostics = diagnostics
+        with contextlib.redirect_stdout(io.StringIO()):
+            return controller.locate_image_multi_scale_auto(self.paths["button"])
+
+    def test_matches_are_in_screen_coordinates(self):
+        for spec in ("2", "all"):
+            with self.subTest(monitors=spec):
+                location = self.lookup(self.source(spec))
+                self.assertIsNotNone(location)
+                self.assertEqual((location["left"], location["top"]), (500, 20))
+                self.assertEqual((location["width"], location["height"]), (60, 36))
+
+    def test_monitor_dpi_ratio_is_tried_first(self):
+        from falconMatch import MatchDiagnostics
+
+        with tempfile.TemporaryDirectory() as directory:
+            diagnostics = MatchDiagnostics(os.path.join(directory, "lookups.jsonl"))
+            self.lookup(self.source("2"), diagnostics)
+            with open(diagnostics.path, encoding="utf-8") as diagnostics_file:
+                record = json.loads(diagnostics_file.readline())
+        # Found at the monitor's own ratio without trying the common ones before it
+        self.assertEqual(record["scales"], [1.5])
+
+
+
+class SharedFrameBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.buffer = SharedFrameBuffer((60, 80, 3), slots=2)
+
+    def tearDown(self):
+        import falconCapture
+
+        for attached in falconCapture._attached_frames.values():
+            attached.close()
+        falconCapture._attached_frames.clear()
+        self.buffer.close()
+
+    def frame(self, value, shape=(60, 80, 3)):
+        import numpy as np
+
+        return np.full(shape, value, np.uint8)
+
+    def test_write_and_attach(self):
+        rgb = self.buffer.write(self.frame(7))
+        gray = self.buffer.write(self.frame(9, (30, 40)))
+        self.assertEqual((rgb["generation"], gray["generation"]), (1, 2))
+        view = attach_shared_frame(rgb)
+        self.assertEqual(view.shape, (60, 80, 3))
+        self.assertTrue((view == 7).all())
+        self.assertFalse(view.flags.writeable)
+        self.assertEqual(attach_shared_frame(gray).shape, (30, 40))
+        self.assertTrue(shared_frame_valid(rgb))
+
+    def test_generation_wraps_around_the_slots(self):
+        first = self.buffer.write(self.frame(1))
+        self.assertTrue(self.buffer.valid(first["generation"]))
+        self.buffer.write(self.frame(2))
+        third = self.buffer.write(self.frame(3))
+        # The third frame reused the first one's slot
+        self.assertFalse(self.buffer.valid(first["generation"]))
+        self.assertIsNone(self.buffer.read(first["generation"]))
+        self.assertIsNone(attach_shared_frame(first))
+        self.assertFalse(shared_frame_valid(first))
+        self.assertTrue((attach_shared_frame(third) == 3).all())
+
+    def test_attached_buffer_is_read_only(self):
+        handle = self.buffer.write(self.frame(5))
+        attached = SharedFrameBuffer(name=handle["name"])
+        try:
+            self.assertEqual((attached.slots, attached.slot_size), (2, self.buffer.slot_size))
+            self.assertTrue((attached.read(handle["generation"]) == 5).all())
+            with self.assertRaises(PermissionError):
+                attached.write(self.frame(6))
+        finally:
+            attached.close()
+
+    def test_frame_too_large(self):
+        with self.assertRaises(ValueError):
+            self.buffer.write(self.frame(0, (61, 80, 3)))
+
+
+if __name__ == "__main__":
+    unittest.main()
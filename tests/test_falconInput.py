@@ -0,0 +1,110 @@
+# High-rate input streams, checked with falconInput.FakeInjector.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import importlib.util
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import falconInput  # noqa: E402
+from falconCommand import AutoGUIController, ExecutionCancelled  # noqa: E402
+
+
+class EventStreamTest(unittest.TestCase):
+    def test_click_events(self):
+        batches = falconInput.click_events(10, 20, 3)
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(batches[0][0], (falconInput.MOVE, 10, 20))
+        self.assertEqual(batches[1], [(falconInput.MOUSE_DOWN, "left"), (falconInput.MOUSE_UP, "left")])
+
+    def test_key_events_release_in_reverse_order(self):
+        (batch,) = falconInput.key_events("Ctrl+V", 1)
+        self.assertEqual(batch, [
+            (falconInput.KEY_DOWN, "ctrl"), (falconInput.KEY_DOWN, "v"),
+            (falconInput.KEY_UP, "v"), (falconInput.KEY_UP, "ctrl"),
+        ])
+
+    def test_text_events(self):
+        (batch,) = falconInput.text_events("a\u4e2d\r\n")
+        self.assertEqual(batch, [(falconInput.CHAR, "a"), (falconInput.CHAR, "\u4e2d"), (falconInput.CHAR, "\n")])
+
+
+class RunStreamTest(unittest.TestCase):
+    def test_schedule(self):
+        injector = falconInput.FakeInjector()
+        report = falconInput.run_stream(injector, falconInput.key_events("a", 20), 0.005)
+        self.assertEqual(report["count"], 20)
+        self.assertFalse(report["cancelled"])
+        self.assertEqual(len(injector.events), 40)
+        # 19 intervals of 5 ms, deadlines are absolute
+        self.assertGreaterEqual(injector.events[-1][0] - injector.events[0][0], 0.095 - 0.002)
+
+    def test_sub_millisecond_interval_merges_batches(self):
+        injector = falconInput.FakeInjector()
+        report = falconInput.run_stream(injector, falconInput.click_events(None, None, 10), 0.0002)
+        self.assertEqual(report["batch_size"], 5)
+        self.assertEqual(report["count"], 10)
+        self.assertEqual(len(injector.events), 20)
+
+    def test_cancel_stops_the_stream(self):
+        injector = falconInput.FakeInjector()
+        cancel_event = threading.Event()
+        threading.Timer(0.1, cancel_event.set).start()
+        start = time.perf_counter()
+        report = falconInput.run_stream(injector, falconInput.key_events("a", 1000), 0.01, cancel_event)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(report["cancelled"])
+        self.assertLess(report["count"], 1000)
+        # Whole keystrokes only: every key down has its key up
+        self.assertEqual(len(injector.events), 2 * report["count"])
+
+    def test_already_cancelled(self):
+        injector = falconInput.FakeInjector()
+        cancel_event = threading.Event()
+        cancel_event.set()
+        report = falconInput.run_stream(injector, falconInput.key_events("a", 5), 0.01, cancel_event)
+        self.assertTrue(report["cancelled"])
+        self.assertEqual(injector.events, [])
+
+
+class ControllerStreamTest(unittest.TestCase):
+    def test_cancel_event_stops_fast_press(self):
+        controller = AutoGUIController()
+        controller.input_injector = falconInput.FakeInjector()
+        threading.Timer(0.1, controller.cancel_event.set).start()
+        start = time.perf_counter()
+        with self.assertRaises(ExecutionCancelled):
+            controller.fast_press("a", 1000, 0.01)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertLess(len(controller.input_injector.events), 2000)
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyautogui"), "pyautogui is not installed")
+class ControllerBatchTest(unittest.TestCase):
+    def test_type_events_do_not_use_the_clipboard(self):
+        controller = AutoGUIController()
+        controller.input_injector = falconInput.FakeInjector()
+        events = controller.parse_batch_events(["type", "ab", ";", "type", "\u4e2d\\n"])
+        controller.execute_batch(events)
+        typed = "".join(event[1] for _, event in controller.input_injector.events)
+        self.assertEqual(typed, "ab\u4e2d\n")
+
+    def test_cancel_event_stops_the_gap(self):
+        controller = AutoGUIController()
+        controller.input_injector = falconInput.FakeInjector()
+        events = controller.parse_batch_events(["type", "a", ";", "type", "b"])
+        threading.Timer(0.1, controller.cancel_event.set).start()
+        start = time.perf_counter()
+        with self.assertRaises(ExecutionCancelled):
+            controller.execute_batch(events, gap=10.0)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual([event for _, event in controller.input_injector.events], [(falconInput.CHAR, "a")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# Template packs: building, loading and rebuilding while a pack is mapped.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import falconMatch  # noqa: E402
+import falconPack  # noqa: E402
+
+
+def write_image(path, value, alpha=False):
+    import cv2
+    import numpy as np
+
+    image = np.full((30, 50, 4 if alpha else 3), value, np.uint8)
+    cv2.rectangle(image, (5, 5), (40, 20), (255, 255 - value, value, 255), -1)
+    if alpha:
+        image[:, :10, 3] = 0
+    cv2.imwrite(str(path), image)
+
+
+class TemplatePackTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.root = Path(self.folder.name)
+        (self.root / "dialogs").mkdir()
+        write_image(self.root / "ok.png", 60)
+        write_image(self.root / "dialogs" / "cancel.png", 120, alpha=True)
+        falconMatch._template_cache.clear()
+
+    def tearDown(self):
+        with falconPack._packs_lock:
+            for pack in falconPack._packs.values():
+                if pack is not None:
+                    pack.close()
+            falconPack._packs.clear()
+        falconMatch._template_cache.clear()
+        self.folder.cleanup()
+
+    def build(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = falconPack.build_pack(self.root)
+        return result, output.getvalue()
+
+    def test_packed_templates_match_decoded_ones(self):
+        (path, count, size), _ = self.build()
+        self.assertEqual((path, count), (self.root / falconPack.PACK_NAME, 2))
+        self.assertEqual(size, path.stat().st_size)
+        for name in ("ok.png", "dialogs/cancel.png"):
+            with self.subTest(name=name):
+                loaded = falconMatch.load_template(self.root / name)
+                decoded = falconMatch.decode_template(self.root / name)
+                self.assertIn("pyramid", loaded)
+                for key in ("gray", "color"):
+                    self.assertTrue((loaded[key] == decoded[key]).all())
+                if decoded["mask"] is None:
+                    self.assertIsNone(loaded["mask"])
+                else:
+                    self.assertTrue((loaded["mask"] == decoded["mask"]).all())
+                self.assertTrue((falconMatch.resize_template(loaded, 1.5) == falconMatch.resize_template(decoded, 1.5)).all())
+
+    def test_changed_image_is_not_served_stale(self):
+        self.build()
+        image_path = self.root / "ok.png"
+        write_image(image_path, 200)
+        stat = image_path.stat()
+        os.utime(image_path, (stat.st_atime, stat.st_mtime + 10))
+        loaded = falconMatch.load_template(image_path)
+        self.assertNotIn("pyramid", loaded)
+        self.assertTrue((loaded["color"] == falconMatch.decode_template(image_path)["color"]).all())
+
+    def test_rebuild_while_loaded(self):
+        self.build()
+        self.assertIn("pyramid", falconMatch.load_template(self.root / "ok.png"))
+        old_pack = falconPack._packs[self.root]
+        write_image(self.root / "new.png", 90)
+        (_, count, _), output = self.build()
+        self.assertEqual(count, 3)
+        self.assertEqual(output, "")
+        # The old mapping is closed and nothing decoded from it is left in the cache
+        self.assertTrue(old_pack._map.closed)
+        self.assertNotIn(self.root, falconPack._packs)
+        self.assertEqual(falconMatch._template_cache, {})
+        self.assertIn("pyramid", falconMatch.load_template(self.root / "new.png"))
+        self.assertIsNot(falconPack._packs[self.root], old_pack)
+
+    def test_rebuild_while_arrays_are_referenced(self):
+        self.build()
+        held = falconMatch.load_template(self.root / "ok.png")
+        (_, count, _), output = self.build()
+        self.assertEqual(count, 2)
+        self.assertIn("[Warning]", output)
+        # The arrays stay readable, the new pack is opened for the next lookup
+        self.assertTrue((held["gray"] == falconMatch.decode_template(self.root / "ok.png")["gray"]).all())
+        self.assertIn("pyramid", falconMatch.load_template(self.root / "ok.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# Match pool: whole lookups on the template's worker and ratio scans over all workers.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import falconBench  # noqa: E402
+from falconCommand import AutoGUIController  # noqa: E402
+
+
+def new_frame(path):
+    from PIL import Image
+
+    return {"image": Image.open(path).convert("RGB"), "time": 0.0, "arrays": {}, "matches": {},
+            "origin": (0, 0), "scales": None}
+
+
+class MatchPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = tempfile.TemporaryDirectory()
+        falconBench._generate_scale_corpus(cls.corpus.name, 3)
+        cls.cases = [
+            (os.path.join(cls.corpus.name, f"case{case}.frame.png"),
+             os.path.join(cls.corpus.name, f"case{case}.template.png"))
+            for case in range(3)
+        ]
+        cls.controller = AutoGUIController()
+        cls.controller.frame_history = None
+        cls.expected = [cls.lookup(frame_path, template_path) for frame_path, template_path in cls.cases]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.set_match_workers(0)
+        if cls.controller.shared_frames is not None:
+            cls.controller.shared_frames.close()
+        cls.corpus.cleanup()
+
+    @classmethod
+    def lookup(cls, frame_path, template_path):
+        cls.controller._last_hits.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return cls.controller._lookup_in_frame(new_frame(frame_path), template_path, (0.3, 3.5), 0.9, True)
+
+    def test_affinity_is_stable(self):
+        self.controller.set_match_workers(2)
+        pool = self.controller.match_pool
+        for _, template_path in self.cases:
+            self.assertEqual(pool.worker_for(template_path), pool.worker_for(os.path.abspath(template_path)))
+            self.assertIn(pool.worker_for(template_path), range(2))
+
+    def test_submit_returns_futures_in_flight_together(self):
+        self.controller.set_match_workers(2)
+        frame = new_frame(self.cases[0][0])
+        futures = [
+            self.controller.submit_lookup(frame, template_path, (0.3, 3.5), 0.9, True)
+            for _, template_path in self.cases
+        ]
+        self.assertTrue(all(isinstance(future, Future) for future in futures))
+        results = [future.result() for future in futures]
+        self.assertFalse(any(result["stale"] for result in results))
+        self.assertEqual(results[0]["location"], self.expected[0])
+        self.assertIn("Match found", results[0]["output"])
+
+    def test_lookups_match_in_process_results(self):
+        for split in (False, True):
+            self.controller.set_match_workers(2, split)
+            with self.subTest(split=split):
+                got = [self.lookup(frame_path, template_path) for frame_path, template_path in self.cases]
+                self.assertEqual(got, self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
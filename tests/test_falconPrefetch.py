@@ -0,0 +1,86 @@
+# Lookups of the next command file command started ahead of time.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falconCommand import AutoGUIController, ExecutionCancelled  # noqa: E402
+
+
+def new_frame():
+    from PIL import Image
+
+    return {"image": Image.new("RGB", (64, 48), (90, 90, 90)), "time": 0.0, "arrays": {}, "matches": {},
+            "origin": (0, 0), "scales": None}
+
+
+class TakePrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = AutoGUIController()
+        self.frame = new_frame()
+        self.lookup = ("ok.png", (0.3, 3.5), 0.9, True, None, "template")
+
+    def running_prefetch(self, delay):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        result = {"gray": self.controller.frame_array(self.frame, grayscale=True), "location": None,
+                  "best_miss": None, "output": ""}
+        threading.Timer(delay, future.set_result, (result,)).start()
+        self.controller._prefetch = {"key": self.lookup, "future": future}
+        return result
+
+    def test_waits_for_a_running_prefetch(self):
+        result = self.running_prefetch(0.1)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertIs(self.controller._take_prefetch(self.frame, self.lookup), result)
+        self.assertIn("Using the lookup started before this command", output.getvalue())
+
+    def test_wait_is_bounded(self):
+        self.controller.PREFETCH_WAIT = 0.05
+        self.running_prefetch(0.5)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(self.controller._take_prefetch(self.frame, self.lookup))
+
+    def test_wait_is_cancellable(self):
+        self.running_prefetch(0.5)
+        threading.Timer(0.05, self.controller.cancel_event.set).start()
+        with self.assertRaises(ExecutionCancelled):
+            self.controller._take_prefetch(self.frame, self.lookup)
+
+    def test_other_lookup_is_dropped(self):
+        self.running_prefetch(0.0)
+        other = ("ok.png", (0.3, 3.5), 0.9, True, 20.0, "template")
+        self.assertIsNone(self.controller._take_prefetch(self.frame, other))
+        self.assertIsNone(self.controller._prefetch)
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyautogui"), "pyautogui is not installed")
+class CommandLookupTest(unittest.TestCase):
+    def test_key_is_the_command_lookup(self):
+        from falconCapture import FileReplayScreenSource
+
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, "frame.png")
+            new_frame()["image"].save(image_path)
+            for cmd in (["--search-image", image_path], ["--image-exists", image_path, "--match-color", "20"]):
+                with self.subTest(cmd=cmd[0]):
+                    controller = AutoGUIController()
+                    controller.screen_source = FileReplayScreenSource(image_path)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        controller.run(list(cmd))
+                    (key,) = controller._frame_cache["matches"]
+                    self.assertEqual(key, controller._command_lookup(cmd[0], controller.parser.parse_args(cmd)))
+
+
+if __name__ == "__main__":
+    unittest.main()
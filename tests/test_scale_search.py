@@ -0,0 +1,56 @@
+# Equivalence of the multi-scale lookup with an exhaustive ratio sweep.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import falconBench  # noqa: E402
+
+# Upper bound of reduced resolution matchTemplate calls per lookup over 0.3-3.5
+COARSE_CALL_BUDGET = 24
+
+
+class ScaleSearchEquivalenceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from falconCommand import AutoGUIController
+
+        cls.corpus = tempfile.TemporaryDirectory()
+        # Three widgets pasted at ratios between the common ones, one frame without it
+        falconBench._generate_scale_corpus(cls.corpus.name, 4)
+        cls.controller = AutoGUIController()
+        cls.cases = {}
+        for case in range(4):
+            frame_path = os.path.join(cls.corpus.name, f"case{case}.frame.png")
+            template_path = os.path.join(cls.corpus.name, f"case{case}.template.png")
+            cls.cases[case] = falconBench.compare_scale_search(cls.controller, frame_path, template_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.cleanup()
+
+    def test_same_match_as_sweep(self):
+        for case, result in self.cases.items():
+            with self.subTest(case=case):
+                self.assertTrue(result["agree"], f"lookup {result['location']} vs sweep {result['reference']}")
+
+    def test_widgets_found_and_missing_one_reported(self):
+        for case in range(3):
+            self.assertIsNotNone(self.cases[case]["location"])
+        self.assertIsNone(self.cases[3]["location"])
+
+    def test_coarse_scan_budget(self):
+        for case, result in self.cases.items():
+            with self.subTest(case=case):
+                self.assertLessEqual(result["calls"]["coarse"], COARSE_CALL_BUDGET)
+                # The full resolution sweep is what the coarse scan replaces
+                self.assertLess(sum(result["calls"].values()), result["sweep_calls"] / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# Tiled matching (falconMatch.TiledFrame) against whole-frame cv2.matchTemplate.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falconMatch import TiledFrame, match_template  # noqa: E402
+
+# Largest score difference accepted: tiles see the same pixels, only the float
+# accumulation order of the integral images differs
+TOLERANCE = 1e-4
+
+
+class TiledFrameTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import cv2
+        import numpy as np
+
+        rng = np.random.default_rng(11)
+        # Smooth content with flat areas, like a desktop, and a widget cut from it
+        noise = rng.integers(0, 256, (75, 90, 3), dtype=np.uint8)
+        cls.rgb = cv2.resize(noise, (900, 750), interpolation=cv2.INTER_CUBIC)
+        cls.rgb[500:620, 100:400] = 200
+        cls.gray = cv2.cvtColor(cls.rgb, cv2.COLOR_RGB2GRAY)
+        cls.template_rgb = cls.rgb[300:340, 410:470].copy()
+        cls.template_gray = cls.gray[300:340, 410:470].copy()
+        # Rounded corners made transparent, given at twice the template size
+        mask = np.full((80, 120), 255, np.uint8)
+        mask[:16, :16] = mask[:16, -16:] = mask[-16:, :16] = mask[-16:, -16:] = 0
+        cls.mask = mask
+
+    def assert_same_map(self, tiled, expected):
+        import numpy as np
+
+        self.assertEqual(tiled.shape, expected.shape)
+        self.assertLess(float(np.abs(tiled - expected).max()), TOLERANCE)
+
+    def test_same_scores_as_whole_frame(self):
+        for name, image, template in (("gray", self.gray, self.template_gray), ("rgb", self.rgb, self.template_rgb)):
+            for mask in (None, self.mask):
+                for workers in (1, 3):
+                    with self.subTest(image=name, mask=mask is not None, workers=workers):
+                        expected = match_template(image, template, mask)
+                        tiled = TiledFrame(image, tile_size=128, workers=workers).match(template, mask)
+                        self.assert_same_map(tiled, expected)
+
+    def test_tiles_cover_the_result_map(self):
+        frame = TiledFrame(self.gray, tile_size=128)
+        covered = sum((bottom - top) * (right - left) for top, left, bottom, right in frame.tiles((40, 60)))
+        self.assertEqual(covered, (750 - 40 + 1) * (900 - 60 + 1))
+
+    def test_buffer_is_reused(self):
+        import numpy as np
+
+        buffer = np.empty(900 * 750, np.float32)
+        frame = TiledFrame(self.gray, tile_size=200, buffer=buffer)
+        small = frame.match(self.template_gray[:20, :30])
+        self.assertTrue(np.shares_memory(small, buffer))
+        self.assert_same_map(small.copy(), match_template(self.gray, self.template_gray[:20, :30]))
+        # The next match overwrites the same memory
+        result = frame.match(self.template_gray, self.mask)
+        self.assertTrue(np.shares_memory(result, buffer))
+        self.assert_same_map(result, match_template(self.gray, self.template_gray, self.mask))
+        self.assertEqual(np.unravel_index(int(np.argmax(result)), result.shape), (300, 410))
+
+    def test_template_larger_than_frame(self):
+        frame = TiledFrame(self.gray[:30, :50])
+        self.assertEqual(frame.tiles((40, 60)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()